@@ -1,8 +1,10 @@
 from flask import Flask, render_template
 from config import Config
-from models import db, User
+from models import db
 from flask_login import LoginManager
 from routes import init_app
+from services import ledger, changes, rollup, cache, gridsync, pubsub, metrics, usercache, replica
+import cli
 
 
 def create_app():
@@ -10,6 +12,15 @@ def create_app():
     app.config.from_object(Config)
 
     db.init_app(app)
+    ledger.init_app(app)
+    changes.init_app(app)
+    rollup.init_app(app)
+    cache.init_app(app)
+    gridsync.init_app(app)
+    pubsub.init_app(app)
+    metrics.init_app(app)
+    usercache.init_app(app)
+    replica.init_app(app)
 
     login_manager = LoginManager()
     login_manager.init_app(app)
@@ -18,15 +29,16 @@ def create_app():
 
     @login_manager.user_loader
     def load_user(user_id):
-        try:
-            return db.session.get(User, int(user_id))
-        except Exception:
-            return None
+        # снимок пользователя из сессии или кэша; в БД — только при промахе
+        return usercache.load(user_id)
 
     # Регистрируем блюпринты
     init_app(app)
     print(f"Registered Blueprints: {list(app.blueprints.keys())}")
 
+    # CLI-команды (flask schema ...)
+    cli.init_app(app)
+
     @app.route('/')
     def index():
         return render_template('index.html')
@@ -0,0 +1,131 @@
+# app/bench/loadtest.py
+"""
+Нагрузочный прогон шахматки и отчётов.
+
+Логинится, затем N потоков в течение заданного времени запрашивают каждую
+страницу по очереди; печатает запросы в секунду и перцентили времени ответа.
+Несколько --url сравниваются в одной таблице — например, встроенный сервер
+разработки против gunicorn с разными пресетами:
+
+    python app.py                                               # :5000
+    GUNICORN_PRESET=threads gunicorn -c gunicorn.conf.py wsgi:app   # :8000
+    python bench/loadtest.py --url http://localhost:5000 --url http://localhost:8000 \\
+        --user admin --password admin --concurrency 16 --duration 20
+"""
+import argparse
+import http.client
+import http.cookiejar
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import date
+
+
+def default_paths():
+    year = date.today().year
+    period = f"start={year}-01-01&end={year}-12-31"
+    return {
+        "шахматка": "/workspace/",
+        "шахматка, прошлый год": "/workspace/?year_offset=-1",
+        "шахматка JSON": f"/workspace/grid.json?year={year}",
+        "отчёт: финансы": f"/reports/view?type=finance&{period}",
+        "отчёт: сводка": f"/reports/view?type=summary&{period}",
+        "выгрузка: платежи CSV": f"/reports/export?type=payments&format=csv&{period}",
+    }
+
+
+def login(base, user, password):
+    jar = http.cookiejar.CookieJar()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+    data = urllib.parse.urlencode({"username": user, "password": password}).encode()
+    opener.open(base + "/auth/login", data=data, timeout=30).read()
+
+    # без входа страницы отвечают редиректом на логин — это не нагрузка
+    with opener.open(base + "/workspace/grid.json", timeout=30) as check:
+        landed = check.geturl()
+    if "/auth/login" in landed:
+        raise SystemExit(f"{base}: не удалось войти как {user}")
+    return opener
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def run_path(opener, url, concurrency, duration):
+    timings, errors = [], [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        local, failed = [], 0
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                with opener.open(url, timeout=60) as response:
+                    while response.read(65536):
+                        pass
+                local.append(time.perf_counter() - started)
+            except (urllib.error.URLError, http.client.HTTPException, OSError):
+                failed += 1
+        with lock:
+            timings.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        "rps": len(timings) / elapsed,
+        "p50": percentile(timings, 0.50) * 1000,
+        "p95": percentile(timings, 0.95) * 1000,
+        "errors": errors[0],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', action='append', required=True, help='адрес сервера; можно несколько')
+    parser.add_argument('--user', required=True)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10, help='секунд на страницу')
+    parser.add_argument('--path', action='append', help='свои страницы вместо набора по умолчанию')
+    args = parser.parse_args()
+
+    paths = {p: p for p in args.path} if args.path else default_paths()
+    results = {}
+
+    for base in args.url:
+        base = base.rstrip('/')
+        opener = login(base, args.user, args.password)
+        for name, path in paths.items():
+            # прогрев: первый запрос заполняет кэши и пул соединений
+            opener.open(base + path, timeout=60).read()
+            results[base, name] = run_path(opener, base + path, args.concurrency, args.duration)
+            r = results[base, name]
+            print(f"{base:<28} {name:<26} {r['rps']:>8.1f} rps  "
+                  f"p50 {r['p50']:>7.1f} ms  p95 {r['p95']:>7.1f} ms  ошибок {r['errors']}")
+
+    if len(args.url) > 1:
+        first = args.url[0].rstrip('/')
+        print(f"\nОтносительно {first}:")
+        for base in args.url[1:]:
+            base = base.rstrip('/')
+            for name in paths:
+                ratio = results[base, name]["rps"] / (results[first, name]["rps"] or 1)
+                print(f"  {base:<28} {name:<26} ×{ratio:.2f}")
+
+
+if __name__ == '__main__':
+    main()
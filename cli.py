@@ -0,0 +1,310 @@
+# app/cli.py
+from datetime import date, datetime
+
+import click
+from flask.cli import AppGroup, with_appcontext
+from models import db, User, ArchivedPeriod, AccrualRun, ReportJob
+import migrations
+from services.querycount import query_budget, QueryBudgetExceeded
+from services import ledger, rollup, importer, gridsync, passwords, archive, analytics, accruals, jobs, replica
+
+schema_cli = AppGroup('schema', help='Версионные миграции схемы БД.')
+
+
+@schema_cli.command('upgrade')
+@click.option('--target', type=int, default=None, help='Версия, до которой обновить.')
+def schema_upgrade(target):
+    """Применить новые миграции"""
+    if not db.inspect(db.engine).has_table('booking'):
+        # пустая БД: схема создаётся по моделям и уже содержит все миграции
+        db.create_all()
+        migrations.stamp(db.engine)
+        click.echo("Схема создана по моделям")
+
+    migrations.upgrade(db.engine, target=target, echo=click.echo)
+    click.echo(f"Текущая версия схемы: {migrations.current_version(db.engine)}")
+
+
+@schema_cli.command('downgrade')
+@click.argument('target', type=int)
+def schema_downgrade(target):
+    """Откатить миграции новее TARGET"""
+    migrations.downgrade(db.engine, target, echo=click.echo)
+    click.echo(f"Текущая версия схемы: {migrations.current_version(db.engine)}")
+
+
+@schema_cli.command('version')
+def schema_version():
+    """Показать текущую версию схемы"""
+    click.echo(migrations.current_version(db.engine))
+
+
+reports_cli = AppGroup('reports', help='Отчёты.')
+
+
+@reports_cli.command('check-budget')
+@click.option('--start', default='2000-01-01', help='Начало периода (YYYY-MM-DD).')
+@click.option('--end', default=None, help='Конец периода (YYYY-MM-DD), по умолчанию сегодня.')
+@click.option('--parking-id', type=int, default=None)
+def reports_check_budget(start, end, parking_id):
+    """Построить все отчёты и проверить число запросов к БД"""
+    from routes import reports
+
+    start_date = datetime.strptime(start, '%Y-%m-%d')
+    end_date = datetime.strptime(end, '%Y-%m-%d') if end else datetime.combine(date.today(), datetime.min.time())
+    builders = dict(reports.BUILDERS)
+    if not analytics.available():
+        del builders['analytics']
+
+    failed = False
+    for report_type, builder in builders.items():
+        limit = reports.QUERY_BUDGETS[report_type]
+        try:
+            with query_budget(db.engine, limit, label=report_type) as counter:
+                data = builder(start_date, end_date, parking_id)
+            click.echo(f"{report_type}: {counter.count}/{limit} запросов, строк: {len(data['rows'])}")
+        except QueryBudgetExceeded as e:
+            failed = True
+            click.echo(str(e), err=True)
+
+    if failed:
+        raise SystemExit(1)
+
+
+ledger_cli = AppGroup('ledger', help='Леджер оплат по броням.')
+
+
+@ledger_cli.command('rebuild')
+@click.option('--verify-only', is_flag=True, help='Только сверить, ничего не менять.')
+@click.option('--show', type=int, default=20, help='Сколько расхождений вывести.')
+def ledger_rebuild(verify_only, show):
+    """Сверить леджер с платежами и пересчитать его для всех броней"""
+    with db.engine.connect() as conn:
+        diff = ledger.mismatches(conn)
+
+    click.echo(f"Расхождений: {len(diff)}")
+    for booking_id, stored, actual in diff[:show]:
+        click.echo(f"  бронь {booking_id}: в леджере {stored}, по платежам {actual}")
+
+    if verify_only:
+        if diff:
+            raise SystemExit(1)
+        return
+
+    with db.engine.begin() as conn:
+        total = ledger.rebuild(conn)
+        left = len(ledger.mismatches(conn))
+
+    click.echo(f"Пересчитано броней: {total}, расхождений после пересчёта: {left}")
+    if left:
+        raise SystemExit(1)
+
+
+rollup_cli = AppGroup('rollup', help='Помесячная свёртка по парковкам.')
+
+
+@rollup_cli.command('rebuild')
+@click.option('--from-year', type=int, default=None)
+@click.option('--to-year', type=int, default=None)
+def rollup_rebuild(from_year, to_year):
+    """Пересчитать свёртку за период (по умолчанию — за все годы броней)"""
+    with db.engine.begin() as conn:
+        months = rollup.rebuild(conn, from_year, to_year)
+    click.echo(f"Пересчитано месяцев: {months}")
+
+
+grid_cli = AppGroup('grid', help='Шахматка.')
+
+
+@grid_cli.command('prune-log')
+@click.option('--keep-days', type=int, default=7, show_default=True)
+def grid_prune_log(keep_days):
+    """Удалить старые записи журнала изменений (клиенты со старой версией получат полную сетку)"""
+    with db.engine.begin() as conn:
+        removed = gridsync.prune(conn, keep_days)
+    click.echo(f"Удалено записей журнала: {removed}")
+
+
+users_cli = AppGroup('users', help='Пользователи.')
+
+
+@users_cli.command('hash-passwords')
+def users_hash_passwords():
+    """Захэшировать пароли, ещё хранящиеся открытым текстом (остальные перехэшируются при входе)"""
+    users = [u for u in User.query.all() if not passwords.is_hashed(u.password)]
+    for user in users:
+        user.password = passwords.hash_password(user.password)
+    db.session.commit()
+    click.echo(f"Захэшировано паролей: {len(users)}")
+
+
+archive_cli = AppGroup('archive', help='Архив закрытых лет.')
+
+
+@archive_cli.command('close-year')
+@click.argument('year', type=int)
+def archive_close_year(year):
+    """Перенести брони, платежи и расходы по YEAR включительно в архив"""
+    try:
+        with db.engine.begin() as conn:
+            moved = archive.close_year(conn, year)
+    except archive.ArchiveError as e:
+        raise click.ClickException(str(e))
+
+    click.echo(f"Год {year} закрыт. Перенесено: броней {moved['booking_archive']}, "
+               f"платежей {moved['payment_archive']}, расходов {moved['expense_archive']}")
+
+
+@archive_cli.command('status')
+def archive_status():
+    """Закрытые годы и число строк в архиве по каждому"""
+    periods = ArchivedPeriod.query.order_by(ArchivedPeriod.year).all()
+    if not periods:
+        click.echo("Архив пуст")
+        return
+    for p in periods:
+        click.echo(f"{p.year}: броней {p.bookings}, платежей {p.payments}, расходов {p.expenses}"
+                   f" (закрыт {p.closed_at:%d.%m.%Y %H:%M})")
+
+
+accruals_cli = AppGroup('accruals', help='Помесячные начисления.')
+
+
+def _parse_month(value):
+    try:
+        parsed = datetime.strptime(value, '%Y-%m')
+    except ValueError:
+        raise click.BadParameter(f"ожидается ГГГГ-ММ: {value}")
+    return parsed.year, parsed.month
+
+
+@accruals_cli.command('run')
+@click.option('--from', 'first', default=None, help='Первый месяц (ГГГГ-ММ), по умолчанию прошлый.')
+@click.option('--to', 'last', default=None, help='Последний месяц (ГГГГ-ММ), по умолчанию равен --from.')
+@click.option('--refresh', is_flag=True, help='Пересчитать уже закрытые месяцы.')
+def accruals_run(first, last, refresh):
+    """Начислить аренду и коммунальные за месяцы (закрытые пропускаются)"""
+    first = _parse_month(first) if first else accruals.previous_month()
+    last = _parse_month(last) if last else first
+    if last < first:
+        raise click.BadParameter("--to раньше --from")
+
+    closed = accruals.close_months(db.engine, first, last, refresh=refresh, echo=click.echo)
+    click.echo(f"Закрыто месяцев: {len(closed)}, начислений: {sum(closed.values())}")
+
+
+@accruals_cli.command('status')
+@click.option('--last', type=int, default=12, show_default=True, help='Сколько последних месяцев показать.')
+def accruals_status(last):
+    """Закрытые месяцы начислений"""
+    runs = AccrualRun.query.order_by(AccrualRun.year.desc(), AccrualRun.month.desc()).limit(last).all()
+    if not runs:
+        click.echo("Начислений ещё не было")
+        return
+    for run in reversed(runs):
+        finished = f"{run.finished_at:%d.%m.%Y %H:%M}" if run.finished_at else "—"
+        click.echo(f"{run.month:02d}.{run.year}: {run.status}, начислений {run.row_count} ({finished})")
+
+
+jobs_cli = AppGroup('jobs', help='Фоновые отчёты.')
+
+
+@jobs_cli.command('list')
+@click.option('--last', type=int, default=20, show_default=True, help='Сколько последних заданий показать.')
+def jobs_list(last):
+    """Последние задания фоновых отчётов"""
+    rows = ReportJob.query.order_by(ReportJob.job_id.desc()).limit(last).all()
+    if not rows:
+        click.echo("Заданий нет")
+        return
+    for job in reversed(rows):
+        size = f", {len(job.result) // 1024} КБ" if job.result else ""
+        click.echo(f"{job.job_id}: {job.report_type} {job.start_date:%d.%m.%Y}–{job.end_date:%d.%m.%Y}"
+                   f" парковка {job.parking_id or 'все'} — {job.status} {job.progress}%"
+                   f", строк {job.row_count or 0}{size}")
+
+
+@jobs_cli.command('prune')
+@click.option('--keep-days', type=int, default=7, show_default=True)
+def jobs_prune(keep_days):
+    """Удалить старые задания и результаты по изменившимся данным"""
+    with db.engine.begin() as conn:
+        removed = jobs.prune(conn, keep_days)
+    click.echo(f"Удалено заданий: {removed}")
+
+
+replica_cli = AppGroup('replica', help='Реплика для чтения (DATABASE_REPLICA_URL).')
+
+
+def _replica_engine():
+    if not replica.enabled():
+        raise click.ClickException("Реплика не настроена: задайте DATABASE_REPLICA_URL")
+    return db.engines[replica.REPLICA]
+
+
+@replica_cli.command('status')
+def replica_status():
+    """Версии данных в основной БД и на реплике"""
+    engine = _replica_engine()
+    with db.engine.connect() as conn:
+        main_version = jobs.data_version(conn)
+    with engine.connect() as conn:
+        replica_version = jobs.data_version(conn)
+
+    click.echo(f"основная БД: {main_version}")
+    click.echo(f"реплика:     {replica_version}")
+    lag = int(main_version.split(':')[0]) - int(replica_version.split(':')[0])
+    click.echo("Реплика догнала основную БД" if main_version == replica_version
+               else f"Реплика отстаёт: изменений шахматки {lag}")
+
+
+@replica_cli.command('sync')
+def replica_sync():
+    """Скопировать основную БД в реплику — только SQLite, для проверки на двух файлах"""
+    engine = _replica_engine()
+    if db.engine.dialect.name != 'sqlite' or engine.dialect.name != 'sqlite':
+        raise click.ClickException("sync — только для двух файлов SQLite; "
+                                   "реплику Postgres наполняет потоковая репликация")
+
+    engine.dispose()
+    with db.engine.connect() as source, engine.connect() as target:
+        source.connection.driver_connection.backup(target.connection.driver_connection)
+    engine.dispose()
+    click.echo(f"Реплика обновлена: {engine.url.database}")
+
+
+@click.command('import')
+@with_appcontext
+@click.argument('kind', type=click.Choice(importer.KINDS))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--chunk-size', type=int, default=1000, show_default=True)
+@click.option('--show-errors', type=int, default=50, help='Сколько ошибок вывести.')
+def import_csv(kind, path, chunk_size, show_errors):
+    """Массовый импорт CSV: clients, spots или bookings"""
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        report = importer.run(kind, f, chunk_size=chunk_size)
+
+    for line, message in report.errors[:show_errors]:
+        click.echo(f"  строка {line}: {message}", err=True)
+    if len(report.errors) > show_errors:
+        click.echo(f"  ... и ещё {len(report.errors) - show_errors}", err=True)
+
+    click.echo(
+        f"Строк: {report.rows}, импортировано: {report.inserted}, ошибок: {len(report.errors)}, "
+        f"{report.elapsed:.1f} с ({report.rows_per_second:.0f} строк/с)"
+    )
+
+
+def init_app(app):
+    """Регистрация CLI-команд приложения"""
+    app.cli.add_command(schema_cli)
+    app.cli.add_command(reports_cli)
+    app.cli.add_command(ledger_cli)
+    app.cli.add_command(rollup_cli)
+    app.cli.add_command(import_csv)
+    app.cli.add_command(grid_cli)
+    app.cli.add_command(users_cli)
+    app.cli.add_command(archive_cli)
+    app.cli.add_command(accruals_cli)
+    app.cli.add_command(jobs_cli)
+    app.cli.add_command(replica_cli)
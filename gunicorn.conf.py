@@ -0,0 +1,109 @@
+# app/gunicorn.conf.py
+"""
+Настройки gunicorn. Пресет выбирается переменной GUNICORN_PRESET:
+
+  sync    — процессы без потоков; простой и предсказуемый вариант,
+            но открытая вкладка с живой шахматкой (/workspace/stream)
+            занимает воркер целиком;
+  threads — процессы с потоками (gthread); потоки делят пул соединений
+            процесса, поэтому DB_POOL_SIZE + DB_MAX_OVERFLOW >= GUNICORN_THREADS;
+  gevent  — гринлеты (пакет gevent, желательно и psycogreen):
+            сотни простаивающих SSE-соединений на процесс.
+
+Рассылка изменений шахматки (GRID_PUSH_BACKEND, services/pubsub.py)
+возможна только с gevent, а бэкенд memory — только с одним воркером;
+иначе on_starting выключает её, и страницы сверяются опросом.
+
+Метрики (/metrics, services/metrics.py) при нескольких воркерах
+суммируются через каталог METRICS_DIR; если он не задан, on_starting
+создаёт временный. Старые снимки в нём при запуске удаляются.
+
+Любой параметр пресета можно переопределить: GUNICORN_WORKERS,
+GUNICORN_THREADS, GUNICORN_CONNECTIONS, GUNICORN_TIMEOUT, PORT.
+
+    GUNICORN_PRESET=gevent gunicorn -c gunicorn.conf.py wsgi:app
+"""
+import glob
+import multiprocessing
+import os
+import tempfile
+
+cpus = multiprocessing.cpu_count()
+
+PRESETS = {
+    'sync': {'worker_class': 'sync', 'workers': 2 * cpus + 1, 'threads': 1},
+    'threads': {'worker_class': 'gthread', 'workers': cpus + 1, 'threads': 4},
+    'gevent': {'worker_class': 'gevent', 'workers': cpus, 'threads': 1},
+}
+
+preset = PRESETS[os.environ.get('GUNICORN_PRESET', 'threads')]
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+worker_class = preset['worker_class']
+workers = int(os.environ.get('GUNICORN_WORKERS', preset['workers']))
+threads = int(os.environ.get('GUNICORN_THREADS', preset['threads']))
+worker_connections = int(os.environ.get('GUNICORN_CONNECTIONS', 1000))
+
+# выгрузки отчётов идут потоком и могут длиться дольше обычного запроса
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+
+# воркер перезапускается после N запросов (со случайным разбросом) —
+# так не копится фрагментация памяти
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = max_requests // 10
+
+accesslog = '-'
+errorlog = '-'
+
+# приложение создаётся в каждом воркере после fork, поэтому пулы соединений
+# и поток LISTEN не наследуются от мастера
+preload_app = False
+
+
+def on_starting(server):
+    # выполняется в мастере до fork: воркеры унаследуют исправленное окружение
+    _metrics_dir(server)
+    _grid_push(server)
+
+
+def _metrics_dir(server):
+    if os.environ.get('METRICS_ENABLED', '1').lower() not in ('1', 'true', 'yes', 'on'):
+        return
+    path = os.environ.get('METRICS_DIR')
+    if not path:
+        if workers <= 1:
+            return
+        # без общего каталога каждый сбор попадал бы в случайный воркер
+        path = os.environ['METRICS_DIR'] = tempfile.mkdtemp(prefix='parking-metrics-')
+        server.log.info("METRICS_DIR=%s: /metrics суммирует воркеры", path)
+    else:
+        # снимки прошлого запуска: их процессов уже нет
+        for name in glob.glob(os.path.join(path, '*.json')):
+            os.remove(name)
+
+
+def _grid_push(server):
+    backend = os.environ.get('GRID_PUSH_BACKEND', 'none')
+    if backend == 'none':
+        return
+    if worker_class != 'gevent':
+        reason = f"воркер {worker_class} держал бы поток на каждую открытую шахматку"
+    elif backend == 'memory' and workers > 1:
+        reason = "бэкенд memory не видит коммитов других воркеров (нужен postgres)"
+    else:
+        return
+    server.log.warning("GRID_PUSH_BACKEND=%s выключен: %s; страницы сверяются опросом", backend, reason)
+    os.environ['GRID_PUSH_BACKEND'] = 'none'
+
+
+def post_fork(server, worker):
+    if worker_class != 'gevent':
+        return
+    try:
+        from psycogreen.gevent import patch_psycopg
+    except ImportError:
+        server.log.warning("psycogreen не установлен: запросы к Postgres блокируют весь воркер gevent")
+    else:
+        patch_psycopg()
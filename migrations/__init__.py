@@ -0,0 +1,87 @@
+# app/migrations/__init__.py
+"""
+Версионные миграции схемы.
+
+Каждая миграция — модуль vNNNN_<описание>.py с функциями upgrade(conn)
+и downgrade(conn). Применённые версии хранятся в таблице schema_version,
+каждая миграция выполняется в отдельной транзакции.
+"""
+import importlib
+import pkgutil
+from datetime import datetime
+
+from sqlalchemy import text
+
+
+def available():
+    """Список миграций [(версия, имя, модуль)] по возрастанию версии"""
+    found = []
+    for info in pkgutil.iter_modules(__path__):
+        if not info.name.startswith('v'):
+            continue
+        version = int(info.name[1:5])
+        module = importlib.import_module(f'{__name__}.{info.name}')
+        found.append((version, info.name, module))
+    return sorted(found, key=lambda m: m[0])
+
+
+def _ensure_table(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_version ("
+        " version INTEGER PRIMARY KEY,"
+        " name VARCHAR(200) NOT NULL,"
+        " applied_at TIMESTAMP NOT NULL)"
+    ))
+
+
+def current_version(engine):
+    """Последняя применённая версия (0 — миграций ещё не было)"""
+    with engine.begin() as conn:
+        _ensure_table(conn)
+        version = conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar()
+    return version or 0
+
+
+def upgrade(engine, target=None, echo=print):
+    """Применяет все миграции новее текущей версии (до target включительно)"""
+    current = current_version(engine)
+
+    for version, name, module in available():
+        if version <= current or (target is not None and version > target):
+            continue
+
+        with engine.begin() as conn:
+            module.upgrade(conn)
+            conn.execute(
+                text("INSERT INTO schema_version (version, name, applied_at) VALUES (:v, :n, :t)"),
+                {"v": version, "n": name, "t": datetime.utcnow()}
+            )
+        echo(f"Применена миграция {name}")
+
+
+def stamp(engine, target=None):
+    """Отмечает миграции применёнными без выполнения (схема создана по моделям)"""
+    current = current_version(engine)
+
+    with engine.begin() as conn:
+        for version, name, _ in available():
+            if version <= current or (target is not None and version > target):
+                continue
+            conn.execute(
+                text("INSERT INTO schema_version (version, name, applied_at) VALUES (:v, :n, :t)"),
+                {"v": version, "n": name, "t": datetime.utcnow()}
+            )
+
+
+def downgrade(engine, target, echo=print):
+    """Откатывает миграции новее target"""
+    current = current_version(engine)
+
+    for version, name, module in reversed(available()):
+        if version <= target or version > current:
+            continue
+
+        with engine.begin() as conn:
+            module.downgrade(conn)
+            conn.execute(text("DELETE FROM schema_version WHERE version = :v"), {"v": version})
+        echo(f"Откачена миграция {name}")
@@ -0,0 +1,28 @@
+# app/migrations/v0001_hot_path_indexes.py
+"""Составные индексы под частые запросы по броням и платежам"""
+from sqlalchemy import text
+
+# (имя, таблица, колонки) — совпадают с __table_args__ в models.py
+INDEXES = [
+    ('ix_parking_spot_parking_number', 'parking_spot', 'parking_id, number'),
+    ('ix_booking_spot_period', 'booking', 'spot_id, start_date, end_date'),
+    ('ix_booking_client_start', 'booking', 'client_id, start_date'),
+    ('ix_booking_period', 'booking', 'start_date, end_date'),
+    ('ix_payment_booking_date', 'payment', 'booking_id, payment_date'),
+    ('ix_payment_date', 'payment', 'payment_date'),
+    ('ix_expense_booking_date', 'expense', 'booking_id, expense_date'),
+]
+
+
+def upgrade(conn):
+    for name, table, columns in INDEXES:
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
+
+    # обновляем статистику, чтобы планировщик сразу увидел индексы
+    for table in {table for _, table, _ in INDEXES}:
+        conn.execute(text(f"ANALYZE {table}"))
+
+
+def downgrade(conn):
+    for name, _, _ in INDEXES:
+        conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
@@ -0,0 +1,12 @@
+# app/migrations/v0002_client_keyset_index.py
+"""Индекс (name, client_id) для keyset-пагинации списка арендаторов"""
+from sqlalchemy import text
+
+
+def upgrade(conn):
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_client_name_id ON client (name, client_id)"))
+    conn.execute(text("ANALYZE client"))
+
+
+def downgrade(conn):
+    conn.execute(text("DROP INDEX IF EXISTS ix_client_name_id"))
@@ -0,0 +1,40 @@
+# app/migrations/v0003_client_search.py
+"""
+Индексированный поиск арендаторов: колонка phone_digits (только цифры
+телефона) и триграммные GIN-индексы pg_trgm по ФИО и телефону.
+В SQLite добавляется только колонка — поиск там идёт перебором.
+"""
+import re
+
+from sqlalchemy import text
+
+
+def upgrade(conn):
+    conn.execute(text("ALTER TABLE client ADD COLUMN phone_digits VARCHAR(50)"))
+
+    if conn.dialect.name == 'postgresql':
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        conn.execute(text(
+            "UPDATE client SET phone_digits = NULLIF(regexp_replace(phone, '\\D', '', 'g'), '')"
+        ))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_client_name_trgm ON client USING gin (name gin_trgm_ops)"
+        ))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_client_phone_digits_trgm "
+            "ON client USING gin (phone_digits gin_trgm_ops)"
+        ))
+        conn.execute(text("ANALYZE client"))
+    else:
+        rows = conn.execute(text("SELECT client_id, phone FROM client WHERE phone IS NOT NULL")).all()
+        if rows:
+            conn.execute(
+                text("UPDATE client SET phone_digits = :digits WHERE client_id = :id"),
+                [{"id": client_id, "digits": re.sub(r'\D', '', phone) or None} for client_id, phone in rows]
+            )
+
+
+def downgrade(conn):
+    conn.execute(text("DROP INDEX IF EXISTS ix_client_name_trgm"))
+    conn.execute(text("DROP INDEX IF EXISTS ix_client_phone_digits_trgm"))
+    conn.execute(text("ALTER TABLE client DROP COLUMN phone_digits"))
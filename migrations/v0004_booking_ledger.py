@@ -0,0 +1,24 @@
+# app/migrations/v0004_booking_ledger.py
+"""Леджер оплат в booking: total_paid, last_payment_date, balance"""
+from sqlalchemy import text
+
+
+def upgrade(conn):
+    conn.execute(text("ALTER TABLE booking ADD COLUMN total_paid NUMERIC(10, 2) NOT NULL DEFAULT 0"))
+    conn.execute(text("ALTER TABLE booking ADD COLUMN last_payment_date DATE"))
+    conn.execute(text("ALTER TABLE booking ADD COLUMN balance NUMERIC(10, 2)"))
+
+    conn.execute(text(
+        "UPDATE booking SET"
+        " total_paid = COALESCE((SELECT SUM(p.amount) FROM payment p"
+        "                        WHERE p.booking_id = booking.booking_id), 0),"
+        " last_payment_date = (SELECT MAX(p.payment_date) FROM payment p"
+        "                      WHERE p.booking_id = booking.booking_id)"
+    ))
+    conn.execute(text("UPDATE booking SET balance = COALESCE(rent_size, 0) - total_paid"))
+
+
+def downgrade(conn):
+    conn.execute(text("ALTER TABLE booking DROP COLUMN balance"))
+    conn.execute(text("ALTER TABLE booking DROP COLUMN last_payment_date"))
+    conn.execute(text("ALTER TABLE booking DROP COLUMN total_paid"))
@@ -0,0 +1,27 @@
+# app/migrations/v0005_monthly_rollup.py
+"""
+Таблица помесячной свёртки monthly_rollup.
+После миграции заполнить её: flask rollup rebuild
+"""
+from sqlalchemy import text
+
+
+def upgrade(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS monthly_rollup ("
+        " parking_id INTEGER NOT NULL REFERENCES parking (parking_id) ON DELETE CASCADE,"
+        " year INTEGER NOT NULL,"
+        " month INTEGER NOT NULL,"
+        " charged NUMERIC(14, 2) NOT NULL DEFAULT 0,"
+        " paid NUMERIC(14, 2) NOT NULL DEFAULT 0,"
+        " expenses NUMERIC(14, 2) NOT NULL DEFAULT 0,"
+        " occupied_spot_months INTEGER NOT NULL DEFAULT 0,"
+        " free_spot_months INTEGER NOT NULL DEFAULT 0,"
+        " refreshed_at TIMESTAMP,"
+        " PRIMARY KEY (parking_id, year, month))"
+    ))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_monthly_rollup_period ON monthly_rollup (year, month)"))
+
+
+def downgrade(conn):
+    conn.execute(text("DROP TABLE IF EXISTS monthly_rollup"))
@@ -0,0 +1,36 @@
+# app/migrations/v0006_booking_no_overlap.py
+"""
+Запрет пересекающихся броней одного места (только Postgres):
+EXCLUDE USING gist (spot_id WITH =, daterange(start_date, end_date, '[]') WITH &&).
+Если в данных уже есть пересечения, миграция останавливается и
+перечисляет их — их нужно исправить вручную.
+"""
+from sqlalchemy import text
+
+
+def upgrade(conn):
+    if conn.dialect.name != 'postgresql':
+        return
+
+    clashes = conn.execute(text(
+        "SELECT a.spot_id, a.booking_id, b.booking_id FROM booking a"
+        " JOIN booking b ON b.spot_id = a.spot_id AND b.booking_id > a.booking_id"
+        " AND b.start_date <= a.end_date AND b.end_date >= a.start_date"
+        " ORDER BY a.spot_id LIMIT 20"
+    )).all()
+    if clashes:
+        listing = ", ".join(f"место {s}: брони {a} и {b}" for s, a, b in clashes)
+        raise RuntimeError(f"Есть пересекающиеся брони, исправьте их перед миграцией: {listing}")
+
+    conn.execute(text("CREATE EXTENSION IF NOT EXISTS btree_gist"))
+    conn.execute(text(
+        "ALTER TABLE booking ADD CONSTRAINT booking_no_overlap"
+        " EXCLUDE USING gist (spot_id WITH =, daterange(start_date, end_date, '[]') WITH &&)"
+    ))
+
+
+def downgrade(conn):
+    if conn.dialect.name != 'postgresql':
+        return
+
+    conn.execute(text("ALTER TABLE booking DROP CONSTRAINT IF EXISTS booking_no_overlap"))
@@ -0,0 +1,23 @@
+# app/migrations/v0007_grid_change_log.py
+"""Журнал изменений ячеек шахматки для дельта-синхронизации (grid.json?since=)"""
+from sqlalchemy import text
+
+
+def upgrade(conn):
+    if conn.dialect.name == 'postgresql':
+        version = "version SERIAL PRIMARY KEY"
+    else:
+        version = "version INTEGER PRIMARY KEY AUTOINCREMENT"
+
+    conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS grid_change ({version},"
+        " parking_id INTEGER, spot_id INTEGER, year INTEGER, month INTEGER,"
+        " changed_at TIMESTAMP)"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_grid_change_scope ON grid_change (parking_id, year, version)"
+    ))
+
+
+def downgrade(conn):
+    conn.execute(text("DROP TABLE IF EXISTS grid_change"))
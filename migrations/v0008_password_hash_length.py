@@ -0,0 +1,20 @@
+# app/migrations/v0008_password_hash_length.py
+"""
+users.password — VARCHAR(255): хэш scrypt в формате werkzeug занимает
+~160 символов. SQLite длину не проверяет, там миграция ничего не делает.
+Старые пароли в открытом виде перехэшируются при входе или командой
+flask users hash-passwords.
+"""
+from sqlalchemy import text
+
+
+def upgrade(conn):
+    if conn.dialect.name != 'postgresql':
+        return
+    conn.execute(text("ALTER TABLE users ALTER COLUMN password TYPE VARCHAR(255)"))
+
+
+def downgrade(conn):
+    if conn.dialect.name != 'postgresql':
+        return
+    conn.execute(text("ALTER TABLE users ALTER COLUMN password TYPE VARCHAR(128)"))
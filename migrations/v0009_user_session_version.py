@@ -0,0 +1,15 @@
+# app/migrations/v0009_user_session_version.py
+"""
+users.session_version — версия сессий пользователя (services/usercache.py).
+Сессии, выданные до миграции, хранят только id и считаются версией 1 —
+первая смена пароля или роли их завершает.
+"""
+from sqlalchemy import text
+
+
+def upgrade(conn):
+    conn.execute(text("ALTER TABLE users ADD COLUMN session_version INTEGER NOT NULL DEFAULT 1"))
+
+
+def downgrade(conn):
+    conn.execute(text("ALTER TABLE users DROP COLUMN session_version"))
@@ -0,0 +1,47 @@
+# app/migrations/v0010_archive.py
+"""
+Архив закрытых лет (services/archive.py): archived_period и таблицы
+booking_archive, payment_archive, expense_archive. В Postgres архивные
+таблицы секционированы по годам; секции создаёт `flask archive close-year`.
+"""
+from sqlalchemy import text
+
+ARCHIVES = (
+    # таблица, ключ секционирования, индексы
+    ('booking', 'end_date', (('booking_id',), ('spot_id', 'start_date', 'end_date'), ('start_date', 'end_date'))),
+    ('payment', 'payment_date', (('booking_id',), ('payment_date',))),
+    ('expense', 'expense_date', (('booking_id',), ('expense_date',))),
+)
+
+
+def upgrade(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS archived_period ("
+        " year INTEGER PRIMARY KEY,"
+        " closed_at TIMESTAMP,"
+        " bookings INTEGER NOT NULL DEFAULT 0,"
+        " payments INTEGER NOT NULL DEFAULT 0,"
+        " expenses INTEGER NOT NULL DEFAULT 0)"
+    ))
+
+    postgres = conn.dialect.name == 'postgresql'
+    for table, key, indexes in ARCHIVES:
+        archive = f"{table}_archive"
+        # те же колонки, без строк, ключей и ограничений
+        if postgres:
+            conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {archive} (LIKE {table}) PARTITION BY RANGE ({key})"
+            ))
+        else:
+            conn.execute(text(f"CREATE TABLE IF NOT EXISTS {archive} AS SELECT * FROM {table} WHERE 1 = 0"))
+        for columns in indexes:
+            conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS ix_{archive}_{'_'.join(columns)} "
+                f"ON {archive} ({', '.join(columns)})"
+            ))
+
+
+def downgrade(conn):
+    for table, _, _ in ARCHIVES:
+        conn.execute(text(f"DROP TABLE IF EXISTS {table}_archive"))
+    conn.execute(text("DROP TABLE IF EXISTS archived_period"))
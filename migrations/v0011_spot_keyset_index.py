@@ -0,0 +1,13 @@
+# app/migrations/v0011_spot_keyset_index.py
+"""Keyset-пагинация мест шахматки по (номер, id) для всех парковок сразу"""
+from sqlalchemy import text
+
+
+def upgrade(conn):
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_parking_spot_number_id ON parking_spot (number, spot_id)"
+    ))
+
+
+def downgrade(conn):
+    conn.execute(text("DROP INDEX IF EXISTS ix_parking_spot_number_id"))
@@ -0,0 +1,45 @@
+# app/migrations/v0012_accruals.py
+"""
+Помесячные начисления (services/accruals.py): accrual и отметки закрытых
+месяцев accrual_run. Заполнить за прошлые месяцы: flask accruals run --from ГГГГ-ММ
+"""
+from sqlalchemy import text
+
+
+def upgrade(conn):
+    if conn.dialect.name == 'postgresql':
+        accrual_id = "accrual_id SERIAL PRIMARY KEY"
+    else:
+        accrual_id = "accrual_id INTEGER PRIMARY KEY"
+
+    conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS accrual ({accrual_id},"
+        " year INTEGER NOT NULL,"
+        " month INTEGER NOT NULL,"
+        " booking_id INTEGER NOT NULL,"
+        " parking_id INTEGER,"
+        " spot_id INTEGER,"
+        " client_id INTEGER,"
+        " rent NUMERIC(10, 2) NOT NULL DEFAULT 0,"
+        " utilities NUMERIC(10, 2) NOT NULL DEFAULT 0,"
+        " amount NUMERIC(10, 2) NOT NULL DEFAULT 0,"
+        " created_at TIMESTAMP,"
+        " CONSTRAINT uq_accrual_booking_month UNIQUE (booking_id, year, month))"
+    ))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_accrual_period ON accrual (year, month, parking_id)"))
+
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS accrual_run ("
+        " year INTEGER NOT NULL,"
+        " month INTEGER NOT NULL,"
+        " status VARCHAR(20) NOT NULL DEFAULT 'running',"
+        " row_count INTEGER NOT NULL DEFAULT 0,"
+        " started_at TIMESTAMP,"
+        " finished_at TIMESTAMP,"
+        " PRIMARY KEY (year, month))"
+    ))
+
+
+def downgrade(conn):
+    conn.execute(text("DROP TABLE IF EXISTS accrual_run"))
+    conn.execute(text("DROP TABLE IF EXISTS accrual"))
@@ -0,0 +1,39 @@
+# app/migrations/v0013_report_jobs.py
+"""
+Фоновые отчёты (services/jobs.py): задания и их сжатые результаты.
+"""
+from sqlalchemy import text
+
+
+def upgrade(conn):
+    if conn.dialect.name == 'postgresql':
+        job_id = "job_id SERIAL PRIMARY KEY"
+        blob = "BYTEA"
+    else:
+        job_id = "job_id INTEGER PRIMARY KEY"
+        blob = "BLOB"
+
+    conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS report_job ({job_id},"
+        " report_type VARCHAR(20) NOT NULL,"
+        " start_date DATE NOT NULL,"
+        " end_date DATE NOT NULL,"
+        " parking_id INTEGER,"
+        " data_version VARCHAR(64) NOT NULL,"
+        " status VARCHAR(20) NOT NULL DEFAULT 'queued',"
+        " progress INTEGER NOT NULL DEFAULT 0,"
+        " error TEXT,"
+        f" result {blob},"
+        " row_count INTEGER,"
+        " created_at TIMESTAMP,"
+        " started_at TIMESTAMP,"
+        " finished_at TIMESTAMP)"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_report_job_params"
+        " ON report_job (report_type, start_date, end_date, parking_id)"
+    ))
+
+
+def downgrade(conn):
+    conn.execute(text("DROP TABLE IF EXISTS report_job"))
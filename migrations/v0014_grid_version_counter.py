@@ -0,0 +1,74 @@
+# app/migrations/v0014_grid_version_counter.py
+"""
+Версии шахматки в порядке коммитов (services/gridsync.py).
+
+Раньше версией был автоинкрементный ключ grid_change: номер выдаётся при
+INSERT, а коммит может случиться позже, чем у транзакции с большим
+номером, и клиент, синхронизированный на большей версии, не увидел бы
+строк меньшей. Теперь версия берётся из счётчика grid_version, строка
+которого блокируется до конца транзакции; у grid_change — свой ключ
+change_id.
+"""
+from sqlalchemy import text
+
+
+def upgrade(conn):
+    conn.execute(text("CREATE TABLE IF NOT EXISTS grid_version (id INTEGER PRIMARY KEY, version INTEGER NOT NULL)"))
+    conn.execute(text(
+        "INSERT INTO grid_version (id, version)"
+        " SELECT 1, COALESCE(MAX(version), 0) FROM grid_change"
+    ))
+
+    if conn.dialect.name == 'postgresql':
+        conn.execute(text("ALTER TABLE grid_change DROP CONSTRAINT grid_change_pkey"))
+        conn.execute(text("ALTER TABLE grid_change ALTER COLUMN version DROP DEFAULT"))
+        conn.execute(text("DROP SEQUENCE IF EXISTS grid_change_version_seq"))
+        conn.execute(text("ALTER TABLE grid_change ADD COLUMN change_id SERIAL PRIMARY KEY"))
+    else:
+        # SQLite не меняет первичный ключ — таблица пересоздаётся
+        conn.execute(text(
+            "CREATE TABLE grid_change_new (change_id INTEGER PRIMARY KEY,"
+            " version INTEGER NOT NULL, parking_id INTEGER, spot_id INTEGER,"
+            " year INTEGER, month INTEGER, changed_at TIMESTAMP)"
+        ))
+        conn.execute(text(
+            "INSERT INTO grid_change_new (version, parking_id, spot_id, year, month, changed_at)"
+            " SELECT version, parking_id, spot_id, year, month, changed_at FROM grid_change ORDER BY version"
+        ))
+        conn.execute(text("DROP TABLE grid_change"))
+        conn.execute(text("ALTER TABLE grid_change_new RENAME TO grid_change"))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_grid_change_scope ON grid_change (parking_id, year, version)"
+        ))
+
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_grid_change_version ON grid_change (version)"))
+
+
+def downgrade(conn):
+    # версии коммитов с несколькими строками совпадают — ключ по ним не восстановить
+    conn.execute(text("DELETE FROM grid_change"))
+    conn.execute(text("DROP INDEX IF EXISTS ix_grid_change_version"))
+    if conn.dialect.name == 'postgresql':
+        conn.execute(text("ALTER TABLE grid_change DROP COLUMN change_id"))
+        conn.execute(text("CREATE SEQUENCE IF NOT EXISTS grid_change_version_seq OWNED BY grid_change.version"))
+        conn.execute(text(
+            "SELECT setval('grid_change_version_seq', (SELECT GREATEST(MAX(version), 1) FROM grid_version))"
+        ))
+        conn.execute(text(
+            "ALTER TABLE grid_change ALTER COLUMN version SET DEFAULT nextval('grid_change_version_seq')"
+        ))
+        conn.execute(text("ALTER TABLE grid_change ADD PRIMARY KEY (version)"))
+    else:
+        conn.execute(text("DROP TABLE grid_change"))
+        conn.execute(text(
+            "CREATE TABLE grid_change (version INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " parking_id INTEGER, spot_id INTEGER, year INTEGER, month INTEGER,"
+            " changed_at TIMESTAMP)"
+        ))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_grid_change_scope ON grid_change (parking_id, year, version)"
+        ))
+        conn.execute(text(
+            "INSERT INTO sqlite_sequence (name, seq) SELECT 'grid_change', version FROM grid_version"
+        ))
+    conn.execute(text("DROP TABLE IF EXISTS grid_version"))
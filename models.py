@@ -1,8 +1,19 @@
+import re
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from sqlalchemy import DDL, event
+from sqlalchemy.dialects.postgresql import ExcludeConstraint
+from sqlalchemy.orm import validates
 from datetime import date, datetime
+from services.replica import RoutingSession
 
-db = SQLAlchemy()
+# RoutingSession отправляет чтения страниц только для чтения на реплику (services/replica.py)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+
+def normalize_phone(value):
+    """Только цифры номера: «+7 (900) 123-45-67» → «79001234567»"""
+    return re.sub(r'\D', '', value or '') or None
 
 # === Пользователи (для входа) ===
 class User(UserMixin, db.Model):
@@ -11,9 +22,31 @@ class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(100), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password = db.Column(db.String(128), nullable=False)
+    password = db.Column(db.String(255), nullable=False)  # хэш scrypt (services/passwords.py)
     role = db.Column(db.String(50), default='user')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # растёт при смене пароля (change_password) или роли — старые сессии перестают приниматься
+    session_version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    def get_id(self):
+        # в сессии хранится «id:версия» (services/usercache.py)
+        return f"{self.id}:{self.session_version or 1}"
+
+    def change_password(self, password_hash):
+        """Сменить пароль (хэш из services/passwords.py) и завершить прочие сессии пользователя"""
+        # перехэширование того же пароля (вход, flask users hash-passwords) пишет
+        # user.password напрямую — сессии при этом не сбрасываются
+        self.password = password_hash
+        self._bump_session_version()
+
+    @validates('role')
+    def _role_changed(self, key, value):
+        if self.id is not None and self.role != value:
+            self._bump_session_version()
+        return value
+
+    def _bump_session_version(self):
+        self.session_version = (self.session_version or 1) + 1
 
     def __repr__(self):
         return f"<User {self.username}>"
@@ -26,14 +59,39 @@ class Client(db.Model):
     client_id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(150), nullable=False)
     phone = db.Column(db.String(50))
+    phone_digits = db.Column(db.String(50))  # нормализованный телефон для поиска
     notes = db.Column(db.Text, nullable=True)
 
     bookings = db.relationship('Booking', back_populates='client', cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # keyset-пагинация списка арендаторов
+        db.Index('ix_client_name_id', 'name', 'client_id'),
+        # поиск по подстроке (ILIKE '%q%') — триграммы pg_trgm, только Postgres
+        db.Index('ix_client_name_trgm', 'name',
+                 postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}
+                 ).ddl_if(dialect='postgresql'),
+        db.Index('ix_client_phone_digits_trgm', 'phone_digits',
+                 postgresql_using='gin', postgresql_ops={'phone_digits': 'gin_trgm_ops'}
+                 ).ddl_if(dialect='postgresql'),
+    )
+
+    @validates('phone')
+    def _sync_phone_digits(self, key, value):
+        self.phone_digits = normalize_phone(value)
+        return value
+
     def __repr__(self):
         return f"<Client {self.name}>"
 
 
+# триграммные индексы требуют расширения pg_trgm
+event.listen(
+    Client.__table__, 'before_create',
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect='postgresql')
+)
+
+
 # === Парковки ===
 class Parking(db.Model):
     __tablename__ = 'parking'
@@ -55,6 +113,13 @@ class ParkingSpot(db.Model):
     parking_id = db.Column(db.Integer, db.ForeignKey('parking.parking_id', ondelete='CASCADE'))
     status = db.Column(db.String(50), default='свободно')
     parking = db.relationship('Parking', back_populates='spots')
+
+    __table_args__ = (
+        # шахматка и проверка дубликатов номеров в add_spot
+        db.Index('ix_parking_spot_parking_number', 'parking_id', 'number'),
+        # страницы шахматки по всем парковкам — keyset по (номер, id)
+        db.Index('ix_parking_spot_number_id', 'number', 'spot_id'),
+    )
     bookings = db.relationship('Booking', back_populates='spot', cascade="all, delete-orphan")
 
     def __repr__(self):
@@ -75,7 +140,27 @@ class Booking(db.Model):
     utilities = db.Column(db.Numeric(10, 2))
     rent_size = db.Column(db.Numeric(10, 2))
     notes = db.Column(db.Text)
-    
+
+    # леджер оплат — поддерживается services/ledger.py при записи Payment/Booking
+    total_paid = db.Column(db.Numeric(10, 2), nullable=False, default=0, server_default='0')
+    last_payment_date = db.Column(db.Date)
+    balance = db.Column(db.Numeric(10, 2))  # rent_size − total_paid
+
+    __table_args__ = (
+        # пересечение периодов по месту (шахматка)
+        db.Index('ix_booking_spot_period', 'spot_id', 'start_date', 'end_date'),
+        # последняя бронь арендатора (client_card, фильтр активных)
+        db.Index('ix_booking_client_start', 'client_id', 'start_date'),
+        # диапазоны дат в отчётах
+        db.Index('ix_booking_period', 'start_date', 'end_date'),
+        # брони одного места не пересекаются (Postgres, GiST + btree_gist)
+        ExcludeConstraint(
+            ('spot_id', '='),
+            (db.func.daterange(db.column('start_date'), db.column('end_date'), db.literal_column("'[]'")), '&&'),
+            name='booking_no_overlap',
+            using='gist'
+        ).ddl_if(dialect='postgresql'),
+    )
 
     spot = db.relationship('ParkingSpot', back_populates='bookings')
     client = db.relationship('Client', back_populates='bookings')
@@ -92,6 +177,13 @@ class Booking(db.Model):
         return rent + utils
 
 
+# ограничению booking_no_overlap нужно расширение btree_gist
+event.listen(
+    Booking.__table__, 'before_create',
+    DDL("CREATE EXTENSION IF NOT EXISTS btree_gist").execute_if(dialect='postgresql')
+)
+
+
 # === Платежи ===
 class Payment(db.Model):
     __tablename__ = 'payment'
@@ -105,6 +197,13 @@ class Payment(db.Model):
 
     booking = db.relationship('Booking', back_populates='payments')
 
+    __table_args__ = (
+        # суммы и последний платёж по брони
+        db.Index('ix_payment_booking_date', 'booking_id', 'payment_date'),
+        # отчёт по платежам за период
+        db.Index('ix_payment_date', 'payment_date'),
+    )
+
     def __repr__(self):
         return f"<Payment {self.payment_id}: {self.amount}>"
 
@@ -121,5 +220,176 @@ class Expense(db.Model):
 
     booking = db.relationship('Booking', back_populates='expenses')
 
+    __table_args__ = (
+        db.Index('ix_expense_booking_date', 'booking_id', 'expense_date'),
+    )
+
+    def __repr__(self):
+        return f"<Expense {self.expense_id}: {self.amount}>"
+
+
+# === Помесячная свёртка по парковкам (services/rollup.py) ===
+class MonthlyRollup(db.Model):
+    __tablename__ = 'monthly_rollup'
+
+    parking_id = db.Column(db.Integer, db.ForeignKey('parking.parking_id', ondelete='CASCADE'), primary_key=True)
+    year = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.Integer, primary_key=True)
+    charged = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    paid = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    expenses = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    occupied_spot_months = db.Column(db.Integer, nullable=False, default=0)
+    free_spot_months = db.Column(db.Integer, nullable=False, default=0)
+    refreshed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    parking = db.relationship('Parking')
+
+    __table_args__ = (
+        # сводные отчёты и панель — диапазон месяцев по всем парковкам
+        db.Index('ix_monthly_rollup_period', 'year', 'month'),
+    )
+
+    def __repr__(self):
+        return f"<MonthlyRollup {self.parking_id} {self.year}-{self.month:02d}>"
+
+
+# === Помесячные начисления (services/accruals.py) ===
+class Accrual(db.Model):
+    __tablename__ = 'accrual'
+
+    accrual_id = db.Column(db.Integer, primary_key=True)
+    year = db.Column(db.Integer, nullable=False)
+    month = db.Column(db.Integer, nullable=False)
+    # без внешних ключей: начисления закрытых лет остаются и после переноса броней в архив
+    booking_id = db.Column(db.Integer, nullable=False)
+    parking_id = db.Column(db.Integer)
+    spot_id = db.Column(db.Integer)
+    client_id = db.Column(db.Integer)
+    rent = db.Column(db.Numeric(10, 2), nullable=False, default=0)
+    utilities = db.Column(db.Numeric(10, 2), nullable=False, default=0)
+    amount = db.Column(db.Numeric(10, 2), nullable=False, default=0)  # rent + utilities
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # одно начисление на бронь в месяц — повторный запуск ничего не дублирует
+        db.UniqueConstraint('booking_id', 'year', 'month', name='uq_accrual_booking_month'),
+        # отчёт по начислениям за период
+        db.Index('ix_accrual_period', 'year', 'month', 'parking_id'),
+    )
+
+    def __repr__(self):
+        return f"<Accrual {self.booking_id} {self.year}-{self.month:02d}: {self.amount}>"
+
+
+# === Закрытые месяцы начислений ===
+class AccrualRun(db.Model):
+    __tablename__ = 'accrual_run'
+
+    year = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(20), nullable=False, default='running')  # running / done
+    row_count = db.Column(db.Integer, nullable=False, default=0)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f"<AccrualRun {self.year}-{self.month:02d} {self.status}>"
+
+
+# === Фоновые отчёты (services/jobs.py) ===
+class ReportJob(db.Model):
+    __tablename__ = 'report_job'
+
+    job_id = db.Column(db.Integer, primary_key=True)
+    report_type = db.Column(db.String(20), nullable=False)
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date, nullable=False)
+    parking_id = db.Column(db.Integer)
+    data_version = db.Column(db.String(64), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued / running / done / failed
+    progress = db.Column(db.Integer, nullable=False, default=0)  # проценты
+    error = db.Column(db.Text)
+    result = db.Column(db.LargeBinary)  # JSON отчёта, сжатый zlib
+    row_count = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        # поиск готового результата с теми же параметрами
+        db.Index('ix_report_job_params', 'report_type', 'start_date', 'end_date', 'parking_id'),
+    )
+
+    def __repr__(self):
+        return f"<ReportJob {self.job_id} {self.report_type} {self.status}>"
+
+
+# === Журнал изменений шахматки (services/gridsync.py) ===
+class GridChange(db.Model):
+    __tablename__ = 'grid_change'
+
+    change_id = db.Column(db.Integer, primary_key=True)
+    # версия коммита из счётчика grid_version: у всех строк одного коммита она общая
+    version = db.Column(db.Integer, nullable=False)
+    parking_id = db.Column(db.Integer)
+    spot_id = db.Column(db.Integer)   # NULL — изменился состав мест парковки
+    year = db.Column(db.Integer)
+    month = db.Column(db.Integer)
+    changed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_grid_change_scope', 'parking_id', 'year', 'version'),
+        db.Index('ix_grid_change_version', 'version'),
+    )
+
+    def __repr__(self):
+        return f"<GridChange {self.version}: {self.spot_id} {self.year}-{self.month}>"
+
+
+class GridVersion(db.Model):
+    """Счётчик версий шахматки — одна строка id = 1 (services/gridsync.py)"""
+    __tablename__ = 'grid_version'
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+event.listen(
+    GridVersion.__table__, 'after_create',
+    DDL("INSERT INTO grid_version (id, version) VALUES (1, 0)")
+)
+
+
+# === Архив закрытых лет (services/archive.py) ===
+class ArchivedPeriod(db.Model):
+    __tablename__ = 'archived_period'
+
+    year = db.Column(db.Integer, primary_key=True)
+    closed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    bookings = db.Column(db.Integer, nullable=False, default=0)
+    payments = db.Column(db.Integer, nullable=False, default=0)
+    expenses = db.Column(db.Integer, nullable=False, default=0)
+
     def __repr__(self):
-        return f"<Expense {self.expense_id}: {self.amount}>"
\ No newline at end of file
+        return f"<ArchivedPeriod {self.year}>"
+
+
+def _archive_table(model, partition_key, *indexes):
+    """
+    Архивная копия таблицы: те же колонки без ключей и ограничений.
+    В Postgres — секционирована по годам partition_key (секции создаёт
+    services/archive.py при закрытии года).
+    """
+    name = f"{model.__tablename__}_archive"
+    return db.Table(
+        name, db.metadata,
+        *[db.Column(c.name, c.type, nullable=c.nullable) for c in model.__table__.columns],
+        *[db.Index(f"ix_{name}_{'_'.join(columns)}", *columns) for columns in indexes],
+        postgresql_partition_by=f"RANGE ({partition_key})",
+    )
+
+
+booking_archive = _archive_table(Booking, 'end_date', ('booking_id',),
+                                 ('spot_id', 'start_date', 'end_date'), ('start_date', 'end_date'))
+payment_archive = _archive_table(Payment, 'payment_date', ('booking_id',), ('payment_date',))
+expense_archive = _archive_table(Expense, 'expense_date', ('booking_id',), ('expense_date',))
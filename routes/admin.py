@@ -1,8 +1,49 @@
+from datetime import date
 from flask import Blueprint, render_template, url_for
 from flask_login import login_required
+from models import db, MonthlyRollup, Parking
+from services import replica
 bp = Blueprint('admin', __name__)
 
 @bp.route('/dashboard')
 @login_required
+@replica.reads
 def admin_dashboard():
-    return render_template('dashboard.html')
+    # все цифры — из помесячной свёртки, без обращения к броням и платежам
+    totals = (
+        db.session.query(
+            MonthlyRollup.year,
+            db.func.sum(MonthlyRollup.charged),
+            db.func.sum(MonthlyRollup.paid),
+            db.func.sum(MonthlyRollup.expenses),
+            db.func.sum(MonthlyRollup.occupied_spot_months),
+            db.func.sum(MonthlyRollup.free_spot_months)
+        )
+        .group_by(MonthlyRollup.year)
+        .order_by(MonthlyRollup.year.desc())
+        .limit(5)
+        .all()
+    )
+
+    current_year = date.today().year
+    by_parking = (
+        db.session.query(
+            Parking.address,
+            db.func.sum(MonthlyRollup.charged),
+            db.func.sum(MonthlyRollup.paid),
+            db.func.sum(MonthlyRollup.occupied_spot_months),
+            db.func.sum(MonthlyRollup.free_spot_months)
+        )
+        .join(Parking, Parking.parking_id == MonthlyRollup.parking_id)
+        .filter(MonthlyRollup.year == current_year)
+        .group_by(Parking.address)
+        .order_by(Parking.address)
+        .all()
+    )
+
+    return render_template(
+        'dashboard.html',
+        totals=totals,
+        by_parking=by_parking,
+        current_year=current_year
+    )
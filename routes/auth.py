@@ -1,6 +1,7 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app
 from flask_login import login_user, logout_user, login_required, current_user
 from models import db, User
+from services import passwords, ratelimit, usercache
 
 bp = Blueprint('auth', __name__, url_prefix='/auth')
 
@@ -14,14 +15,34 @@ def login():
         username = request.form.get('username', '').strip()
         password = request.form.get('password', '').strip()
 
+        # до обращения к БД и хэширования: перебор паролей отсекается дёшево
+        retry = ratelimit.limiter(current_app, 'login').check(request.remote_addr, username.lower())
+        if retry:
+            flash(f'Слишком много попыток входа. Повторите через {int(retry) + 1} с.', 'danger')
+            return render_template('login.html'), 429, {'Retry-After': str(int(retry) + 1)}
+
         user = User.query.filter_by(username=username).first()
 
         if not user:
             flash('Пользователь не найден', 'danger')
-        elif user.password != password:
+            return render_template('login.html')
+
+        try:
+            ok, needs_rehash = passwords.verify(user.password, password)
+            if ok and needs_rehash:
+                # открытый пароль или хэш со старой стоимостью — заменяем при входе;
+                # пароль тот же, поэтому session_version не меняется и другие сессии живут
+                user.password = passwords.hash_password(password)
+                db.session.commit()
+        except passwords.PasswordHashBusy:
+            flash('Сервер перегружен, повторите вход через несколько секунд', 'danger')
+            return render_template('login.html'), 503, {'Retry-After': '5'}
+
+        if not ok:
             flash('Неверный пароль', 'danger')
         else:
             login_user(user)
+            usercache.remember(user)
             flash(f'Добро пожаловать, {user.username}!', 'success')
             return redirect(url_for('index'))
 
@@ -48,7 +69,13 @@ def register():
         elif User.query.filter_by(email=email).first():
             flash('Такой email уже зарегистрирован', 'danger')
         else:
-            new_user = User(username=username, email=email, password=password)
+            try:
+                password_hash = passwords.hash_password(password)
+            except passwords.PasswordHashBusy:
+                flash('Сервер перегружен, повторите через несколько секунд', 'danger')
+                return render_template('register.html'), 503, {'Retry-After': '5'}
+
+            new_user = User(username=username, email=email, password=password_hash)
             db.session.add(new_user)
             db.session.commit()
             flash('Регистрация успешна! Теперь войдите.', 'success')
@@ -61,5 +88,6 @@ def register():
 @login_required
 def logout():
     logout_user()
+    usercache.forget()
     flash('Вы вышли из системы', 'info')
     return redirect(url_for('auth.login'))
\ No newline at end of file
@@ -1,8 +1,11 @@
 # app/routes/reports.py
 
-from flask import Blueprint, render_template, request, flash
+from flask import Blueprint, render_template, request, flash, redirect, url_for, Response, stream_with_context, jsonify
 from flask_login import login_required
-from models import db, Payment, Booking, Parking, ParkingSpot, Client
+from sqlalchemy.orm import Query
+from models import db, Payment, Booking, Parking, ParkingSpot, Client, MonthlyRollup, Accrual, ReportJob
+from services import analytics, archive, jobs, replica
+from services.export import csv_stream, xlsx_stream
 from datetime import datetime
 from decimal import Decimal
 
@@ -14,6 +17,7 @@ bp = Blueprint('reports', __name__, url_prefix='/reports')
 # ================================
 @bp.route('/view', methods=['GET'])
 @login_required
+@replica.reads
 def view():
     report_type = request.args.get('type')
     start = request.args.get('start')
@@ -53,129 +57,502 @@ def view():
             parkings=parkings
         )
 
-    # формируем нужный отчёт
-    if report_type == 'payments':
-        data = get_payments(start_date, end_date, parking_id)
-    elif report_type == 'charges':
-        data = get_charges(start_date, end_date, parking_id)
-    elif report_type == 'finance':
-        data = get_finance(start_date, end_date, parking_id)
-    else:
+    if start_date > end_date:
+        flash("Дата начала позже окончания", "danger")
+        return render_template(
+            'reports.html',
+            report_type=report_type,
+            report_data=None,
+            parkings=parkings
+        )
+
+    # формируем нужный отчёт: за длинный период — фоновым заданием
+    job = None
+    if report_type == 'analytics' and not analytics.available():
+        flash("Для аналитики установите пакет numpy", "danger")
         data = None
+    elif report_type not in BUILDERS:
+        data = None
+    elif jobs.in_background(start_date, end_date):
+        job = jobs.submit(report_type, start_date, end_date, parking_id)
+        data = jobs.result(job) if job.status == 'done' else None
+    else:
+        data = BUILDERS[report_type](start_date, end_date, parking_id)
 
     return render_template(
         'reports.html',
         report_type=report_type,
         report_data=data,
+        job=job,
         parkings=parkings
     )
 
+
+@bp.route('/jobs/<int:job_id>', methods=['GET'])
+@login_required
+def job_status(job_id):
+    """Состояние фонового отчёта — страница опрашивает его, пока отчёт строится"""
+    job = ReportJob.query.get_or_404(job_id)
+    return jsonify(jobs.describe(job))
+
+
+@bp.route('/jobs/<int:job_id>/result', methods=['GET'])
+@login_required
+def job_result(job_id):
+    """Готовый фоновый отчёт — страница переходит сюда, когда задание завершено"""
+    job = ReportJob.query.get_or_404(job_id)
+    params = {
+        "type": job.report_type,
+        "start": job.start_date.isoformat(),
+        "end": job.end_date.isoformat(),
+        "parking_id": str(job.parking_id) if job.parking_id else None,
+    }
+    if job.status != 'done':
+        # ещё идёт или не построено — страница отчёта продолжит опрос
+        return redirect(url_for('reports.view', **params))
+
+    return render_template(
+        'reports.html',
+        report_type=job.report_type,
+        report_data=jobs.result(job),
+        job=None,
+        report_params=params,
+        parkings=Parking.query.order_by(Parking.address).all()
+    )
+
+
+# ================================
+#   ВЫГРУЗКА ОТЧЁТА (CSV / XLSX)
+# ================================
+EXPORT_FORMATS = {
+    'csv': (csv_stream, 'text/csv; charset=utf-8'),
+    'xlsx': (xlsx_stream, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+
+# сколько строк за раз забирать из серверного курсора
+EXPORT_BATCH = 1000
+
+
+@bp.route('/export', methods=['GET'])
+@login_required
+@replica.reads
+def export():
+    report_type = request.args.get('type')
+    start = request.args.get('start')
+    end = request.args.get('end')
+    parking_id = request.args.get('parking_id', type=int)
+    fmt = request.args.get('format', 'csv')
+
+    if report_type == 'analytics' and not analytics.available():
+        flash("Для аналитики установите пакет numpy", "danger")
+        return redirect(url_for('reports.view', type=report_type))
+
+    if report_type not in REPORTS or fmt not in EXPORT_FORMATS:
+        flash("Неизвестный тип отчёта или формат выгрузки", "danger")
+        return redirect(url_for('reports.view', type=report_type))
+
+    try:
+        start_date = datetime.strptime(start, '%Y-%m-%d')
+        end_date = datetime.strptime(end, '%Y-%m-%d')
+    except (TypeError, ValueError):
+        flash("Некорректный формат даты", "danger")
+        return redirect(url_for('reports.view', type=report_type))
+
+    if start_date > end_date:
+        flash("Дата начала позже окончания", "danger")
+        return redirect(url_for('reports.view', type=report_type))
+
+    columns, build_query, to_row = REPORTS[report_type]
+    writer, mimetype = EXPORT_FORMATS[fmt]
+
+    def rows():
+        # yield_per включает stream_results: строки идут из серверного курсора
+        # пачками, и первая пачка уходит клиенту до окончания запроса.
+        # Запрос строится здесь, а не во view: сессия view закрывается с концом
+        # запроса, и курсор на ней занял бы соединение из пула до сборки мусора
+        query = build_query(start_date, end_date, parking_id)
+        if isinstance(query, Query):
+            query = query.yield_per(EXPORT_BATCH)
+        totals = None
+        for r in query:
+            values = to_row(r)
+            if report_type == 'finance':
+                totals = [a + b for a, b in zip(totals, values[3:])] if totals else values[3:]
+            yield values
+
+        if totals:
+            yield ["Итого", "", ""] + totals
+
+    filename = f"{report_type}_{start}_{end}.{fmt}"
+    return Response(
+        stream_with_context(writer(columns, rows())),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
 # ================================
 #   ФУНКЦИИ ФОРМИРОВАНИЯ ОТЧЁТОВ
 # ================================
 
-def get_payments(start_date, end_date, parking_id):
-    """Отчёт по платежам"""
-    query = Payment.query.join(Booking).join(ParkingSpot).join(Parking)
+# сколько запросов к БД допускается на один отчёт: проверяет tests/test_report_queries.py,
+# на рабочей БД — flask reports check-budget
+QUERY_BUDGETS = {
+    'payments': 1,
+    'charges': 1,
+    'finance': 1,
+    'summary': 1,
+    'accruals': 1,
+    'analytics': 3,
+}
 
+
+def _period_filter(query, column_start, column_end, start_date, end_date, parking_id):
     if start_date:
-        query = query.filter(Payment.payment_date >= start_date)
+        query = query.filter(column_start >= start_date)
     if end_date:
-        query = query.filter(Payment.payment_date <= end_date)
+        query = query.filter(column_end <= end_date)
     if parking_id:
         query = query.filter(Parking.parking_id == parking_id)
+    return query
+
+
+def _money(value):
+    return f"{value:.2f}"
+
 
-    rows = query.order_by(Payment.payment_date).all()
+def _period(b_start, b_end):
+    return f"{b_start.strftime('%d.%m.%Y')} — {b_end.strftime('%d.%m.%Y')}"
 
-    table = {
-        "columns": ["Дата", "Арендатор", "Парковка", "Сумма"],
-        "rows": []
+
+def _as_text(values):
+    """Строка отчёта для HTML/CSV: суммы — с двумя знаками"""
+    return [v if isinstance(v, str) else _money(v) for v in values]
+
+
+# --- платежи ---
+
+PAYMENT_COLUMNS = ["Дата", "Арендатор", "Парковка", "Сумма"]
+
+
+def payments_query(start_date, end_date, parking_id):
+    P, B = archive.sources(start_date, Payment, Booking)
+    query = (
+        db.session.query(P.payment_date, Client.name, Parking.address, P.amount)
+        .select_from(P)
+        .join(B, B.booking_id == P.booking_id)
+        .join(ParkingSpot, ParkingSpot.spot_id == B.spot_id)
+        .join(Parking, Parking.parking_id == ParkingSpot.parking_id)
+        .outerjoin(Client, Client.client_id == B.client_id)
+    )
+    query = _period_filter(query, P.payment_date, P.payment_date,
+                           start_date, end_date, parking_id)
+    return query.order_by(P.payment_date)
+
+
+def payment_row(row):
+    payment_date, client_name, address, amount = row
+    return [
+        payment_date.strftime("%d.%m.%Y"),
+        client_name or "—",
+        address or "—",
+        amount
+    ]
+
+
+def get_payments(start_date, end_date, parking_id):
+    """Отчёт по платежам"""
+    rows = payments_query(start_date, end_date, parking_id).all()
+
+    return {
+        "columns": PAYMENT_COLUMNS,
+        "rows": [_as_text(payment_row(r)) for r in rows]
     }
 
-    for p in rows:
-        table["rows"].append([
-            p.payment_date.strftime("%d.%m.%Y"),
-            p.booking.client.name if p.booking.client else "—",
-            p.booking.spot.parking.address if p.booking.spot else "—",
-            f"{p.amount:.2f}"
-        ])
 
-    return table
+# --- начисления ---
+
+CHARGE_COLUMNS = ["Период", "Арендатор", "Парковка", "Начислено"]
+
+
+def charges_query(start_date, end_date, parking_id):
+    B = archive.source(Booking, start_date)
+    query = (
+        db.session.query(B.start_date, B.end_date, Client.name,
+                         Parking.address, B.rent_size)
+        .join(ParkingSpot, ParkingSpot.spot_id == B.spot_id)
+        .join(Parking, Parking.parking_id == ParkingSpot.parking_id)
+        .outerjoin(Client, Client.client_id == B.client_id)
+    )
+    query = _period_filter(query, B.start_date, B.end_date,
+                           start_date, end_date, parking_id)
+    return query.order_by(B.start_date)
+
+
+def charge_row(row):
+    b_start, b_end, client_name, address, rent_size = row
+    return [
+        _period(b_start, b_end),
+        client_name or "—",
+        address or "—",
+        rent_size or 0
+    ]
 
 
 def get_charges(start_date, end_date, parking_id):
     """Отчёт по начислениям"""
-    query = Booking.query.join(ParkingSpot).join(Parking)
+    rows = charges_query(start_date, end_date, parking_id).all()
+
+    return {
+        "columns": CHARGE_COLUMNS,
+        "rows": [_as_text(charge_row(r)) for r in rows]
+    }
+
+
+# --- финансы ---
+
+FINANCE_COLUMNS = ["Период", "Арендатор", "Адрес", "Начислено", "Оплачено", "Остаток"]
+
+
+def finance_query(start_date, end_date, parking_id):
+    """Бронирования (начисления) с суммой оплат из леджера брони"""
+    B = archive.source(Booking, start_date)
+    query = (
+        db.session.query(
+            B.start_date,
+            B.end_date,
+            Client.name,
+            Parking.address,
+            B.rent_size,
+            B.total_paid
+        )
+        .join(ParkingSpot, ParkingSpot.spot_id == B.spot_id)
+        .join(Parking, Parking.parking_id == ParkingSpot.parking_id)
+        .outerjoin(Client, Client.client_id == B.client_id)
+    )
+    query = _period_filter(query, B.start_date, B.end_date,
+                           start_date, end_date, parking_id)
+
+    return query.order_by(B.start_date, B.booking_id)
+
+
+def finance_row(row):
+    b_start, b_end, client_name, address, rent_size, paid = row
+    charged = rent_size or 0  # начислено
+    return [
+        _period(b_start, b_end),
+        client_name or "—",
+        address or "—",
+        charged,
+        paid,
+        charged - paid
+    ]
+
+
+def get_finance(start_date, end_date, parking_id):
+    """Финансовый отчёт: начислено – оплачено"""
+    rows = []
+    total_charged = 0
+    total_paid = 0
+
+    for r in finance_query(start_date, end_date, parking_id).all():
+        values = finance_row(r)
+
+        total_charged += values[3]
+        total_paid += values[4]
+
+        rows.append(_as_text(values))
+
+    return {
+        "columns": FINANCE_COLUMNS,
+        "rows": rows,
+        "total_charged": _money(total_charged),
+        "total_paid": _money(total_paid),
+        "total_balance": _money(total_charged - total_paid),
+    }
 
+
+# --- сводка по месяцам (только из monthly_rollup) ---
+
+SUMMARY_COLUMNS = ["Месяц", "Парковка", "Начислено", "Оплачено", "Расходы",
+                   "Занято мест", "Свободно мест", "Загрузка, %"]
+
+
+def summary_query(start_date, end_date, parking_id):
+    period = MonthlyRollup.year * 100 + MonthlyRollup.month
+
+    query = (
+        db.session.query(
+            MonthlyRollup.year,
+            MonthlyRollup.month,
+            Parking.address,
+            MonthlyRollup.charged,
+            MonthlyRollup.paid,
+            MonthlyRollup.expenses,
+            MonthlyRollup.occupied_spot_months,
+            MonthlyRollup.free_spot_months
+        )
+        .join(Parking, Parking.parking_id == MonthlyRollup.parking_id)
+    )
     if start_date:
-        query = query.filter(Booking.start_date >= start_date)
+        query = query.filter(period >= start_date.year * 100 + start_date.month)
     if end_date:
-        query = query.filter(Booking.end_date <= end_date)
+        query = query.filter(period <= end_date.year * 100 + end_date.month)
     if parking_id:
-        query = query.filter(Parking.parking_id == parking_id)
+        query = query.filter(MonthlyRollup.parking_id == parking_id)
 
-    rows = query.order_by(Booking.start_date).all()
+    return query.order_by(MonthlyRollup.year, MonthlyRollup.month, Parking.address)
 
-    table = {
-        "columns": ["Период", "Арендатор", "Парковка", "Начислено"],
-        "rows": []
+
+def summary_row(row):
+    year, month, address, charged, paid, expenses, occupied, free = row
+    spots = occupied + free
+    return [
+        f"{month:02d}.{year}",
+        address,
+        charged,
+        paid,
+        expenses,
+        str(occupied),
+        str(free),
+        f"{(100 * occupied / spots if spots else 0):.1f}"
+    ]
+
+
+def get_summary(start_date, end_date, parking_id):
+    """Сводный отчёт по месяцам — без обращения к броням и платежам"""
+    rows = summary_query(start_date, end_date, parking_id).all()
+
+    return {
+        "columns": SUMMARY_COLUMNS,
+        "rows": [_as_text(summary_row(r)) for r in rows]
     }
 
-    for b in rows:
-        period = f"{b.start_date.strftime('%d.%m.%Y')} — {b.end_date.strftime('%d.%m.%Y')}"
-        table["rows"].append([
-            period,
-            b.client.name if b.client else "—",
-            b.spot.parking.address if b.spot else "—",
-            f"{(b.rent_size or 0):.2f}"
-        ])
 
-    return table
+# --- начисления по месяцам (таблица accrual, flask accruals run) ---
 
+ACCRUAL_COLUMNS = ["Месяц", "Парковка", "Место", "Арендатор", "Аренда", "Коммунальные", "Начислено"]
 
-def get_finance(start_date, end_date, parking_id):
-    """Финансовый отчёт: начислено – оплачено"""
 
-    # --- получаем бронирования (начисления) ---
-    b_query = Booking.query.join(ParkingSpot).join(Parking)
+def accruals_query(start_date, end_date, parking_id):
+    period = Accrual.year * 100 + Accrual.month
 
+    query = (
+        db.session.query(
+            Accrual.year,
+            Accrual.month,
+            Parking.address,
+            ParkingSpot.number,
+            Client.name,
+            Accrual.rent,
+            Accrual.utilities,
+            Accrual.amount
+        )
+        .outerjoin(Parking, Parking.parking_id == Accrual.parking_id)
+        .outerjoin(ParkingSpot, ParkingSpot.spot_id == Accrual.spot_id)
+        .outerjoin(Client, Client.client_id == Accrual.client_id)
+    )
     if start_date:
-        b_query = b_query.filter(Booking.start_date >= start_date)
+        query = query.filter(period >= start_date.year * 100 + start_date.month)
     if end_date:
-        b_query = b_query.filter(Booking.end_date <= end_date)
+        query = query.filter(period <= end_date.year * 100 + end_date.month)
     if parking_id:
-        b_query = b_query.filter(Parking.parking_id == parking_id)
+        query = query.filter(Accrual.parking_id == parking_id)
 
-    bookings = b_query.all()
+    return query.order_by(Accrual.year, Accrual.month, Parking.address, ParkingSpot.number, Accrual.booking_id)
 
-    rows = []
-    total_charged = 0
-    total_paid = 0
 
-    for b in bookings:
-        charged = b.rent_size or 0  # начислено
+def accrual_row(row):
+    year, month, address, number, client_name, rent, utilities, amount = row
+    return [
+        f"{month:02d}.{year}",
+        address or "—",
+        f"№{number}" if number else "—",
+        client_name or "—",
+        rent,
+        utilities,
+        amount
+    ]
+
+
+def get_accruals(start_date, end_date, parking_id):
+    """Отчёт по сгенерированным помесячным начислениям"""
+    rows = accruals_query(start_date, end_date, parking_id).all()
+
+    return {
+        "columns": ACCRUAL_COLUMNS,
+        "rows": [_as_text(accrual_row(r)) for r in rows]
+    }
+
 
-        # сумма платежей по этому бронированию
-        paid = sum(p.amount for p in b.payments) if b.payments else 0
+# --- аналитика: загрузка, выручка, отток, сезонность (services/analytics.py) ---
 
-        balance = charged - paid
+ANALYTICS_COLUMNS = ["Месяц", "Парковка", "Мест", "Загрузка, %", "Выручка по дням",
+                     "Оплачено", "Выручка на место", "Новых броней", "Ушло арендаторов",
+                     "Отток, %", "Сезонность"]
 
-        total_charged += charged
-        total_paid += paid
 
-        rows.append([
-            f"{b.start_date.strftime('%d.%m.%Y')} — {b.end_date.strftime('%d.%m.%Y')}",
-            b.client.name if b.client else "—",
-            b.spot.parking.address if b.spot else "—",
-            f"{charged:.2f}",
-            f"{paid:.2f}",
-            f"{balance:.2f}"
-        ])
+def analytics_query(start_date, end_date, parking_id):
+    """Строки аналитики: месяцы × парковки, затем итог по парковкам за период"""
+    k = analytics.kpis(db.session.connection(), start_date.date(), end_date.date(), parking_id)
+    rows = []
+
+    for m, (year, month) in enumerate(k.months):
+        for p, (_, address, spots) in enumerate(k.parkings):
+            rows.append((f"{month:02d}.{year}", address, spots, k.capacity[p, m], k.occupied[p, m],
+                         k.revenue[p, m], k.paid[p, m], k.new_bookings[p, m], k.active[p, m],
+                         k.churned[p, m], k.seasonality[p, m]))
+
+    for p, (_, address, spots) in enumerate(k.parkings):
+        rows.append(("Весь период", address, spots, k.capacity[p].sum(), k.occupied[p].sum(),
+                     k.revenue[p].sum(), k.paid[p].sum(), k.new_bookings[p].sum(), k.bookings[p],
+                     k.churned[p].sum(), 1.0))
+    return rows
+
+
+def analytics_row(row):
+    label, address, spots, capacity, occupied, revenue, paid, new, active, churned, season = row
+    return [
+        label,
+        address,
+        str(spots),
+        f"{(100 * occupied / capacity if capacity else 0):.1f}",
+        Decimal(f"{revenue:.2f}"),
+        Decimal(f"{paid:.2f}"),
+        Decimal(f"{(revenue / spots if spots else 0):.2f}"),
+        str(int(new)),
+        str(int(churned)),
+        f"{(100 * churned / active if active else 0):.1f}",
+        f"{season:.2f}",
+    ]
+
+
+def get_analytics(start_date, end_date, parking_id):
+    """Аналитика загрузки и выручки — векторные расчёты в NumPy"""
+    rows = analytics_query(start_date, end_date, parking_id)
 
     return {
-        "columns": ["Период", "Арендатор", "Адрес", "Начислено", "Оплачено", "Остаток"],
-        "rows": rows,
-        "total_charged": f"{total_charged:.2f}",
-        "total_paid": f"{total_paid:.2f}",
-        "total_balance": f"{(total_charged - total_paid):.2f}",
-    }
\ No newline at end of file
+        "columns": ANALYTICS_COLUMNS,
+        "rows": [_as_text(analytics_row(r)) for r in rows]
+    }
+
+
+# тип отчёта → (колонки, запрос, преобразование строки); используется выгрузкой
+REPORTS = {
+    'payments': (PAYMENT_COLUMNS, payments_query, payment_row),
+    'charges': (CHARGE_COLUMNS, charges_query, charge_row),
+    'finance': (FINANCE_COLUMNS, finance_query, finance_row),
+    'summary': (SUMMARY_COLUMNS, summary_query, summary_row),
+    'accruals': (ACCRUAL_COLUMNS, accruals_query, accrual_row),
+    'analytics': (ANALYTICS_COLUMNS, analytics_query, analytics_row),
+}
+
+# тип отчёта → функция, строящая данные страницы; используется страницей и фоновыми заданиями
+BUILDERS = {
+    'payments': get_payments,
+    'charges': get_charges,
+    'finance': get_finance,
+    'summary': get_summary,
+    'accruals': get_accruals,
+    'analytics': get_analytics,
+}
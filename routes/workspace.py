@@ -1,9 +1,16 @@
 # app/routes/workspace.py
-from datetime import date, datetime, timedelta
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+import io
+from datetime import MAXYEAR, MINYEAR, date, datetime, timedelta
+from flask import Blueprint, Response, current_app, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required
-from sqlalchemy.orm import joinedload
+from markupsafe import Markup
+from sqlalchemy import exists, or_, and_
+from sqlalchemy.exc import IntegrityError
 from models import db, Parking, ParkingSpot, Booking, Client, Payment
+from services.occupancy import load_spots, load_spots_page, build_grid
+from services.availability import Availability
+from services import search, importer, overlap, gridsync, pubsub, archive, replica
+from services.cache import grid_cache
 
 bp = Blueprint('workspace', __name__, url_prefix='/workspace')
 
@@ -13,12 +20,16 @@ bp = Blueprint('workspace', __name__, url_prefix='/workspace')
 # ================================================================
 @bp.route('/', methods=['GET'])
 @login_required
+@replica.reads
 def view():
     selected_parking_id = request.args.get('parking_id', type=int)
     year_offset = request.args.get('year_offset', type=int, default=0)
 
     today = date.today()
     target_year = today.year + year_offset
+    if target_year not in GRID_YEARS:
+        flash("Некорректный год", "danger")
+        year_offset, target_year = 0, today.year
 
     months = [
         'Январь', 'Февраль', 'Март', 'Апрель', 'Май', 'Июнь',
@@ -27,64 +38,22 @@ def view():
 
     parkings = Parking.query.order_by(Parking.address).all()
 
-    query = ParkingSpot.query.options(
-        joinedload(ParkingSpot.bookings).joinedload(Booking.client),
-        joinedload(ParkingSpot.parking)
-    )
-
-    if selected_parking_id:
-        query = query.filter_by(parking_id=selected_parking_id)
+    # версия до отрисовки: изменения, успевшие попасть в строки, страница
+    # просто получит ещё раз при первой синхронизации
+    grid_version = gridsync.current_version(selected_parking_id, target_year)
 
-    spots = query.order_by(ParkingSpot.number).all()
-
-    # === 1) Загружаем суммы оплат по каждому бронированию ===
-    payments = (
-        db.session.query(Payment.booking_id, db.func.sum(Payment.amount))
-        .group_by(Payment.booking_id)
-        .all()
-    )
-    payments_dict = {b_id: total or 0 for b_id, total in payments}
-
-    # === 2) Проставляем sum_paid каждому booking ===
-    for spot in spots:
-        for b in spot.bookings:
-            b.sum_paid = payments_dict.get(b.booking_id, 0)
-        spot.bookings_by_month = {}
-
-        for month_index in range(1, 13):
-            month_start = date(target_year, month_index, 1)
-            month_end = (
-                date(target_year + 1, 1, 1) - timedelta(days=1)
-                if month_index == 12 else
-                date(target_year, month_index + 1, 1) - timedelta(days=1)
-            )
-
-            active_booking = None
-            for b in spot.bookings:
-                if b.start_date <= month_end and b.end_date >= month_start:
-                    active_booking = b
-                    break
-
-            # === 4) Устанавливаем статус ===
-            if active_booking:
-                if active_booking.sum_paid >= (active_booking.rent_size or 0):
-                    active_booking.status = "занято"
-                else:
-                    active_booking.status = "забронировано"
-
-            # обновляем статус парковочного места (только для отображения)
-            if active_booking:
-                spot.status = active_booking.status
-            else:
-                spot.status = "свободно"
-
-            # ВАЖНО — ДОЛЖНО БЫТЬ ВНУТРИ ЦИКЛА
-            spot.bookings_by_month[month_index] = active_booking
+    # без JS «Следующие места» ведёт сюда же с курсором
+    after = _grid_cursor()
+    grid_rows = _render_grid_page(selected_parking_id, target_year, after, grid_version)
 
     return render_template(
         'workspace.html',
         parkings=parkings,
-        spots=spots,
+        grid_rows=grid_rows,
+        grid_version=grid_version,
+        is_first_page=after is None,
+        push_enabled=pubsub.enabled(),
+        poll_seconds=current_app.config.get('GRID_POLL_SECONDS', 30),
         selected_parking_id=selected_parking_id,
         year_offset=year_offset,
         current_year=target_year,
@@ -94,6 +63,143 @@ def view():
         date=date
     )
 
+
+# мест на странице шахматки; следующие подгружаются при прокрутке (/workspace/rows)
+GRID_PAGE_SIZE = 100
+
+# годы, для которых строится шахматка: сетка обращается и к соседним годам
+GRID_YEARS = range(MINYEAR + 1, MAXYEAR)
+
+
+def _grid_year():
+    """Год шахматки из запроса (по умолчанию текущий); None — вне GRID_YEARS"""
+    year = request.args.get('year', type=int) or date.today().year
+    return year if year in GRID_YEARS else None
+
+
+def _grid_cursor():
+    """Курсор страницы мест из запроса: последнее (номер, id) предыдущей страницы"""
+    after_number = request.args.get('after_number')
+    after_id = request.args.get('after_id', type=int)
+    if after_number is None or after_id is None:
+        return None
+    return {"after_number": after_number, "after_id": after_id}
+
+
+def _render_grid_page(parking_id, year, after, version=None):
+    """HTML строк одной страницы мест (с кэшем); в конце — строка-ссылка на следующую"""
+    def render_rows():
+        spots, next_cursor = load_spots_page(parking_id, after, GRID_PAGE_SIZE)
+        return render_template(
+            '_grid_rows.html',
+            spots=spots,
+            grid=build_grid(year, parking_id, spot_ids=[s.spot_id for s in spots]) if spots else {},
+            next_cursor=next_cursor,
+            selected_parking_id=parking_id,
+            current_year=year,
+            year_offset=year - date.today().year,
+            timedelta=timedelta,
+            date=date
+        )
+
+    # строки таблицы не меняются до записи в брони/платежи этой парковки и года.
+    # Версия журнала — в ключе всегда: поколения сбрасывает только воркер,
+    # сделавший коммит, а с бэкендом memory остальные воркеры иначе отдавали бы
+    # старую сетку до конца TTL; то же для реплики, отстающей от коммита
+    extra = f"{after['after_id']}:{after['after_number']}" if after else ''
+    if version is None:
+        version = gridsync.current_version(parking_id, year)
+    extra += f":v{version}"
+    return Markup(grid_cache.get_or_render(parking_id, year, render_rows, extra=extra))
+
+
+@bp.route('/rows', methods=['GET'])
+@login_required
+@replica.reads
+def grid_rows():
+    """Следующая страница строк шахматки — фрагмент <tr> для подгрузки при прокрутке"""
+    parking_id = request.args.get('parking_id', type=int)
+    year = _grid_year()
+    if year is None:
+        return Response("Некорректный год", status=400)
+    return _render_grid_page(parking_id, year, _grid_cursor())
+
+
+# ================================================================
+#   ШАХМАТКА В JSON (ETag + дельта-синхронизация)
+# ================================================================
+@bp.route('/grid.json', methods=['GET'])
+@login_required
+@replica.reads
+def grid_json():
+    parking_id = request.args.get('parking_id', type=int)
+    year = _grid_year()
+    if year is None:
+        return jsonify({"error": "Некорректный год"}), 400
+    since = request.args.get('since', type=int)
+
+    # версию берём до построения сетки: если между ними успеет пройти коммит,
+    # клиент просто получит его ещё раз при следующей синхронизации
+    version = gridsync.current_version(parking_id, year)
+    etag = f"grid-{parking_id or 'all'}-{year}-v{version}"
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    changed = gridsync.changed_since(parking_id, year, since) if since is not None else None
+
+    payload = {
+        "version": version,
+        "year": year,
+        "parking_id": parking_id,
+        "months": 12,
+    }
+
+    if changed is None:
+        payload["full"] = True
+        payload["spots"] = gridsync.columnar_spots(load_spots(parking_id))
+        payload["cells"] = gridsync.columnar_cells(build_grid(year, parking_id))
+    else:
+        spot_ids = sorted({spot_id for spot_id, _ in changed})
+        grid = build_grid(year, parking_id, spot_ids=spot_ids) if spot_ids else {}
+        payload["full"] = False
+        payload["since"] = since
+        # изменённые ячейки, которых нет в cells, стали свободными
+        payload["changed"] = {
+            "spot_id": [spot_id for spot_id, _ in sorted(changed)],
+            "month": [month for _, month in sorted(changed)],
+        }
+        payload["cells"] = gridsync.columnar_cells(grid, only=changed)
+
+    response = jsonify(payload)
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
+
+
+@bp.route('/stream', methods=['GET'])
+@login_required
+def stream():
+    """Изменения шахматки (server-sent events); 204 — рассылка выключена"""
+    if not pubsub.enabled():
+        return Response(status=204)
+
+    # без stream_with_context: открытое соединение не держит контекст и сессию БД
+    return Response(
+        pubsub.sse(pubsub.subscribe()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@bp.route('/cache/stats', methods=['GET'])
+@login_required
+def cache_stats():
+    return jsonify(grid_cache.stats())
+
+
 # ================================================================
 @bp.route('/client/<int:client_id>', methods=['GET', 'POST'])
 @login_required
@@ -134,6 +240,11 @@ def client_card(client_id):
             flash("Дата начала должна быть раньше окончания.", "danger")
             return redirect(request.url)
 
+        if archive.rejects(start_date, end_date, previous_start=booking.start_date if booking else None):
+            flash(f"Период по {archive.closed_through()} год закрыт и перенесён в архив — "
+                  "бронь не может заканчиваться в нём или переноситься в него.", "danger")
+            return redirect(request.url)
+
         # выбираем арендатора
         if existing_client_id:
             client = Client.query.get(existing_client_id)
@@ -141,44 +252,65 @@ def client_card(client_id):
             flash("Нужно выбрать арендатора.", "danger")
             return redirect(request.url)
 
-        # ===== обновление или создание бронирования =====
-        if booking:
-            booking.spot_id = spot_id
-            booking.start_date = start_date
-            booking.end_date = end_date
-            booking.rent_size = rent
-            booking.notes = notes
-        else:
-            booking = Booking(
-                spot_id=spot_id,
-                client_id=client.client_id,
-                start_date=start_date,
-                end_date=end_date,
-                rent_size=rent,
-                status="занято"
+        # ===== место должно быть свободно в этот период =====
+        conflict = overlap.find_conflict(
+            spot_id, start_date, end_date,
+            exclude_booking_id=booking.booking_id if booking else None
+        )
+        if conflict:
+            flash(
+                f"Место уже занято: бронь {conflict.start_date.strftime('%d.%m.%Y')} — "
+                f"{conflict.end_date.strftime('%d.%m.%Y')}.",
+                "danger"
             )
-            db.session.add(booking)
-            db.session.flush()
-
-        # ====== платеж ======
-        if payment_amount:
-            if payment:
-                payment.amount = payment_amount
-                payment.payment_date = (
-                    datetime.strptime(payment_date_raw, "%Y-%m-%d").date()
-                    if payment_date_raw else payment.payment_date
-                )
+            return redirect(request.url)
+
+        try:
+            # ===== обновление или создание бронирования =====
+            if booking:
+                booking.spot_id = spot_id
+                booking.start_date = start_date
+                booking.end_date = end_date
+                booking.rent_size = rent
+                booking.notes = notes
             else:
-                db.session.add(Payment(
-                    booking_id=booking.booking_id,
-                    amount=payment_amount,
-                    payment_date=(
+                booking = Booking(
+                    spot_id=spot_id,
+                    client_id=client.client_id,
+                    start_date=start_date,
+                    end_date=end_date,
+                    rent_size=rent,
+                    status="занято"
+                )
+                db.session.add(booking)
+                db.session.flush()
+
+            # ====== платеж ======
+            if payment_amount:
+                if payment:
+                    payment.amount = payment_amount
+                    payment.payment_date = (
                         datetime.strptime(payment_date_raw, "%Y-%m-%d").date()
-                        if payment_date_raw else date.today()
+                        if payment_date_raw else payment.payment_date
                     )
-                ))
-
-        db.session.commit()
+                else:
+                    db.session.add(Payment(
+                        booking_id=booking.booking_id,
+                        amount=payment_amount,
+                        payment_date=(
+                            datetime.strptime(payment_date_raw, "%Y-%m-%d").date()
+                            if payment_date_raw else date.today()
+                        )
+                    ))
+
+            db.session.commit()
+        except IntegrityError as e:
+            # параллельная запись успела занять место (ограничение booking_no_overlap)
+            db.session.rollback()
+            if not overlap.is_overlap_violation(e):
+                raise
+            flash("Место только что заняли в этот период — выберите другие даты.", "danger")
+            return redirect(request.url)
 
         flash("Бронирование сохранено.", "success")
         return redirect(url_for('workspace.view'))
@@ -208,14 +340,54 @@ def client_card(client_id):
         pre_payment_date = ""
         is_edit = False
 
-    spots_list = ParkingSpot.query.order_by(ParkingSpot.number).all()
-    clients_list = Client.query.order_by(Client.name).all()
+    spots_list = load_spots()
+
+    # ====== занятость мест в выбранный период (с точностью до дня) ======
+    busy_spot_ids = set()
+    try:
+        period_start = date.fromisoformat(pre_start) if pre_start else None
+        period_end = date.fromisoformat(pre_end) if pre_end else None
+    except ValueError:
+        period_start = period_end = None
+
+    if period_start and period_end and period_start <= period_end:
+        index = Availability.for_period(
+            spots_list, period_start, period_end,
+            exclude_booking_id=booking.booking_id if booking else None
+        )
+        busy_spot_ids = index.busy_spot_ids(period_start, period_end)
+
+        if not is_edit:
+            if pre_spot_id is None:
+                # место не выбрано — предлагаем первое свободное
+                free = index.free_spots(period_start, period_end)
+                pre_spot_id = free[0].spot_id if free else None
+            elif pre_spot_id in busy_spot_ids:
+                # место занято часть периода — сдвигаем на ближайшее окно той же длины
+                window = index.next_free(
+                    pre_spot_id, period_start, (period_end - period_start).days + 1
+                )
+                if window:
+                    pre_start, pre_end = window[0].isoformat(), window[1].isoformat()
+                    busy_spot_ids = index.busy_spot_ids(*window)
+                    flash(
+                        f"Место занято в выбранный период — предложено ближайшее свободное окно "
+                        f"{window[0].strftime('%d.%m.%Y')} — {window[1].strftime('%d.%m.%Y')}.",
+                        "info"
+                    )
+
+    # первые арендаторы по алфавиту; остальных находит поиск в форме
+    clients_list = search.search_clients('', limit=search.MAX_LIMIT)
+    if client and client not in clients_list:
+        clients_list.insert(0, client)
 
     return render_template(
         'client_card.html',
         client=client,
         spots_list=spots_list,
+        busy_spot_ids=busy_spot_ids,
         clients_list=clients_list,
+        booking_id=booking.booking_id if booking else None,
 
         pre_spot_id=pre_spot_id,
         pre_start=pre_start,
@@ -232,43 +404,139 @@ def client_card(client_id):
 # ================================================================
 #   СПИСОК АРЕНДАТОРОВ
 # ================================================================
+CLIENTS_PAGE_SIZE = 50
+
+
 @bp.route('/clients')
 @login_required
+@replica.reads
 def clients():
     q = request.args.get('q', '').strip()
     sort = request.args.get('sort', '')
     flt = request.args.get('filter', '')
 
+    # курсор страницы: последнее (ФИО, id) предыдущей страницы
+    after_name = request.args.get('after_name')
+    after_id = request.args.get('after_id', type=int)
+
     query = Client.query
 
     # === Поиск ===
     if q:
-        query = query.filter(
-            (Client.name.ilike(f"%{q}%")) |
-            (Client.phone.ilike(f"%{q}%"))
+        query = query.filter(search.client_filter(q))
+
+    # === Фильтр по активным броням — EXISTS в SQL ===
+    if flt in ("active", "inactive"):
+        today = date.today()
+        has_active = exists().where(
+            Booking.client_id == Client.client_id,
+            Booking.start_date <= today,
+            Booking.end_date >= today
         )
+        query = query.filter(has_active if flt == "active" else ~has_active)
+
+    # === Сортировка + keyset-пагинация по (ФИО, id) ===
+    descending = sort == "desc"
 
-    # === Сортировка ===
-    if sort == "desc":
-        query = query.order_by(Client.name.desc())
+    if after_name is not None and after_id is not None:
+        if descending:
+            query = query.filter(or_(
+                Client.name < after_name,
+                and_(Client.name == after_name, Client.client_id < after_id)
+            ))
+        else:
+            query = query.filter(or_(
+                Client.name > after_name,
+                and_(Client.name == after_name, Client.client_id > after_id)
+            ))
+
+    if descending:
+        query = query.order_by(Client.name.desc(), Client.client_id.desc())
     else:
-        query = query.order_by(Client.name.asc())
+        query = query.order_by(Client.name.asc(), Client.client_id.asc())
 
-    clients = query.all()
+    # берём на одну запись больше, чтобы понять, есть ли следующая страница
+    clients = query.limit(CLIENTS_PAGE_SIZE + 1).all()
 
-    # === Фильтр (требует активных броней) ===
-    if flt:
-        today = date.today()
-        if flt == "active":
-            clients = [c for c in clients if any(
-                b.start_date <= today <= b.end_date for b in c.bookings
-            )]
-        elif flt == "inactive":
-            clients = [c for c in clients if not any(
-                b.start_date <= today <= b.end_date for b in c.bookings
-            )]
+    next_cursor = None
+    if len(clients) > CLIENTS_PAGE_SIZE:
+        clients = clients[:CLIENTS_PAGE_SIZE]
+        next_cursor = {"after_name": clients[-1].name, "after_id": clients[-1].client_id}
+
+    return render_template(
+        'clients.html',
+        clients=clients,
+        next_cursor=next_cursor,
+        is_first_page=after_id is None,
+        date=date
+    )
+
+
+# ================================================================
+#   ПОИСК АРЕНДАТОРОВ (подсказки при вводе)
+# ================================================================
+@bp.route('/clients/search')
+@login_required
+@replica.reads
+def clients_search():
+    q = request.args.get('q', '').strip()
+    limit = request.args.get('limit', type=int, default=20)
 
-    return render_template('clients.html', clients=clients, date=date)
+    return jsonify([
+        {"client_id": c.client_id, "name": c.name, "phone": c.phone or ""}
+        for c in search.search_clients(q, limit=limit)
+    ])
+
+
+# ================================================================
+#   СВОБОДНЫЕ МЕСТА НА ПЕРИОД
+# ================================================================
+@bp.route('/availability')
+@login_required
+@replica.reads
+def availability():
+    try:
+        start = datetime.strptime(request.args.get('start', ''), '%Y-%m-%d').date()
+        end = datetime.strptime(request.args.get('end', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({"error": "Некорректный формат даты"}), 400
+
+    if start > end:
+        return jsonify({"error": "Дата начала позже окончания"}), 400
+
+    parking_id = request.args.get('parking_id', type=int)
+    spot_id = request.args.get('spot_id', type=int)
+
+    spots = load_spots(parking_id, spot_id)
+
+    index = Availability.for_period(
+        spots, start, end,
+        exclude_booking_id=request.args.get('exclude_booking_id', type=int)
+    )
+    days = (end - start).days + 1
+
+    free, busy = [], []
+    for s in spots:
+        item = {
+            "spot_id": s.spot_id,
+            "number": s.number,
+            "address": s.parking.address if s.parking else "",
+        }
+        if index.is_free(s.spot_id, start, end):
+            free.append(item)
+        else:
+            # ближайшее окно той же длины на этом месте
+            window = index.next_free(s.spot_id, start, days)
+            item["next_start"] = window[0].isoformat() if window else None
+            item["next_end"] = window[1].isoformat() if window else None
+            busy.append(item)
+
+    return jsonify({
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "free": free,
+        "busy": busy,
+    })
 
 
 # ================================================================
@@ -385,4 +653,31 @@ def add_spot():
         flash("Место добавлено.", "success")
         return redirect(url_for('workspace.view'))
 
-    return render_template('add_spot.html', parkings=parkings)
\ No newline at end of file
+    return render_template('add_spot.html', parkings=parkings)
+
+
+# ================================================================
+#   МАССОВЫЙ ИМПОРТ (CSV)
+# ================================================================
+@bp.route('/import', methods=['GET', 'POST'])
+@login_required
+def import_data():
+    report = None
+
+    if request.method == 'POST':
+        kind = request.form.get('kind')
+        upload = request.files.get('file')
+
+        if kind not in importer.KINDS or not upload or not upload.filename:
+            flash("Выберите тип данных и CSV-файл.", "danger")
+            return redirect(request.url)
+
+        stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+        report = importer.run(kind, stream)
+
+        flash(
+            f"Импортировано {report.inserted} из {report.rows}, ошибок: {len(report.errors)}.",
+            "success" if not report.errors else "warning"
+        )
+
+    return render_template('import.html', report=report, kinds=importer.KINDS)
\ No newline at end of file
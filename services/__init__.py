@@ -0,0 +1 @@
+# app/services — прикладная логика, общая для нескольких blueprints
@@ -0,0 +1,103 @@
+# app/services/accruals.py
+"""
+Помесячные начисления (таблица accrual).
+
+Закрытие месяца — один INSERT … SELECT: каждой брони, действующей в
+месяце хотя бы день, — строка «аренда + коммунальные» (как и начисления
+в monthly_rollup, месяц начисляется целиком). Брони закрытых лет берутся
+вместе с архивом (services/archive.py).
+
+Повторный запуск безопасен: строки, которые уже есть (уникальный ключ
+бронь + месяц), не вставляются, а закрытый месяц пропускается целиком.
+Каждый месяц — отдельная транзакция вместе с отметкой в accrual_run,
+поэтому прерванный прогон за период продолжается с первого незакрытого
+месяца. refresh=True пересчитывает закрытый месяц заново (после
+исправления броней задним числом).
+"""
+from datetime import date, datetime
+
+from sqlalchemy import select, insert, update, delete, func, literal, exists
+from sqlalchemy.exc import IntegrityError
+
+from models import Accrual, AccrualRun, Booking, ParkingSpot
+from services import archive
+from services.changes import month_bounds, month_range
+
+COLUMNS = ['year', 'month', 'booking_id', 'parking_id', 'spot_id', 'client_id',
+           'rent', 'utilities', 'amount', 'created_at']
+
+
+def previous_month(today=None):
+    today = today or date.today()
+    return (today.year - 1, 12) if today.month == 1 else (today.year, today.month - 1)
+
+
+def close_month(conn, year, month, refresh=False):
+    """
+    Начисления за месяц внутри транзакции conn. Возвращает число строк
+    месяца или None, если месяц уже закрыт и refresh не задан.
+    """
+    status = conn.scalar(
+        select(AccrualRun.status).where(AccrualRun.year == year, AccrualRun.month == month)
+    )
+    if status == 'done' and not refresh:
+        return None
+
+    now = datetime.utcnow()
+    if status is None:
+        # строка-отметка вставляется первой: параллельный запуск того же месяца
+        # упрётся в первичный ключ accrual_run
+        conn.execute(insert(AccrualRun).values(year=year, month=month, status='running', started_at=now))
+    else:
+        conn.execute(
+            update(AccrualRun).where(AccrualRun.year == year, AccrualRun.month == month)
+            .values(status='running', started_at=now, finished_at=None)
+        )
+
+    in_month = (Accrual.year == year) & (Accrual.month == month)
+    if refresh:
+        conn.execute(delete(Accrual).where(in_month))
+
+    start, end = month_bounds(year, month)
+    B = archive.source(Booking, start)
+    rent = func.coalesce(B.rent_size, 0)
+    utilities = func.coalesce(B.utilities, 0)
+
+    rows = (
+        select(literal(year), literal(month), B.booking_id, ParkingSpot.parking_id,
+               B.spot_id, B.client_id, rent, utilities, rent + utilities, literal(now))
+        .select_from(B)
+        .outerjoin(ParkingSpot, ParkingSpot.spot_id == B.spot_id)
+        .where(B.start_date <= end, B.end_date >= start)
+        .where(~exists().where(in_month, Accrual.booking_id == B.booking_id))
+    )
+    conn.execute(insert(Accrual).from_select(COLUMNS, rows))
+
+    total = conn.scalar(select(func.count()).select_from(Accrual).where(in_month))
+    conn.execute(
+        update(AccrualRun).where(AccrualRun.year == year, AccrualRun.month == month)
+        .values(status='done', row_count=total, finished_at=datetime.utcnow())
+    )
+    return total
+
+
+def close_months(engine, first, last, refresh=False, echo=print):
+    """
+    Закрыть месяцы first..last ((год, месяц) включительно), каждый в своей
+    транзакции. Возвращает {(год, месяц): строк} по закрытым в этот раз.
+    """
+    closed = {}
+    for year, month in month_range(date(*first, 1), date(*last, 1)):
+        try:
+            with engine.begin() as conn:
+                total = close_month(conn, year, month, refresh=refresh)
+        except IntegrityError:
+            echo(f"{month:02d}.{year}: уже закрывается другим процессом — пропущен")
+            continue
+
+        if total is None:
+            echo(f"{month:02d}.{year}: уже закрыт")
+        else:
+            closed[year, month] = total
+            echo(f"{month:02d}.{year}: начислений {total}")
+    return closed
@@ -0,0 +1,234 @@
+# app/services/analytics.py
+"""
+Аналитика загрузки и выручки по месяцам (отчёт «Аналитика»).
+
+Брони и платежи периода забираются одним запросом каждые в колоночном
+виде — матрицы NumPy из чисел (парковка, дни от 1970-01-01, суммы, id
+арендатора); в Postgres через COPY … TO STDOUT, без построения строк
+Python. Дальше всё считается векторно:
+
+  загрузка     — разностный массив «парковка × день» (+1 в день начала
+                 брони, −1 после её конца), накопленная сумма даёт занятые
+                 места на каждый день, np.add.reduceat — места·дни месяца;
+  выручка      — так же, но с весом «аренда / длина брони» в день;
+  оплачено     — np.bincount по (парковка, месяц платежа);
+  отток        — брони, отсортированные по (арендатор, начало): бронь
+                 считается уходом, если следующая бронь того же арендатора
+                 начинается позже чем через CHURN_GAP_DAYS дней (или её нет);
+  сезонность   — средняя загрузка календарного месяца за все годы периода
+                 относительно средней загрузки парковки за период.
+
+Число мест парковки — текущее (как и в monthly_rollup). Без NumPy
+отчёт недоступен (available()).
+"""
+import io
+from collections import namedtuple
+from datetime import date
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from sqlalchemy import select, func, extract
+
+from models import Parking, ParkingSpot, Booking, Payment
+from services import archive
+from services.changes import month_range
+
+EPOCH = date(1970, 1, 1)
+
+# бронь без продления в течение стольких дней после конца — арендатор ушёл
+CHURN_GAP_DAYS = 31
+
+# months — [(год, месяц)]; parkings — [(parking_id, адрес, мест)];
+# bookings — броней за период по парковкам; остальное — матрицы «парковка × месяц»
+# (seasonality — индекс календарного месяца)
+Kpis = namedtuple(
+    'Kpis',
+    'months parkings bookings days capacity occupied revenue paid new_bookings active churned seasonality'
+)
+
+
+def available():
+    return np is not None
+
+
+def _days(column):
+    """Дата → число дней от 1970-01-01 (целое и в Postgres, и в SQLite)"""
+    return extract('epoch', column) / 86400
+
+
+def _columns(conn, stmt, width):
+    """Результат запроса матрицей float64 «строки × width» (NULL не допускаются)"""
+    if conn.dialect.name == 'postgresql':
+        sql = stmt.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True})
+        buffer = io.StringIO()
+        cursor = conn.connection.driver_connection.cursor()
+        try:
+            cursor.copy_expert(f"COPY ({sql}) TO STDOUT WITH (FORMAT csv)", buffer)
+        finally:
+            cursor.close()
+        if not buffer.tell():
+            return np.empty((0, width))
+        buffer.seek(0)
+        return np.loadtxt(buffer, delimiter=',', dtype=np.float64, ndmin=2)
+
+    rows = conn.execute(stmt).all()
+    return np.array(rows, dtype=np.float64).reshape(-1, width)
+
+
+def _flat_index(rows, cols, n_cols):
+    return rows * n_cols + cols
+
+
+def kpis(conn, start, end, parking_id=None, today=None):
+    """Показатели за период start..end по месяцам и парковкам (три запроса к БД)"""
+    if np is None:
+        raise RuntimeError("Для аналитики установите пакет numpy")
+
+    if start > end:
+        # пустой период — пустой результат, как у остальных отчётов
+        empty = np.zeros((0, 0))
+        return Kpis([], [], np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64),
+                    empty, empty, empty, empty, empty, empty, empty, empty)
+
+    today = today or date.today()
+    months = list(month_range(start, end))
+    w0 = (start - EPOCH).days
+    n_days = (end - start).days + 1
+
+    # --- парковки и число мест ---
+    query = (
+        select(Parking.parking_id, Parking.address, func.count(ParkingSpot.spot_id))
+        .outerjoin(ParkingSpot, ParkingSpot.parking_id == Parking.parking_id)
+        .group_by(Parking.parking_id, Parking.address)
+        .order_by(Parking.address, Parking.parking_id)
+    )
+    if parking_id:
+        query = query.where(Parking.parking_id == parking_id)
+    parkings = conn.execute(query).all()
+
+    n_parks, n_months = len(parkings), len(months)
+    # parking_id → номер строки матриц (таблица подстановки вместо поиска)
+    park_ids = np.array([p[0] for p in parkings], dtype=np.int64)
+    park_lookup = np.zeros(park_ids.max(initial=0) + 1, dtype=np.int64)
+    park_lookup[park_ids] = np.arange(n_parks)
+
+    def park_index(values):
+        return park_lookup[values.astype(np.int64)]
+
+    # первый день каждого месяца (дни от начала периода) и дни месяцев внутри периода
+    month_starts = np.array([max((date(y, m, 1) - start).days, 0) for y, m in months], dtype=np.int64)
+    days_in_month = np.diff(np.append(month_starts, n_days))
+
+    month_of_day = np.repeat(np.arange(n_months), days_in_month)
+
+    def month_index(day_offsets):
+        return month_of_day[day_offsets]
+
+    B, P = archive.sources(start, Booking, Payment)
+
+    # --- брони: пересекающие период и начавшиеся вскоре после него (для оттока) ---
+    horizon = date.fromordinal(end.toordinal() + CHURN_GAP_DAYS)
+    query = (
+        select(ParkingSpot.parking_id, _days(B.start_date), _days(B.end_date),
+               func.coalesce(B.rent_size, 0), func.coalesce(B.client_id, -1))
+        .join(ParkingSpot, ParkingSpot.spot_id == B.spot_id)
+        .where(B.start_date <= horizon, B.end_date >= start, ParkingSpot.parking_id.is_not(None))
+    )
+    if parking_id:
+        query = query.where(ParkingSpot.parking_id == parking_id)
+    bookings = _columns(conn, query, 5) if n_parks else np.empty((0, 5))
+
+    # --- платежи периода ---
+    query = (
+        select(ParkingSpot.parking_id, _days(P.payment_date), P.amount)
+        .join(B, B.booking_id == P.booking_id)
+        .join(ParkingSpot, ParkingSpot.spot_id == B.spot_id)
+        .where(P.payment_date >= start, P.payment_date <= end, P.amount.is_not(None),
+               ParkingSpot.parking_id.is_not(None))
+    )
+    if parking_id:
+        query = query.where(ParkingSpot.parking_id == parking_id)
+    payments = _columns(conn, query, 3) if n_parks else np.empty((0, 3))
+
+    b_park = park_index(bookings[:, 0])
+    b_start = bookings[:, 1].astype(np.int64) - w0
+    b_end = bookings[:, 2].astype(np.int64) - w0
+    rent = bookings[:, 3]
+    client = bookings[:, 4].astype(np.int64)
+
+    # --- загрузка и выручка: разностные массивы «парковка × день» ---
+    first = np.clip(b_start, 0, n_days)
+    after_last = np.clip(b_end + 1, 0, n_days)  # день после конца брони
+    live = after_last > first
+
+    size = n_parks * (n_days + 1)
+    opens = _flat_index(b_park[live], first[live], n_days + 1)
+    closes = _flat_index(b_park[live], after_last[live], n_days + 1)
+    daily_rate = rent[live] / (b_end[live] - b_start[live] + 1)
+
+    occupied_daily = np.cumsum(
+        (np.bincount(opens, minlength=size) - np.bincount(closes, minlength=size))
+        .reshape(n_parks, n_days + 1), axis=1)[:, :n_days]
+    revenue_daily = np.cumsum(
+        (np.bincount(opens, daily_rate, size) - np.bincount(closes, daily_rate, size))
+        .reshape(n_parks, n_days + 1), axis=1)[:, :n_days]
+
+    if n_parks and n_days:
+        occupied = np.add.reduceat(occupied_daily, month_starts, axis=1)
+        revenue = np.add.reduceat(revenue_daily, month_starts, axis=1)
+    else:
+        occupied = revenue = np.zeros((n_parks, n_months))
+
+    spots = np.array([p[2] for p in parkings], dtype=np.float64)
+    capacity = spots[:, None] * days_in_month[None, :]
+
+    # --- брони по месяцам: новые и действующие ---
+    cells = n_parks * n_months
+    starts_inside = (b_start >= 0) & (b_start < n_days)
+    new_bookings = np.bincount(
+        _flat_index(b_park[starts_inside], month_index(b_start[starts_inside]), n_months),
+        minlength=cells).reshape(n_parks, n_months)
+
+    first_month = month_index(first[live])
+    last_month = month_index(after_last[live] - 1)
+    active = np.cumsum(
+        (np.bincount(_flat_index(b_park[live], first_month, n_months + 1), minlength=n_parks * (n_months + 1))
+         - np.bincount(_flat_index(b_park[live], last_month + 1, n_months + 1), minlength=n_parks * (n_months + 1)))
+        .reshape(n_parks, n_months + 1), axis=1)[:, :n_months]
+
+    # --- отток: следующая бронь того же арендатора ---
+    # сортировка по (арендатор, начало) одним ключом — заметно быстрее lexsort
+    span = int(b_start.max(initial=0)) - int(b_start.min(initial=0)) + 1
+    by_client = np.argsort(client * span + (b_start - b_start.min(initial=0)))
+    c_sorted, s_sorted, e_sorted = client[by_client], b_start[by_client], b_end[by_client]
+    renewed = np.zeros(len(by_client), dtype=bool)
+    renewed[:-1] = (c_sorted[1:] == c_sorted[:-1]) & (s_sorted[1:] - e_sorted[:-1] <= CHURN_GAP_DAYS)
+
+    # уходом считается только конец внутри периода, после которого прошло больше CHURN_GAP_DAYS
+    decided = (today - start).days - CHURN_GAP_DAYS
+    left = (~renewed) & (c_sorted >= 0) & (e_sorted >= 0) & (e_sorted < n_days) & (e_sorted < decided)
+    churned = np.bincount(
+        _flat_index(b_park[by_client][left], month_index(e_sorted[left]), n_months),
+        minlength=cells).reshape(n_parks, n_months)
+
+    # --- оплаты ---
+    p_day = payments[:, 1].astype(np.int64) - w0
+    paid = np.bincount(
+        _flat_index(park_index(payments[:, 0]), month_index(p_day), n_months),
+        payments[:, 2], cells).reshape(n_parks, n_months)
+
+    # --- сезонность: средняя загрузка календарного месяца / средняя за период ---
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rate = np.where(capacity > 0, occupied / capacity, 0.0)
+        calendar = np.array([m - 1 for _, m in months], dtype=np.int64)
+        counts = np.bincount(calendar, minlength=12)
+        by_calendar = np.stack([np.bincount(calendar, row, 12) for row in rate]) if n_parks else np.zeros((0, 12))
+        average = by_calendar / np.maximum(counts, 1)
+        overall = rate.mean(axis=1, keepdims=True) if n_months else np.zeros((n_parks, 1))
+        seasonality = np.where(overall > 0, average[:, calendar] / overall, 0.0)
+
+    return Kpis(months, parkings, np.bincount(b_park[live], minlength=n_parks), days_in_month, capacity, occupied, revenue, paid,
+                new_bookings, active, churned, seasonality)
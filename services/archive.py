@@ -0,0 +1,197 @@
+# app/services/archive.py
+"""
+Архив закрытых лет.
+
+`flask archive close-year ГОД` переносит брони, закончившиеся не позже
+31 декабря ГОДА, вместе с их платежами и расходами в таблицы *_archive
+и отмечает годы в archived_period. Бронь остаётся в рабочих таблицах,
+если у неё есть платёж или расход позже этого дня — иначе часть её
+истории оказалась бы в архиве, а часть нет. Закрыть можно только год
+раньше текущего.
+
+В Postgres архивные таблицы секционированы по годам (booking_archive —
+по end_date, payment_archive — по payment_date, expense_archive — по
+expense_date), секции создаются при закрытии года. Сами booking и
+payment не секционируются: на них ссылаются внешние ключи и ограничение
+booking_no_overlap, которые в секционированной таблице пришлось бы
+расширять ключом секционирования.
+
+Запросы шахматки, отчётов и свёртки берут таблицы через sources():
+окно, начинающееся в текущем году или позже, читает только рабочие
+таблицы; более раннее — объединение рабочей и архивной (UNION ALL), и
+Postgres по условиям на даты отсекает ненужные годовые секции.
+"""
+from datetime import date, datetime
+
+from sqlalchemy import select, union_all, func, text, insert, delete, extract, table, column
+from sqlalchemy.orm import aliased
+
+from models import (db, ArchivedPeriod, Booking, Payment, Expense,
+                    booking_archive, payment_archive, expense_archive)
+
+ARCHIVES = {
+    Booking: (booking_archive, 'end_date'),
+    Payment: (payment_archive, 'payment_date'),
+    Expense: (expense_archive, 'expense_date'),
+}
+
+
+# временная таблица броней, переносимых close_year()
+_ids = table('archive_ids', column('booking_id'))
+
+
+class ArchiveError(ValueError):
+    pass
+
+
+def hot_since():
+    """Первый день, данные за который гарантированно лежат в рабочих таблицах"""
+    return date(date.today().year, 1, 1)
+
+
+def _as_date(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+def source(model, window_start=None):
+    """
+    Модель или её объединение с архивом — в зависимости от начала окна
+    запроса (None — окно без нижней границы).
+    """
+    window_start = _as_date(window_start)
+    if window_start is not None and window_start >= hot_since():
+        return model
+
+    archive, _ = ARCHIVES[model]
+    hot = model.__table__
+    combined = union_all(
+        select(*hot.columns),
+        select(*[archive.c[c.name] for c in hot.columns]),
+    ).subquery(f"{hot.name}_all")
+    return aliased(model, combined)
+
+
+def sources(window_start, *models):
+    """source() для нескольких моделей сразу: B, P = sources(start, Booking, Payment)"""
+    return tuple(source(model, window_start) for model in models)
+
+
+def closed_through(session=None):
+    """Последний закрытый год (None — архив пуст)"""
+    session = session or db.session
+    return session.scalar(select(func.max(ArchivedPeriod.year)))
+
+
+def is_closed(day, session=None):
+    """Попадает ли дата в закрытый год"""
+    year = closed_through(session)
+    return year is not None and _as_date(day).year <= year
+
+
+def rejects(start_date, end_date, previous_start=None, closed_year=None, session=None):
+    """
+    Нельзя ли записать бронь с таким периодом: она закончилась бы в
+    закрытом году (close_year такую уже перенёс бы в архив) или у
+    существующей брони (previous_start — её прежнее начало) начало
+    переносится в закрытый год. Бронь, начавшуюся в закрытом году и
+    идущую дальше, продлевать и оплачивать можно — она в рабочих таблицах.
+    closed_year — closed_through(), если уже известен (импорт проверяет
+    много строк одним запросом).
+    """
+    year = closed_year if closed_year is not None else closed_through(session)
+    if year is None:
+        return False
+    if _as_date(end_date).year <= year:
+        return True
+    moved = previous_start is not None and _as_date(start_date) != _as_date(previous_start)
+    return moved and _as_date(start_date).year <= year
+
+
+# ----------------------------------------------------------------
+#   Закрытие года
+# ----------------------------------------------------------------
+
+def _ensure_partitions(conn, archive, years):
+    """Годовые секции и секция по умолчанию (для пустых дат) — только Postgres"""
+    if conn.dialect.name != 'postgresql':
+        return
+    name = archive.name
+    conn.execute(text(f"CREATE TABLE IF NOT EXISTS {name}_default PARTITION OF {name} DEFAULT"))
+    for year in years:
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name}_{year} PARTITION OF {name} "
+            f"FOR VALUES FROM ('{year}-01-01') TO ('{year + 1}-01-01')"
+        ))
+
+
+def close_year(conn, year):
+    """
+    Перенести в архив всё, что закончилось не позже 31.12.year (внутри
+    транзакции conn). Возвращает {таблица: перенесено строк}.
+    """
+    if year >= date.today().year:
+        raise ArchiveError(f"Год {year} ещё не закончился")
+
+    last_closed = conn.scalar(select(func.max(ArchivedPeriod.year)))
+    if last_closed is not None and year <= last_closed:
+        raise ArchiveError(f"Год {year} уже в архиве (закрыт по {last_closed})")
+
+    boundary = date(year, 12, 31)
+
+    # брони к переносу — во временную таблицу: после удаления платежей
+    # условие «нет поздних платежей» уже нельзя вычислить заново
+    # (DROP на случай, если соединение из пула пережило прерванный перенос)
+    conn.execute(text("DROP TABLE IF EXISTS archive_ids"))
+    conn.execute(text("CREATE TEMPORARY TABLE archive_ids (booking_id INTEGER PRIMARY KEY)"))
+    late_payments = select(Payment.booking_id).where(
+        Payment.payment_date > boundary, Payment.booking_id.is_not(None))
+    late_expenses = select(Expense.booking_id).where(
+        Expense.expense_date > boundary, Expense.booking_id.is_not(None))
+    conn.execute(insert(_ids).from_select(
+        ['booking_id'],
+        select(Booking.booking_id).where(
+            Booking.end_date <= boundary,
+            Booking.booking_id.not_in(late_payments),
+            Booking.booking_id.not_in(late_expenses),
+        )
+    ))
+
+    counts = {}  # {год: {таблица: строк}}
+    for model in (Payment, Expense, Booking):
+        archive, date_column = ARCHIVES[model]
+        hot = model.__table__
+        scope = hot.c.booking_id.in_(select(_ids.c.booking_id))
+        row_year = extract('year', hot.c[date_column])
+
+        by_year = conn.execute(
+            select(row_year, func.count()).where(scope).group_by(row_year)
+        ).all()
+        for row_year_value, count in by_year:
+            # строки без даты и строки уже закрытых лет (поздние платежи по
+            # брони, перенесённой только сейчас) учитываются в ближайшем новом году
+            key = int(row_year_value) if row_year_value is not None else year
+            if last_closed is not None:
+                key = max(key, last_closed + 1)
+            per_year = counts.setdefault(key, {})
+            per_year[archive.name] = per_year.get(archive.name, 0) + count
+        _ensure_partitions(conn, archive, [int(y) for y, _ in by_year if y is not None])
+
+        columns = [c.name for c in hot.columns]
+        conn.execute(insert(archive).from_select(columns, select(*hot.columns).where(scope)))
+        conn.execute(delete(hot).where(scope))
+
+    conn.execute(text("DROP TABLE archive_ids"))
+
+    # закрываются все годы по year включительно, в том числе без данных
+    first = last_closed + 1 if last_closed is not None else min(counts, default=year)
+    conn.execute(insert(ArchivedPeriod), [{
+        'year': y, 'closed_at': datetime.utcnow(),
+        'bookings': counts.get(y, {}).get('booking_archive', 0),
+        'payments': counts.get(y, {}).get('payment_archive', 0),
+        'expenses': counts.get(y, {}).get('expense_archive', 0),
+    } for y in range(first, year + 1)])
+
+    return {
+        name: sum(c.get(name, 0) for c in counts.values())
+        for name in ('booking_archive', 'payment_archive', 'expense_archive')
+    }
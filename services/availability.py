@@ -0,0 +1,63 @@
+# app/services/availability.py
+"""
+Свободные места с точностью до дня.
+
+Шахматка показывает занятость помесячно: бронь с 3-го по 10-е закрашивает
+весь месяц. Здесь занятость каждого места — IntervalSet из дат броней
+(отрезки слиты и отсортированы), поэтому «свободно ли место в период» —
+один bisect, а «ближайшее свободное окно» пропускает только короткие
+промежутки между бронями.
+
+Индекс строится одним запросом на окно дат: берутся брони, пересекающие
+[window_start, window_end]; ответы за пределами окна не гарантируются.
+"""
+from datetime import date, timedelta
+
+from services.overlap import load_index
+
+DAY = timedelta(days=1)
+
+# насколько вперёд от начала периода искать свободное окно
+SEARCH_HORIZON = timedelta(days=730)
+
+
+class Availability:
+    def __init__(self, spots, window_start, window_end, exclude_booking_id=None):
+        """spots — места (ParkingSpot), для которых строится индекс"""
+        self.spots = list(spots)
+        self.window_start = window_start
+        self.window_end = window_end
+        self.index = load_index(
+            [s.spot_id for s in self.spots], window_start, window_end,
+            exclude_booking_id=exclude_booking_id
+        )
+
+    @classmethod
+    def for_period(cls, spots, start, end, exclude_booking_id=None):
+        """Индекс для периода и поиска окон на SEARCH_HORIZON вперёд (не дальше date.max)"""
+        horizon = end + SEARCH_HORIZON if date.max - end > SEARCH_HORIZON else date.max
+        return cls(spots, start, horizon, exclude_booking_id)
+
+    def is_free(self, spot_id, start, end):
+        busy = self.index.get(spot_id)
+        return busy is None or busy.overlap(start, end) is None
+
+    def free_spots(self, start, end):
+        """Места, свободные весь период [start, end]"""
+        return [s for s in self.spots if self.is_free(s.spot_id, start, end)]
+
+    def busy_spot_ids(self, start, end):
+        return {s.spot_id for s in self.spots if not self.is_free(s.spot_id, start, end)}
+
+    def next_free(self, spot_id, start, days):
+        """
+        Ближайшее окно (начало, конец) из days дней с началом не раньше start,
+        или None, если в пределах индекса такого окна нет.
+        """
+        length = (days - 1) * DAY
+        busy = self.index.get(spot_id)
+        first = busy.next_free(start, length, DAY) if busy is not None else start
+
+        if first + length > self.window_end:
+            return None
+        return first, first + length
@@ -0,0 +1,214 @@
+# app/services/cache.py
+"""
+Кэш отрисованной шахматки.
+
+Ключ — парковка (или «все»), год и версия журнала шахматки
+(services/gridsync.py), которую вызывающий читает из БД перед показом:
+коммит любого воркера меняет версию, и старые записи больше не находятся,
+а затем вытесняются LRU/TTL. Хранится готовый HTML строк таблицы, поэтому
+повторный показ не строит сетку и не рендерит шаблон. Вдобавок по коммиту
+(services/changes.py) в своём процессе увеличивается поколение
+затронутых (парковка, год); добавление мест сбрасывает все годы парковки.
+
+Бэкенды (GRID_CACHE_BACKEND):
+  memory — словарь в процессе (LRU + TTL); каждый воркер со своим кэшем,
+           чужие коммиты он замечает по версии в ключе;
+  redis  — любой Redis-совместимый сервер (GRID_CACHE_URL), общий для воркеров
+           (пакет redis; без него create_app падает сразу с понятной ошибкой);
+  none   — кэш выключен.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+from services import changes
+
+
+class MemoryBackend:
+    """LRU-словарь с TTL; поколения хранятся отдельно и не вытесняются"""
+
+    def __init__(self, maxsize=256, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def generations(self, names):
+        with self._lock:
+            return [self._generations.get(name, 0) for name in names]
+
+    def bump(self, names):
+        with self._lock:
+            for name in names:
+                self._generations[name] = self._generations.get(name, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._generations.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RedisBackend:
+    """Redis-совместимый сервер: значения с EXPIRE, поколения — INCR"""
+
+    def __init__(self, url, ttl=300, prefix='parking:grid:'):
+        if redis is None:
+            raise RuntimeError("Для GRID_CACHE_BACKEND=redis установите пакет redis")
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return value.decode('utf-8') if value is not None else None
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, value.encode('utf-8'), ex=self.ttl)
+
+    def generations(self, names):
+        values = self.client.mget([self.prefix + 'gen:' + name for name in names])
+        return [int(v) if v is not None else 0 for v in values]
+
+    def bump(self, names):
+        pipe = self.client.pipeline()
+        for name in names:
+            pipe.incr(self.prefix + 'gen:' + name)
+        pipe.execute()
+
+    def clear(self):
+        keys = list(self.client.scan_iter(self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+    def __len__(self):
+        return sum(1 for _ in self.client.scan_iter(self.prefix + 'v:*'))
+
+
+class GridCache:
+    def __init__(self):
+        self.backend = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        # счётчики меняют потоки gthread-воркера одновременно
+        self._lock = threading.Lock()
+
+    def configure(self, backend):
+        self.backend = backend
+        with self._lock:
+            self.hits = self.misses = self.invalidations = 0
+
+    def _count(self, name, n=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    @property
+    def enabled(self):
+        return self.backend is not None
+
+    @staticmethod
+    def _scope(parking_id):
+        return str(parking_id) if parking_id else 'all'
+
+    def _key(self, parking_id, year, extra):
+        scope = self._scope(parking_id)
+        gen_parking, gen_year = self.backend.generations([scope, f'{scope}:{year}'])
+        return f'v:{scope}:{year}:{gen_parking}.{gen_year}:{extra}'
+
+    def get_or_render(self, parking_id, year, render, extra=''):
+        """HTML из кэша или render(), результат которого кладётся в кэш"""
+        if not self.enabled:
+            return render()
+
+        key = self._key(parking_id, year, extra)
+        html = self.backend.get(key)
+        if html is not None:
+            self._count('hits')
+            return html
+
+        self._count('misses')
+        html = render()
+        self.backend.set(key, html)
+        return html
+
+    def invalidate(self, cells=(), parking_ids=()):
+        """Сбросить годы парковок {(parking_id, год)} и целиком парковки parking_ids"""
+        if not self.enabled:
+            return
+
+        names = set()
+        for parking_id, year in cells:
+            names.add(f'{self._scope(parking_id)}:{year}')
+            names.add(f'all:{year}')
+        for parking_id in parking_ids:
+            names.add(self._scope(parking_id))
+            names.add('all')
+
+        if names:
+            self.backend.bump(sorted(names))
+            self._count('invalidations', len(names))
+
+    def stats(self):
+        with self._lock:
+            hits, misses, invalidations = self.hits, self.misses, self.invalidations
+        total = hits + misses
+        return {
+            "backend": type(self.backend).__name__ if self.backend else None,
+            "entries": len(self.backend) if self.backend else 0,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / total, 3) if total else 0.0,
+            "invalidations": invalidations,
+        }
+
+
+grid_cache = GridCache()
+
+
+def _invalidate_committed(change_set):
+    grid_cache.invalidate(
+        cells={(parking_id, year) for parking_id, _, year, _ in change_set.cells},
+        parking_ids=change_set.parking_ids
+    )
+
+
+def init_app(app):
+    backend = app.config.get('GRID_CACHE_BACKEND', 'memory')
+    ttl = app.config.get('GRID_CACHE_TTL', 300)
+
+    if backend == 'memory':
+        grid_cache.configure(MemoryBackend(app.config.get('GRID_CACHE_SIZE', 256), ttl))
+    elif backend == 'redis':
+        grid_cache.configure(RedisBackend(app.config['GRID_CACHE_URL'], ttl))
+    else:
+        grid_cache.configure(None)
+
+    changes.on_commit(_invalidate_committed)
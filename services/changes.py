@@ -0,0 +1,201 @@
+# app/services/changes.py
+"""
+Отслеживание изменений броней, платежей, расходов и мест в транзакции.
+
+После каждого flush запоминаем, что было записано; перед коммитом
+переводим это в набор затронутых ячеек шахматки и месяцев парковок
+(ChangeSet) и вызываем подписчиков:
+
+  on_prepare(fn) — fn(session, changes) перед коммитом, в той же
+                   транзакции (можно писать в БД: свёртки, журналы);
+  on_commit(fn)  — fn(changes) после успешного коммита (кэши, уведомления).
+"""
+from calendar import monthrange
+from collections import namedtuple
+from datetime import date
+from itertools import chain
+
+from sqlalchemy import event, inspect, select
+
+from models import db, Booking, Payment, Expense, ParkingSpot, Client
+
+# cells  — {(parking_id, spot_id, год, месяц)} ячейки шахматки
+# months — {(parking_id, год, месяц)} месяцы парковок (включая даты платежей/расходов)
+# booking_ids — затронутые брони; parking_ids — парковки, где добавили/удалили места
+ChangeSet = namedtuple('ChangeSet', 'booking_ids cells months parking_ids')
+
+_prepare_hooks = []
+_commit_hooks = []
+
+
+def on_prepare(fn):
+    if fn not in _prepare_hooks:
+        _prepare_hooks.append(fn)
+    return fn
+
+
+def on_commit(fn):
+    if fn not in _commit_hooks:
+        _commit_hooks.append(fn)
+    return fn
+
+
+def month_bounds(year, month):
+    """Первый и последний день месяца включительно"""
+    # не «первое число следующего месяца»: для декабря 9999 года его нет
+    return date(year, month, 1), date(year, month, monthrange(year, month)[1])
+
+
+def month_range(start, end):
+    """Все (год, месяц) периода start..end включительно"""
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        yield year, month
+        month += 1
+        if month > 12:
+            year, month = year + 1, 1
+
+
+# ----------------------------------------------------------------
+#   Сбор изменений после flush
+# ----------------------------------------------------------------
+
+def _values(obj, *names):
+    """Текущие и прежние (до flush) значения атрибутов без обращений к БД"""
+    state = inspect(obj)
+    current, previous = [], []
+    for name in names:
+        history = state.attrs[name].history
+        value = state.dict.get(name)
+        current.append(value)
+        previous.append(history.deleted[0] if history.deleted else value)
+    return tuple(current), tuple(previous)
+
+
+def _raw(session):
+    return session.info.setdefault('changes_raw', {
+        'booking_ids': set(),   # брони, текущий период которых читаем из БД
+        'spans': {},            # booking_id → {(spot_id, start, end)} прежние/удалённые периоды
+        'dated': set(),         # (booking_id, дата платежа/расхода)
+        'parking_ids': set(),
+        'client_ids': set(),    # переименованные арендаторы — их имя видно в шахматке
+    })
+
+
+def _after_flush(session, flush_context):
+    raw = None
+
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Booking):
+            raw = raw or _raw(session)
+            current, previous = _values(obj, 'booking_id', 'spot_id', 'start_date', 'end_date')
+            spans = raw['spans'].setdefault(current[0], set())
+            for booking_id, spot_id, start, end in {current, previous}:
+                if spot_id and start and end:
+                    spans.add((spot_id, start, end))
+            if obj not in session.deleted:
+                raw['booking_ids'].add(current[0])
+
+        elif isinstance(obj, (Payment, Expense)):
+            raw = raw or _raw(session)
+            date_attr = 'payment_date' if isinstance(obj, Payment) else 'expense_date'
+            for booking_id, day in set(_values(obj, 'booking_id', date_attr)):
+                if booking_id:
+                    raw['booking_ids'].add(booking_id)
+                    if day:
+                        raw['dated'].add((booking_id, day))
+
+        elif isinstance(obj, ParkingSpot) and obj not in session.dirty:
+            raw = raw or _raw(session)
+            raw['parking_ids'].add(inspect(obj).dict.get('parking_id'))
+
+        elif isinstance(obj, Client) and obj in session.dirty:
+            if inspect(obj).attrs.name.history.has_changes():
+                raw = raw or _raw(session)
+                raw['client_ids'].add(obj.client_id)
+
+
+def _resolve(session, raw):
+    spans = {booking_id: set(items) for booking_id, items in raw['spans'].items()}
+
+    ids = set(raw['booking_ids']) | {booking_id for booking_id, _ in raw['dated']}
+    conn = session.connection()
+    if raw['client_ids']:
+        ids.update(conn.scalars(
+            select(Booking.booking_id).where(Booking.client_id.in_(raw['client_ids']))
+        ))
+
+    ids = sorted(ids)
+    for i in range(0, len(ids), 500):
+        rows = conn.execute(
+            select(Booking.booking_id, Booking.spot_id, Booking.start_date, Booking.end_date)
+            .where(Booking.booking_id.in_(ids[i:i + 500]))
+        )
+        for booking_id, spot_id, start, end in rows:
+            spans.setdefault(booking_id, set()).add((spot_id, start, end))
+
+    spot_ids = {spot_id for items in spans.values() for spot_id, _, _ in items}
+    parking_of = dict(conn.execute(
+        select(ParkingSpot.spot_id, ParkingSpot.parking_id).where(ParkingSpot.spot_id.in_(spot_ids))
+    ).all()) if spot_ids else {}
+
+    cells = set()
+    for items in spans.values():
+        for spot_id, start, end in items:
+            parking_id = parking_of.get(spot_id)
+            cells.update((parking_id, spot_id, y, m) for y, m in month_range(start, end))
+
+    months = {(parking_id, y, m) for parking_id, _, y, m in cells}
+    for booking_id, day in raw['dated']:
+        for spot_id, _, _ in spans.get(booking_id, ()):
+            months.add((parking_of.get(spot_id), day.year, day.month))
+
+    raw['parking_ids'].discard(None)
+    return ChangeSet(frozenset(spans), frozenset(cells), frozenset(months), frozenset(raw['parking_ids']))
+
+
+def _before_commit(session):
+    session.flush()
+
+    raw = session.info.pop('changes_raw', None)
+    if not raw:
+        return
+
+    changes = _resolve(session, raw)
+    for hook in _prepare_hooks:
+        hook(session, changes)
+
+    session.info['changes'] = changes
+
+
+def _after_commit(session):
+    changes = session.info.pop('changes', None)
+    if changes is None:
+        return
+
+    for hook in _commit_hooks:
+        hook(changes)
+
+
+def _after_rollback(session):
+    session.info.pop('changes_raw', None)
+    session.info.pop('changes', None)
+
+
+def init_app(app):
+    """Подписка на события сессии (один раз на процесс)"""
+    if not event.contains(db.session, 'after_flush', _after_flush):
+        event.listen(db.session, 'after_flush', _after_flush)
+        event.listen(db.session, 'before_commit', _before_commit)
+        event.listen(db.session, 'after_commit', _after_commit)
+        event.listen(db.session, 'after_rollback', _after_rollback)
+
+
+def mark(session, booking_ids=(), parking_ids=()):
+    """
+    Учесть записи, сделанные в обход ORM (bulk insert/UPDATE): брони по id
+    и парковки, где менялся состав мест. Вызывать до коммита.
+    """
+    raw = _raw(session)
+    raw['booking_ids'].update(booking_ids)
+    raw['parking_ids'].update(parking_ids)
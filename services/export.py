@@ -0,0 +1,154 @@
+# app/services/export.py
+"""
+Потоковая выгрузка таблиц в CSV и XLSX.
+
+Обе функции принимают итератор строк и отдают генератор байтов: строки
+пишутся по мере чтения из курсора, весь результат в памяти не держится.
+XLSX собирается стандартным zipfile в поток (без сторонних библиотек).
+"""
+import csv
+import io
+import zipfile
+from datetime import date
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+
+def csv_stream(columns, rows, chunk_rows=500):
+    """CSV для Excel: UTF-8 с BOM, разделитель «;»"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';')
+
+    writer.writerow(columns)
+    yield '\ufeff'.encode('utf-8') + buffer.getvalue().encode('utf-8')
+    buffer.seek(0)
+    buffer.truncate()
+
+    pending = 0
+    for row in rows:
+        writer.writerow(_text(v) for v in row)
+        pending += 1
+        if pending >= chunk_rows:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+
+    if pending:
+        yield buffer.getvalue().encode('utf-8')
+
+
+def xlsx_stream(columns, rows, sheet_title='Отчёт', chunk_rows=500):
+    """Минимальная книга XLSX с одним листом; числа пишутся числами"""
+    pipe = _Pipe()
+
+    with zipfile.ZipFile(pipe, 'w', compression=zipfile.ZIP_DEFLATED) as book:
+        book.writestr('[Content_Types].xml', _CONTENT_TYPES)
+        book.writestr('_rels/.rels', _ROOT_RELS)
+        book.writestr('xl/workbook.xml', _WORKBOOK.format(title=escape(sheet_title, _ATTR)))
+        book.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS)
+        yield pipe.drain()
+
+        with book.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(_SHEET_HEAD.encode('utf-8'))
+            sheet.write(_xml_row(columns).encode('utf-8'))
+
+            pending = 0
+            for row in rows:
+                sheet.write(_xml_row(row).encode('utf-8'))
+                pending += 1
+                if pending >= chunk_rows:
+                    yield pipe.drain()
+                    pending = 0
+
+            sheet.write(_SHEET_TAIL.encode('utf-8'))
+
+    yield pipe.drain()
+
+
+# ----------------------------------------------------------------
+
+class _Pipe(io.RawIOBase):
+    """Неперематываемый приёмник для zipfile: копит байты до drain()"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _text(value):
+    if value is None:
+        return ''
+    if isinstance(value, (Decimal, float)):
+        return f"{value:.2f}"
+    if isinstance(value, date):
+        return value.strftime('%d.%m.%Y')
+    return str(value)
+
+
+_ATTR = {'"': '&quot;'}
+
+
+def _xml_row(values):
+    cells = []
+    for value in values:
+        if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+            cells.append(f'<c><v>{value}</v></c>')
+        else:
+            cells.append(f'<c t="inlineStr"><is><t>{escape(_text(value))}</t></is></c>')
+    return f'<row>{"".join(cells)}</row>'
+
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Target="xl/workbook.xml" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+    '</Relationships>'
+)
+
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{title}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+    '</Relationships>'
+)
+
+_SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+
+_SHEET_TAIL = '</sheetData></worksheet>'
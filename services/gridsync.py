@@ -0,0 +1,136 @@
+# app/services/gridsync.py
+"""
+Версии шахматки для JSON API: ETag и дельта-синхронизация.
+
+Каждый коммит, затронувший ячейки, пишет их в журнал grid_change в той же
+транзакции с общей версией коммита. Версию выдаёт счётчик grid_version:
+UPDATE … RETURNING блокирует его строку до конца транзакции, поэтому
+следующий пишущий получает номер только после коммита предыдущего и
+версии растут в порядке коммитов — видна версия N, видны и все меньшие.
+(Ключ строки журнала выдаётся при INSERT, а коммит может случиться
+позже, чем у транзакции с бо́льшим номером, — для версии он не годится.)
+Версия (парковка, год) — максимальная версия её строк, на ней строится
+сильный ETag. Клиент, присылающий since=<версия>, получает только ячейки,
+изменённые позже.
+Строка с spot_id = NULL означает, что изменился состав мест — тогда
+отдаётся полная сетка.
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, select, update, delete, func, or_
+
+from models import db, GridChange, GridVersion
+from services import changes
+
+STATUS_CODES = {"занято": "occupied", "забронировано": "reserved"}
+
+
+def _scope(query, parking_id, year):
+    query = query.where(or_(GridChange.year == year, GridChange.year.is_(None)))
+    if parking_id:
+        query = query.where(GridChange.parking_id == parking_id)
+    return query
+
+
+def current_version(parking_id, year):
+    """Версия сетки парковки (или всех) за год; 0 — журнал изменений пуст"""
+    # prune() удаляет старые строки всех сеток сразу: у сетки, давно не
+    # менявшейся, строк может не остаться. Её версия тогда — последняя
+    # удалённая (наименьшая оставшаяся − 1): не ниже прежней, так что версия
+    # и ETag не идут назад, а since от неё даёт верную дельту
+    scoped = _scope(select(func.max(GridChange.version)), parking_id, year).scalar_subquery()
+    pruned = select(func.min(GridChange.version) - 1).scalar_subquery()
+    version, floor = db.session.execute(select(scoped, pruned)).one()
+    return max(version or 0, floor or 0)
+
+
+def changed_since(parking_id, year, since):
+    """
+    Ячейки {(spot_id, месяц)}, изменённые после версии since,
+    или None, если нужна полная синхронизация.
+    """
+    oldest = db.session.scalar(select(func.min(GridChange.version)))
+    if oldest is not None and since < oldest - 1:
+        return None  # журнал уже подрезан
+
+    rows = db.session.execute(
+        _scope(select(GridChange.spot_id, GridChange.month).distinct(), parking_id, year)
+        .where(GridChange.version > since)
+    ).all()
+
+    if any(spot_id is None for spot_id, _ in rows):
+        return None
+    return set(rows)
+
+
+def columnar_spots(spots):
+    return {
+        "spot_id": [s.spot_id for s in spots],
+        "number": [s.number for s in spots],
+        "address": [s.parking.address if s.parking else None for s in spots],
+    }
+
+
+def columnar_cells(grid, only=None):
+    """Занятые ячейки столбцами; only — {(spot_id, месяц)} для дельты"""
+    columns = {k: [] for k in ("spot_id", "month", "booking_id", "client_id",
+                               "client_name", "rent", "status")}
+
+    for spot_id, months in grid.items():
+        for month, cell in months.items():
+            if only is not None and (spot_id, month) not in only:
+                continue
+            columns["spot_id"].append(spot_id)
+            columns["month"].append(month)
+            columns["booking_id"].append(cell.booking_id)
+            columns["client_id"].append(cell.client_id)
+            columns["client_name"].append(cell.client_name)
+            columns["rent"].append(float(cell.rent_size or 0))
+            columns["status"].append(STATUS_CODES.get(cell.status, cell.status))
+
+    return columns
+
+
+def prune(conn, keep_days=7):
+    """Удалить старые записи журнала (последняя запись остаётся всегда)"""
+    newest = conn.scalar(select(func.max(GridChange.version)))
+    if newest is None:
+        return 0
+
+    result = conn.execute(
+        delete(GridChange)
+        .where(GridChange.changed_at < datetime.utcnow() - timedelta(days=keep_days),
+               GridChange.version < newest)
+    )
+    return result.rowcount
+
+
+def next_version(conn):
+    """Версия для коммита транзакции conn; строка счётчика заблокирована до её конца"""
+    return conn.scalar(
+        update(GridVersion).where(GridVersion.id == 1)
+        .values(version=GridVersion.version + 1)
+        .returning(GridVersion.version)
+    )
+
+
+def _log_changes(session, change_set):
+    now = datetime.utcnow()
+    rows = [
+        {"parking_id": parking_id, "spot_id": spot_id, "year": year, "month": month, "changed_at": now}
+        for parking_id, spot_id, year, month in sorted(change_set.cells, key=str)
+    ]
+    rows += [
+        {"parking_id": parking_id, "spot_id": None, "year": None, "month": None, "changed_at": now}
+        for parking_id in change_set.parking_ids
+    ]
+    if rows:
+        # свёртка пересчитана раньше (rollup подписан первым) — блокировка счётчика
+        # держится только до коммита
+        conn = session.connection()
+        version = next_version(conn)
+        conn.execute(insert(GridChange), [dict(row, version=version) for row in rows])
+
+
+def init_app(app):
+    changes.on_prepare(_log_changes)
@@ -0,0 +1,262 @@
+# app/services/importer.py
+"""
+Массовый импорт арендаторов, мест и броней из CSV.
+
+Файл читается потоком, порциями по chunk_size строк. Каждая порция
+проверяется целиком несколькими запросами (существующие номера мест,
+пересечения броней, ссылки на места и арендаторов), корректные строки
+вставляются одним bulk INSERT и коммитятся. Ошибки копятся построчно
+с номером строки файла и не останавливают импорт.
+
+Колонки CSV (разделитель «,» или «;»):
+  clients  — name, phone, notes
+  spots    — parking_id, number
+  bookings — spot_id, client_id, start_date, end_date, rent_size, utilities, notes
+             (даты в формате YYYY-MM-DD или DD.MM.YYYY)
+"""
+import csv
+import time
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from sqlalchemy import insert, select, tuple_
+
+from models import db, Client, Parking, ParkingSpot, Booking, normalize_phone
+from services import archive, changes, overlap
+
+KINDS = ('clients', 'spots', 'bookings')
+
+
+class ImportReport:
+    def __init__(self, kind):
+        self.kind = kind
+        self.inserted = 0
+        self.rows = 0
+        self.errors = []  # [(номер строки, сообщение)]
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def error(self, line, message):
+        self.errors.append((line, message))
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.started
+        self.errors.sort(key=lambda e: e[0])
+        return self
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+
+class _SemicolonDialect(csv.excel):
+    delimiter = ';'
+
+
+def read_chunks(stream, chunk_size, report):
+    """Порции [(номер строки, dict)] из текстового потока CSV"""
+    sample = stream.readline()
+    if not sample.strip():
+        report.error(1, "пустой файл — нет строки заголовка")
+        return
+    dialect = _SemicolonDialect if sample.count(';') > sample.count(',') else csv.excel
+    header = next(csv.reader([sample], dialect=dialect))
+    reader = csv.DictReader(stream, fieldnames=[h.strip().lower() for h in header], dialect=dialect)
+
+    chunk = []
+    for row in reader:
+        # строка 1 — заголовок
+        chunk.append((reader.line_num + 1, row))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def run(kind, stream, chunk_size=1000):
+    """Импортировать CSV из текстового потока; возвращает ImportReport"""
+    if kind not in KINDS:
+        raise ValueError(f"Неизвестный тип импорта: {kind}")
+
+    handler = _HANDLERS[kind]
+    report = ImportReport(kind)
+
+    for chunk in read_chunks(stream, chunk_size, report):
+        report.rows += len(chunk)
+        try:
+            report.inserted += handler(chunk, report)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            first, last = chunk[0][0], chunk[-1][0]
+            report.error(first, f"строки {first}–{last} не импортированы: {e}")
+
+    return report.finish()
+
+
+# ----------------------------------------------------------------
+
+def _text(row, key):
+    return (row.get(key) or '').strip()
+
+
+def _int(row, key):
+    value = _text(row, key)
+    return int(value) if value else None
+
+
+def _date(value):
+    for fmt in ('%Y-%m-%d', '%d.%m.%Y'):
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            pass
+    raise ValueError(f"некорректная дата «{value}»")
+
+
+def _money(value):
+    if not value:
+        return None
+    try:
+        return Decimal(value.replace(' ', '').replace(',', '.'))
+    except InvalidOperation:
+        raise ValueError(f"некорректная сумма «{value}»")
+
+
+def _import_clients(chunk, report):
+    rows = []
+    for line, row in chunk:
+        name = _text(row, 'name')
+        if not name:
+            report.error(line, "не указано ФИО")
+            continue
+        phone = _text(row, 'phone') or None
+        rows.append({
+            "name": name,
+            "phone": phone,
+            "phone_digits": normalize_phone(phone),
+            "notes": _text(row, 'notes') or None,
+        })
+
+    if rows:
+        db.session.execute(insert(Client), rows)
+    return len(rows)
+
+
+def _import_spots(chunk, report):
+    parsed = []
+    for line, row in chunk:
+        try:
+            parking_id = _int(row, 'parking_id')
+        except ValueError:
+            parking_id = None
+        number = _text(row, 'number')
+        if not parking_id or not number:
+            report.error(line, "нужны parking_id и number")
+            continue
+        parsed.append((line, parking_id, number))
+
+    if not parsed:
+        return 0
+
+    # --- проверки на всю порцию сразу ---
+    parking_ids = {p for _, p, _ in parsed}
+    known_parkings = set(db.session.scalars(
+        select(Parking.parking_id).where(Parking.parking_id.in_(parking_ids))
+    ))
+    existing = set(db.session.execute(
+        select(ParkingSpot.parking_id, ParkingSpot.number)
+        .where(tuple_(ParkingSpot.parking_id, ParkingSpot.number)
+               .in_([(p, n) for _, p, n in parsed]))
+    ).all())
+
+    rows, seen = [], set()
+    for line, parking_id, number in parsed:
+        key = (parking_id, number)
+        if parking_id not in known_parkings:
+            report.error(line, f"парковка {parking_id} не найдена")
+        elif key in existing:
+            report.error(line, f"место №{number} уже есть на парковке {parking_id}")
+        elif key in seen:
+            report.error(line, f"место №{number} повторяется в файле")
+        else:
+            seen.add(key)
+            rows.append({"parking_id": parking_id, "number": number})
+
+    if rows:
+        db.session.execute(insert(ParkingSpot), rows)
+        changes.mark(db.session, parking_ids={r["parking_id"] for r in rows})
+    return len(rows)
+
+
+def _import_bookings(chunk, report):
+    parsed = []
+    for line, row in chunk:
+        try:
+            spot_id = _int(row, 'spot_id')
+            client_id = _int(row, 'client_id')
+            start = _date(_text(row, 'start_date'))
+            end = _date(_text(row, 'end_date'))
+            rent = _money(_text(row, 'rent_size'))
+            utilities = _money(_text(row, 'utilities'))
+        except ValueError as e:
+            report.error(line, str(e))
+            continue
+        if not spot_id or not client_id:
+            report.error(line, "нужны spot_id и client_id")
+            continue
+        if start >= end:
+            report.error(line, "дата начала должна быть раньше окончания")
+            continue
+        parsed.append((line, {
+            "spot_id": spot_id, "client_id": client_id,
+            "start_date": start, "end_date": end,
+            "rent_size": rent, "utilities": utilities,
+            "notes": _text(row, 'notes') or None,
+            "status": "занято",
+            "total_paid": 0, "balance": rent or 0,
+        }))
+
+    if not parsed:
+        return 0
+
+    # --- ссылки на места и арендаторов ---
+    spot_ids = {r["spot_id"] for _, r in parsed}
+    client_ids = {r["client_id"] for _, r in parsed}
+    known_spots = set(db.session.scalars(select(ParkingSpot.spot_id).where(ParkingSpot.spot_id.in_(spot_ids))))
+    known_clients = set(db.session.scalars(select(Client.client_id).where(Client.client_id.in_(client_ids))))
+    closed_year = archive.closed_through()
+
+    # --- занятость мест: брони из БД в окне порции ---
+    window_start = min(r["start_date"] for _, r in parsed)
+    window_end = max(r["end_date"] for _, r in parsed)
+    taken = overlap.load_index(spot_ids, window_start, window_end)
+
+    rows = []
+    for line, r in parsed:
+        if r["spot_id"] not in known_spots:
+            report.error(line, f"место {r['spot_id']} не найдено")
+        elif r["client_id"] not in known_clients:
+            report.error(line, f"арендатор {r['client_id']} не найден")
+        elif archive.rejects(r["start_date"], r["end_date"], closed_year=closed_year):
+            report.error(line, f"бронь заканчивается в закрытом году — период по {closed_year} год в архиве")
+        elif taken[r["spot_id"]].overlap(r["start_date"], r["end_date"]):
+            report.error(line, f"место {r['spot_id']} занято в период "
+                               f"{r['start_date']:%d.%m.%Y} — {r['end_date']:%d.%m.%Y}")
+        else:
+            # принятая строка занимает место для следующих строк порции
+            taken[r["spot_id"]].add(r["start_date"], r["end_date"])
+            rows.append(r)
+
+    if rows:
+        booking_ids = db.session.scalars(insert(Booking).returning(Booking.booking_id), rows).all()
+        changes.mark(db.session, booking_ids=booking_ids)
+    return len(rows)
+
+
+_HANDLERS = {
+    'clients': _import_clients,
+    'spots': _import_spots,
+    'bookings': _import_bookings,
+}
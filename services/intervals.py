@@ -0,0 +1,68 @@
+# app/services/intervals.py
+"""
+Набор занятых отрезков одного места.
+
+Отрезки [start, end] — включительно (как даты брони). Пересекающиеся
+отрезки при добавлении сливаются, поэтому внутри хранятся два
+отсортированных списка (начала и концы) непересекающихся отрезков, и
+проверка «свободен ли период» — один bisect, O(log n).
+Значения — любые сравнимые (date или порядковые номера дней).
+"""
+from bisect import bisect_left, bisect_right
+
+
+class IntervalSet:
+    def __init__(self, intervals=()):
+        self.starts = []
+        self.ends = []
+
+        for start, end in sorted(intervals):
+            if self.ends and start <= self.ends[-1]:
+                self.ends[-1] = max(self.ends[-1], end)
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __iter__(self):
+        return zip(self.starts, self.ends)
+
+    def overlap(self, start, end):
+        """Занятый отрезок, пересекающий [start, end], или None"""
+        i = bisect_right(self.starts, end) - 1
+        if i >= 0 and self.ends[i] >= start:
+            return self.starts[i], self.ends[i]
+        return None
+
+    def next_free(self, start, length, step):
+        """
+        Начало первого свободного окна [s, s + length] при s >= start.
+
+        step — «следующее значение» после конца отрезка (1 для номеров дней,
+        timedelta(days=1) для дат). Отрезки до start отсекает bisect, дальше
+        просматриваются только промежутки короче окна.
+        """
+        i = bisect_right(self.starts, start) - 1
+        if i >= 0 and self.ends[i] >= start:
+            start = self.ends[i] + step
+
+        i += 1
+        while i < len(self.starts) and self.starts[i] <= start + length:
+            start = self.ends[i] + step
+            i += 1
+
+        return start
+
+    def add(self, start, end):
+        """Занять [start, end], слив с пересекающимися отрезками"""
+        lo = bisect_left(self.ends, start)
+        hi = bisect_right(self.starts, end)
+
+        if lo < hi:
+            start = min(start, self.starts[lo])
+            end = max(end, self.ends[hi - 1])
+
+        self.starts[lo:hi] = [start]
+        self.ends[lo:hi] = [end]
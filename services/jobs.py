@@ -0,0 +1,263 @@
+# app/services/jobs.py
+"""
+Фоновые отчёты: пул процессов и таблица заданий report_job, без брокера.
+
+Отчёт за длинный период (от REPORT_JOB_MIN_DAYS дней) не строится в
+запросе страницы: submit() записывает задание и отдаёт его в пул из
+REPORT_JOB_WORKERS процессов, страница опрашивает /reports/jobs/<id>
+(статус и процент готовности) и, когда отчёт готов, переходит на
+/reports/jobs/<id>/result — результат именно этого задания.
+Процессы пула запускаются через spawn и поднимают собственное приложение
+(create_app) — со своим пулом соединений, ничего не наследуя от воркера.
+
+Результат хранится в задании сжатым (zlib, JSON с колонками и строками)
+и отдаётся повторно на те же (тип, начало, конец, парковка), пока не
+изменились данные отчёта. Версия данных считается по его парковке и
+периоду: последняя запись журнала шахматки за годы периода (брони,
+платежи, расходы, места, арендаторы — services/gridsync.py), время
+пересчёта свёртки за месяцы периода (туда попадают и даты платежей и
+расходов) и время последнего закрытия месяца начислений периода.
+Записи по другим парковкам и периодам готовый отчёт не сбрасывают.
+
+Задание, пропавшее вместе с процессом (перезапуск воркера), через
+REPORT_JOB_TIMEOUT секунд перестаёт считаться идущим, и следующий
+запрос ставит новое. С репликой (services/replica.py) отчёты строятся
+по ней, а задания читаются и пишутся в основной БД. Старые задания и
+результаты, для которых уже есть более новые, удаляет `flask jobs prune`.
+"""
+import json
+import multiprocessing
+import re
+import threading
+import zlib
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta, time
+
+from flask import current_app
+from sqlalchemy import select, update, delete, exists, func, case, or_, and_
+from sqlalchemy.orm import aliased
+
+from models import db, ReportJob, GridChange, MonthlyRollup, AccrualRun
+from services import replica
+
+COMPRESS_LEVEL = 6
+
+ACTIVE = ('queued', 'running')
+
+_executor = None
+_lock = threading.Lock()
+
+# приложение процесса пула (_init_worker)
+_app = None
+
+
+def enabled():
+    return current_app.config.get('REPORT_JOB_WORKERS', 2) > 0
+
+
+def in_background(start_date, end_date):
+    """Строить ли отчёт за этот период фоновым заданием"""
+    min_days = current_app.config.get('REPORT_JOB_MIN_DAYS', 366)
+    return enabled() and (end_date - start_date).days + 1 >= min_days
+
+
+def _stamp(value):
+    return re.sub(r'\D', '', str(value)) if value is not None else '0'
+
+
+def data_version(session=None, start_date=None, end_date=None, parking_id=None):
+    """
+    Версия данных отчёта за период start_date..end_date по парковке
+    parking_id (одним запросом); без периода — по всем данным.
+    """
+    session = session or db.session
+    grid = select(func.max(GridChange.version))
+    rollup = select(func.max(MonthlyRollup.refreshed_at))
+    accruals = select(func.max(AccrualRun.finished_at))
+
+    if start_date is not None and end_date is not None:
+        first = start_date.year * 100 + start_date.month
+        last = end_date.year * 100 + end_date.month
+        # year IS NULL — изменился состав мест парковки
+        grid = grid.where(or_(GridChange.year.between(start_date.year, end_date.year),
+                              GridChange.year.is_(None)))
+        rollup = rollup.where((MonthlyRollup.year * 100 + MonthlyRollup.month).between(first, last))
+        accruals = accruals.where((AccrualRun.year * 100 + AccrualRun.month).between(first, last))
+    if parking_id:
+        grid = grid.where(GridChange.parking_id == parking_id)
+        rollup = rollup.where(MonthlyRollup.parking_id == parking_id)
+
+    grid, rollup, accruals = session.execute(select(
+        grid.scalar_subquery(), rollup.scalar_subquery(), accruals.scalar_subquery(),
+    )).one()
+    return f"{grid or 0}:{_stamp(rollup)}:{_stamp(accruals)}"
+
+
+def _same_params(report_type, start_date, end_date, parking_id):
+    return (
+        ReportJob.report_type == report_type,
+        ReportJob.start_date == start_date,
+        ReportJob.end_date == end_date,
+        ReportJob.parking_id == parking_id if parking_id else ReportJob.parking_id.is_(None),
+    )
+
+
+def _pool():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=current_app.config.get('REPORT_JOB_WORKERS', 2),
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+            )
+    return _executor
+
+
+def _reset_pool():
+    global _executor
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _find(report_type, start_date, end_date, parking_id, version, alive_since):
+    """Готовое или ещё идущее задание с теми же параметрами по той же версии данных"""
+    return db.session.scalar(
+        select(ReportJob)
+        .where(*_same_params(report_type, start_date, end_date, parking_id),
+               ReportJob.data_version == version,
+               or_(ReportJob.status == 'done',
+                   and_(ReportJob.status.in_(ACTIVE), ReportJob.created_at >= alive_since)))
+        .order_by(case((ReportJob.status == 'done', 0), else_=1), ReportJob.job_id.desc())
+        .limit(1)
+    )
+
+
+def submit(report_type, start_date, end_date, parking_id=None):
+    """
+    Задание на отчёт: готовое или идущее с теми же параметрами по текущим
+    данным, иначе новое, отправленное в пул.
+    """
+    start_date, end_date = start_date.date(), end_date.date()
+    parking_id = parking_id or None
+    # версия тех данных, которые увидит отчёт: с реплики, если страница читает с неё
+    version = data_version(start_date=start_date, end_date=end_date, parking_id=parking_id)
+    alive_since = datetime.utcnow() - timedelta(seconds=current_app.config.get('REPORT_JOB_TIMEOUT', 900))
+
+    # сами задания — только в основной БД: реплика может не знать о только что поставленном
+    with replica.primary():
+        job = _find(report_type, start_date, end_date, parking_id, version, alive_since)
+        if job is not None:
+            return job
+
+        job = ReportJob(report_type=report_type, start_date=start_date, end_date=end_date,
+                        parking_id=parking_id, data_version=version, status='queued')
+        db.session.add(job)
+        db.session.commit()
+        db.session.refresh(job)  # после коммита — тоже из основной БД, а не при первом обращении
+
+    try:
+        _pool().submit(run, job.job_id)
+    except BrokenProcessPool:
+        # процесс пула умер (OOM, kill) — пул пересоздаётся
+        _reset_pool()
+        _pool().submit(run, job.job_id)
+    return job
+
+
+def result(job):
+    """Данные отчёта из готового задания — в том же виде, что у get_*()"""
+    return json.loads(zlib.decompress(job.result).decode('utf-8'))
+
+
+def describe(job):
+    """Состояние задания для опроса со страницы"""
+    return {
+        "job_id": job.job_id,
+        "status": job.status,
+        "progress": job.progress,
+        "error": job.error,
+        "rows": job.row_count,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def prune(conn, keep_days=7):
+    """Удалить старые задания и завершённые, для параметров которых есть более новый результат"""
+    newer = aliased(ReportJob)
+    superseded = exists().where(
+        newer.report_type == ReportJob.report_type,
+        newer.start_date == ReportJob.start_date,
+        newer.end_date == ReportJob.end_date,
+        or_(newer.parking_id == ReportJob.parking_id,
+            and_(newer.parking_id.is_(None), ReportJob.parking_id.is_(None))),
+        newer.status == 'done',
+        newer.job_id > ReportJob.job_id,
+    )
+    result = conn.execute(
+        delete(ReportJob).where(or_(
+            ReportJob.created_at < datetime.utcnow() - timedelta(days=keep_days),
+            and_(ReportJob.status.in_(('done', 'failed')), superseded),
+        ))
+    )
+    return result.rowcount
+
+
+# ----------------------------------------------------------------
+#   Процесс пула
+# ----------------------------------------------------------------
+
+def _init_worker():
+    global _app
+    from app import create_app
+    _app = create_app()
+
+
+def _set(job_id, **values):
+    db.session.execute(update(ReportJob).where(ReportJob.job_id == job_id).values(**values))
+    db.session.commit()
+
+
+def run(job_id):
+    """Построить отчёт задания (выполняется в процессе пула)"""
+    from routes import reports
+
+    with _app.app_context():
+        try:
+            job = db.session.get(ReportJob, job_id)
+            if job is None or job.status != 'queued':
+                return
+            # отчёт строится по реплике, если она дошла до версии, с которой
+            # задание поставлено (после своей записи пользователь ставит его
+            # по основной БД); версия берётся до построения — отчёт не старее неё
+            scope = {"start_date": job.start_date, "end_date": job.end_date, "parking_id": job.parking_id}
+            with replica.reading():
+                version = data_version(**scope)
+            on_replica = version == job.data_version
+            if not on_replica:
+                db.session.rollback()
+                version = data_version(**scope)
+            _set(job_id, status='running', progress=5, started_at=datetime.utcnow(), data_version=version)
+
+            build = reports.BUILDERS[job.report_type]
+            params = (datetime.combine(job.start_date, time()),
+                      datetime.combine(job.end_date, time()), job.parking_id)
+            with replica.reading() if on_replica else nullcontext():
+                data = build(*params)
+            db.session.rollback()  # закрыть читающую транзакцию до записи
+            _set(job_id, progress=80)
+
+            payload = zlib.compress(json.dumps(data, ensure_ascii=False).encode('utf-8'), COMPRESS_LEVEL)
+            _set(job_id, status='done', progress=100, result=payload,
+                 row_count=len(data['rows']), finished_at=datetime.utcnow())
+        except Exception as e:
+            db.session.rollback()
+            _set(job_id, status='failed', error=str(e)[:1000], finished_at=datetime.utcnow())
+            current_app.logger.exception("Фоновый отчёт %s не построен", job_id)
+        finally:
+            db.session.remove()
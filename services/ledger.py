@@ -0,0 +1,127 @@
+# app/services/ledger.py
+"""
+Леджер оплат по броням: booking.total_paid, last_payment_date, balance.
+
+Колонки пересчитываются в той же транзакции после каждого flush, в
+котором менялись платежи брони или её rent_size. Массовые операции в
+обход ORM (bulk insert, UPDATE из SQL) леджер не видят — для них есть
+`flask ledger rebuild`, который пересчитывает и сверяет все брони.
+"""
+from itertools import chain
+
+from sqlalchemy import event, inspect, select, update, func, or_
+
+from models import db, Booking, Payment
+
+LEDGER_COLUMNS = ['total_paid', 'last_payment_date', 'balance']
+
+# сколько броней пересчитывать одним UPDATE
+BATCH = 500
+
+_booking = Booking.__table__
+_payment = Payment.__table__
+
+_paid = (
+    select(func.coalesce(func.sum(_payment.c.amount), 0))
+    .where(_payment.c.booking_id == _booking.c.booking_id)
+    .scalar_subquery()
+)
+_last_date = (
+    select(func.max(_payment.c.payment_date))
+    .where(_payment.c.booking_id == _booking.c.booking_id)
+    .scalar_subquery()
+)
+
+
+def refresh_statement():
+    """UPDATE booking с пересчётом леджера (без WHERE — добавляет вызывающий)"""
+    return update(_booking).values(
+        total_paid=_paid,
+        last_payment_date=_last_date,
+        balance=func.coalesce(_booking.c.rent_size, 0) - _paid,
+    )
+
+
+def refresh(conn, booking_ids):
+    """Пересчитать леджер для указанных броней"""
+    booking_ids = sorted(booking_ids)
+    for i in range(0, len(booking_ids), BATCH):
+        chunk = booking_ids[i:i + BATCH]
+        conn.execute(refresh_statement().where(_booking.c.booking_id.in_(chunk)))
+
+
+def mismatches(conn, limit=None):
+    """Брони, у которых сохранённый леджер расходится с платежами"""
+    stored_balance = func.coalesce(_booking.c.balance, 0)
+    expected_balance = func.coalesce(_booking.c.rent_size, 0) - _paid
+
+    query = (
+        select(_booking.c.booking_id, _booking.c.total_paid, _paid.label('actual_paid'))
+        .where(or_(
+            _booking.c.total_paid != _paid,
+            stored_balance != expected_balance,
+            _booking.c.last_payment_date.is_distinct_from(_last_date),
+        ))
+        .order_by(_booking.c.booking_id)
+    )
+    if limit:
+        query = query.limit(limit)
+    return conn.execute(query).all()
+
+
+def rebuild(conn, batch=50000):
+    """Пересчитать леджер всех броней диапазонами booking_id; возвращает число броней"""
+    low, high = conn.execute(select(func.min(_booking.c.booking_id), func.max(_booking.c.booking_id))).one()
+    if low is None:
+        return 0
+
+    total = 0
+    for start in range(low, high + 1, batch):
+        result = conn.execute(
+            refresh_statement().where(_booking.c.booking_id.between(start, start + batch - 1))
+        )
+        total += result.rowcount
+    return total
+
+
+# ----------------------------------------------------------------
+#   Поддержка леджера при flush
+# ----------------------------------------------------------------
+
+def _touched_booking_ids(session):
+    ids = set()
+
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Payment):
+            history = inspect(obj).attrs.booking_id.history
+            ids.update(chain(history.added, history.unchanged, history.deleted))
+        elif isinstance(obj, Booking) and obj not in session.deleted:
+            if obj in session.new or inspect(obj).attrs.rent_size.history.has_changes():
+                ids.add(obj.booking_id)
+
+    ids.discard(None)
+    return ids
+
+
+def _after_flush(session, flush_context):
+    ids = _touched_booking_ids(session)
+    if not ids:
+        return
+
+    refresh(session.connection(), ids)
+    session.info.setdefault('ledger_refreshed', set()).update(ids)
+
+
+def _after_flush_postexec(session, flush_context):
+    # значения в объектах устарели — перечитаем при следующем обращении
+    for booking_id in session.info.pop('ledger_refreshed', ()):
+        obj = session.identity_map.get(session.identity_key(Booking, booking_id))
+        if obj is not None:
+            session.expire(obj, LEDGER_COLUMNS)
+
+
+def init_app(app):
+    """Подписка на события сессии (один раз на процесс)"""
+    if not event.contains(db.session, 'after_flush', _after_flush):
+        event.listen(db.session, 'after_flush', _after_flush)
+        event.listen(db.session, 'after_flush_postexec', _after_flush_postexec)
@@ -0,0 +1,439 @@
+# app/services/metrics.py
+"""
+Метрики запросов: SQL, шаблоны, память.
+
+На каждый HTTP-запрос считаются число SQL-запросов и время в БД (события
+before/after_cursor_execute на всех движках), время рендеринга шаблонов
+(сигналы Flask before_render_template / template_rendered — сюда же
+попадают ленивые загрузки, вызванные из шаблона) и, если включён
+METRICS_TRACEMALLOC, пик выделенной памяти.
+
+Куда уходят цифры:
+  Server-Timing — в заголовке каждого ответа (видно в DevTools браузера);
+  /metrics      — сводка по endpoint'ам в формате Prometheus; доступ — по
+                  METRICS_TOKEN (Authorization: Bearer), а без токена —
+                  только после входа;
+  журнал        — запрос дольше METRICS_SLOW_MS пишется с N самыми
+                  дорогими SQL (одинаковые запросы суммируются — так видно N+1).
+
+Счётчики копятся в процессе, а воркеры gunicorn слушают один порт: без
+общего хранилища каждый сбор попадал бы в случайный воркер, и счётчики
+скакали бы между сборами. Поэтому с METRICS_DIR (gunicorn.conf.py задаёт
+его сам, если воркеров больше одного) каждый процесс пишет снимок в
+METRICS_DIR/<pid>.json — фоновым потоком раз в METRICS_FLUSH_SECONDS и
+при выходе, — а /metrics суммирует снимки всех процессов. Счётчики
+завершившихся воркеров (перезапуск по max_requests) сливаются в dead.json
+и не пропадают; их датчики (записи кэша, подписчики) отбрасываются. Без
+METRICS_DIR /metrics отдаёт только свой процесс — это годится для одного
+воркера.
+
+Запросы, выполняемые уже при отдаче потокового ответа (выгрузки, SSE),
+не учитываются.
+"""
+import atexit
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+
+from flask import Response, current_app, g, has_app_context, request, template_rendered, before_render_template
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from services import pubsub
+from services.cache import grid_cache
+
+log = logging.getLogger(__name__)
+
+# границы корзин гистограммы длительности запроса, секунды
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.peak_bytes = None
+        self.memory_base = 0
+        self.status = 500  # если after_request не дошёл — запрос упал
+        self.statements = {}  # SQL → [число, время]
+        self.template_stack = []
+
+    def add_query(self, statement, elapsed):
+        self.queries += 1
+        self.db_time += elapsed
+        entry = self.statements.setdefault(statement, [0, 0.0])
+        entry[0] += 1
+        entry[1] += elapsed
+
+    def top_statements(self, n):
+        return sorted(self.statements.items(), key=lambda item: item[1][1], reverse=True)[:n]
+
+
+class EndpointStats:
+    def __init__(self):
+        self.statuses = {}
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.seconds = 0.0
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+        self.peak_bytes = 0
+
+    def to_dict(self):
+        return {
+            "statuses": [[method, status, count] for (method, status), count in self.statuses.items()],
+            "buckets": self.buckets, "count": self.count, "seconds": self.seconds,
+            "queries": self.queries, "db_seconds": self.db_seconds,
+            "template_seconds": self.template_seconds, "peak_bytes": self.peak_bytes,
+        }
+
+    def merge(self, data):
+        """Добавить снимок другого процесса (to_dict)"""
+        for method, status, count in data["statuses"]:
+            key = (method, status)
+            self.statuses[key] = self.statuses.get(key, 0) + count
+        self.buckets = [a + b for a, b in zip(self.buckets, data["buckets"])]
+        for attr in ("count", "seconds", "queries", "db_seconds", "template_seconds"):
+            setattr(self, attr, getattr(self, attr) + data[attr])
+        self.peak_bytes = max(self.peak_bytes, data["peak_bytes"])
+
+
+class Registry:
+    """Накопленные метрики процесса по endpoint'ам"""
+
+    def __init__(self):
+        self.endpoints = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, method, status, elapsed, stats):
+        with self._lock:
+            item = self.endpoints.setdefault(endpoint, EndpointStats())
+            key = (method, status)
+            item.statuses[key] = item.statuses.get(key, 0) + 1
+            item.count += 1
+            item.seconds += elapsed
+            for i, bound in enumerate(BUCKETS):
+                if elapsed <= bound:
+                    item.buckets[i] += 1
+            item.queries += stats.queries
+            item.db_seconds += stats.db_time
+            item.template_seconds += stats.template_time
+            if stats.peak_bytes:
+                item.peak_bytes = max(item.peak_bytes, stats.peak_bytes)
+
+    def snapshot(self):
+        """Метрики процесса словарём (JSON): endpoint'ы, счётчики и датчики процесса"""
+        with self._lock:
+            endpoints = {name: item.to_dict() for name, item in self.endpoints.items()}
+        cache = grid_cache.stats()
+        return {
+            "endpoints": endpoints,
+            "counters": {"grid_cache_hits": cache['hits'], "grid_cache_misses": cache['misses']},
+            "gauges": {"grid_cache_entries": cache['entries'], "grid_stream_subscribers": len(pubsub.broker)},
+        }
+
+    def render(self):
+        return render(self.snapshot())
+
+
+def _merge(snapshots):
+    """Сумма снимков: счётчики складываются, пик памяти — наибольший"""
+    endpoints, counters, gauges = {}, {}, {}
+    for data in snapshots:
+        for name, item in data.get("endpoints", {}).items():
+            endpoints.setdefault(name, EndpointStats()).merge(item)
+        for group, total in (("counters", counters), ("gauges", gauges)):
+            for name, value in data.get(group, {}).items():
+                total[name] = total.get(name, 0) + value
+    return {
+        "endpoints": {name: item.to_dict() for name, item in endpoints.items()},
+        "counters": counters,
+        "gauges": gauges,
+    }
+
+
+def render(data):
+    """Текст в формате Prometheus exposition из снимка (Registry.snapshot или _merge)"""
+    endpoints = sorted(data["endpoints"].items())
+
+    lines = [
+        "# HELP parking_requests_total HTTP-запросы по endpoint, методу и статусу",
+        "# TYPE parking_requests_total counter",
+    ]
+    for name, item in endpoints:
+        for method, status, count in sorted(item["statuses"]):
+            lines.append(f'parking_requests_total{{endpoint="{name}",method="{method}",status="{status}"}} {count}')
+
+    lines += [
+        "# HELP parking_request_seconds Длительность запроса",
+        "# TYPE parking_request_seconds histogram",
+    ]
+    for name, item in endpoints:
+        for bound, count in zip(BUCKETS, item["buckets"]):
+            lines.append(f'parking_request_seconds_bucket{{endpoint="{name}",le="{bound}"}} {count}')
+        lines.append(f'parking_request_seconds_bucket{{endpoint="{name}",le="+Inf"}} {item["count"]}')
+        lines.append(f'parking_request_seconds_sum{{endpoint="{name}"}} {item["seconds"]:.6f}')
+        lines.append(f'parking_request_seconds_count{{endpoint="{name}"}} {item["count"]}')
+
+    for metric, kind, help_text, attr in (
+        ("parking_db_queries_total", "counter", "SQL-запросы", "queries"),
+        ("parking_db_seconds_total", "counter", "Время в БД", "db_seconds"),
+        ("parking_template_seconds_total", "counter", "Время рендеринга шаблонов", "template_seconds"),
+        ("parking_request_peak_bytes", "gauge", "Наибольший прирост памяти за запрос (tracemalloc)", "peak_bytes"),
+    ):
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}"]
+        for name, item in endpoints:
+            value = item[attr]
+            lines.append(f'{metric}{{endpoint="{name}"}} {value:.6f}' if isinstance(value, float)
+                         else f'{metric}{{endpoint="{name}"}} {value}')
+
+    counters, gauges = data["counters"], data["gauges"]
+    lines += [
+        "# TYPE parking_grid_cache_hits_total counter",
+        f"parking_grid_cache_hits_total {counters.get('grid_cache_hits', 0)}",
+        "# TYPE parking_grid_cache_misses_total counter",
+        f"parking_grid_cache_misses_total {counters.get('grid_cache_misses', 0)}",
+        "# TYPE parking_grid_cache_entries gauge",
+        f"parking_grid_cache_entries {gauges.get('grid_cache_entries', 0)}",
+        "# TYPE parking_grid_stream_subscribers gauge",
+        f"parking_grid_stream_subscribers {gauges.get('grid_stream_subscribers', 0)}",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SharedDirectory:
+    """Снимки процессов в общем каталоге METRICS_DIR: /metrics суммирует все воркеры"""
+
+    DEAD = 'dead.json'
+
+    def __init__(self, path, interval=5):
+        self.path = path
+        self.interval = interval
+        self._dirty = False
+        self._thread = None
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _write(self, name, data):
+        # сначала во временный файл: читатель не увидит недописанный снимок
+        tmp = self._file(f'{name}.{os.getpid()}.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp, self._file(name))
+
+    def _read(self, name):
+        try:
+            with open(self._file(name), encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def touch(self):
+        """Метрики процесса изменились — снимок запишет фоновый поток"""
+        self._dirty = True
+        if self._thread is None:
+            with self._lock:
+                # поток запускается при первом запросе — уже в воркере, после fork
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='metrics-flush', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            if self._dirty:
+                try:
+                    self.flush()
+                except OSError:
+                    log.exception("Снимок метрик не записан в %s", self.path)
+
+    def flush(self):
+        """Записать снимок своего процесса"""
+        with self._lock:
+            self._dirty = False
+            self._write(f'{os.getpid()}.json', registry.snapshot())
+
+    def collect(self):
+        """Сумма снимков всех процессов; снимки завершившихся сливаются в dead.json"""
+        # fcntl есть только в POSIX: с METRICS_DIR приложение работает под gunicorn,
+        # а на Windows (разработка) модуль не должен его требовать
+        import fcntl
+
+        self.flush()
+        with open(self._file('lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            live, dead = [], []
+            for name in os.listdir(self.path):
+                stem, ext = os.path.splitext(name)
+                if ext == '.json' and stem.isdigit():
+                    (live if _alive(int(stem)) else dead).append(name)
+
+            if dead:
+                archived = [self._read(self.DEAD) or {}]
+                archived += [data for data in map(self._read, dead) if data]
+                merged = _merge(archived)
+                merged["gauges"] = {}  # датчики завершившихся процессов не нужны
+                self._write(self.DEAD, merged)
+                for name in dead:
+                    os.remove(self._file(name))
+
+            snapshots = [data for data in map(self._read, live + [self.DEAD]) if data]
+        return _merge(snapshots)
+
+
+registry = Registry()
+shared = None  # SharedDirectory, если задан METRICS_DIR
+
+
+def _current():
+    return g.get('perf') if has_app_context() else None
+
+
+# --- SQL ---
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and _current() is not None:
+        context.perf_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current()
+    started = getattr(context, 'perf_started', None)
+    if stats is not None and started is not None:
+        stats.add_query(statement, time.perf_counter() - started)
+
+
+# --- шаблоны ---
+
+def _before_render(sender, template, context, **extra):
+    stats = _current()
+    if stats is not None:
+        stats.template_stack.append(time.perf_counter())
+
+
+def _rendered(sender, template, context, **extra):
+    stats = _current()
+    if stats is not None and stats.template_stack:
+        elapsed = time.perf_counter() - stats.template_stack.pop()
+        # вложенный рендер уже учтён во внешнем
+        if not stats.template_stack:
+            stats.template_time += elapsed
+
+
+# --- запрос ---
+
+def _start_request():
+    g.perf = RequestStats()
+    if current_app.config.get('METRICS_TRACEMALLOC') and tracemalloc.is_tracing():
+        # пик общий для процесса: при параллельных запросах это пик за время запроса
+        tracemalloc.reset_peak()
+        g.perf.memory_base = tracemalloc.get_traced_memory()[0]
+
+
+def _server_timing(response):
+    stats = g.get('perf')
+    if stats is None:
+        return response
+
+    stats.status = response.status_code
+    total = (time.perf_counter() - stats.started) * 1000
+    parts = [
+        f'db;dur={stats.db_time * 1000:.1f};desc="SQL x{stats.queries}"',
+        f'tpl;dur={stats.template_time * 1000:.1f}',
+        f'app;dur={total:.1f}',
+    ]
+    response.headers['Server-Timing'] = ", ".join(parts)
+    return response
+
+
+def _finish_request(exc):
+    # pop: при потоковом ответе контекст снимается повторно — считаем один раз
+    stats = g.pop('perf', None)
+    if stats is None:
+        return
+
+    elapsed = time.perf_counter() - stats.started
+    if current_app.config.get('METRICS_TRACEMALLOC') and tracemalloc.is_tracing():
+        stats.peak_bytes = tracemalloc.get_traced_memory()[1] - stats.memory_base
+
+    endpoint = request.endpoint or 'unknown'
+    registry.record(endpoint, request.method, stats.status, elapsed, stats)
+    if shared is not None:
+        shared.touch()
+
+    if elapsed * 1000 >= current_app.config.get('METRICS_SLOW_MS', 500):
+        top = stats.top_statements(current_app.config.get('METRICS_SLOW_TOP', 5))
+        listing = "\n".join(
+            f"  {total * 1000:8.1f} ms  x{count:<4} {' '.join(sql.split())[:300]}"
+            for sql, (count, total) in top
+        )
+        log.warning(
+            "Медленный запрос %s %s: %.0f ms, SQL %d шт. / %.0f ms, шаблоны %.0f ms\n%s",
+            request.method, request.full_path.rstrip('?'), elapsed * 1000,
+            stats.queries, stats.db_time * 1000, stats.template_time * 1000, listing
+        )
+
+
+def metrics_view():
+    """Сводка для Prometheus: с METRICS_TOKEN — по токену, без него — только вошедшим"""
+    token = current_app.config.get('METRICS_TOKEN')
+    if token:
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return Response(status=401)
+    elif not current_user.is_authenticated:
+        return Response(status=401)
+    text = render(shared.collect()) if shared is not None else registry.render()
+    return Response(text, mimetype='text/plain; version=0.0.4')
+
+
+def _flush_at_exit():
+    # процессы без запросов (пул отчётов, команды flask) снимков не оставляют
+    if shared is not None and registry.endpoints:
+        shared.flush()
+
+
+def init_app(app):
+    global shared
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+
+    if app.config.get('METRICS_DIR') and shared is None:
+        shared = SharedDirectory(app.config['METRICS_DIR'], app.config.get('METRICS_FLUSH_SECONDS', 5))
+        atexit.register(_flush_at_exit)
+
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_rendered, app)
+
+    app.before_request(_start_request)
+    app.after_request(_server_timing)
+    app.teardown_request(_finish_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+
+    if app.config.get('METRICS_TRACEMALLOC') and not tracemalloc.is_tracing():
+        tracemalloc.start()
@@ -0,0 +1,111 @@
+# app/services/occupancy.py
+from collections import namedtuple
+from datetime import date
+
+from sqlalchemy import or_, and_
+from sqlalchemy.orm import joinedload
+from models import db, ParkingSpot, Booking, Client
+from services import archive
+
+
+# Ячейка шахматки: бронь, занимающая место в конкретном месяце
+GridCell = namedtuple(
+    'GridCell', 'booking_id client_id client_name rent_size paid status'
+)
+
+
+def year_bounds(year):
+    """Первый и последний день года"""
+    return date(year, 1, 1), date(year, 12, 31)
+
+
+def load_spots(parking_id=None, spot_id=None):
+    """Места парковки (или всех парковок), отсортированные по номеру; spot_id — только одно место"""
+    query = ParkingSpot.query.options(joinedload(ParkingSpot.parking))
+
+    if parking_id:
+        query = query.filter(ParkingSpot.parking_id == parking_id)
+    if spot_id:
+        query = query.filter(ParkingSpot.spot_id == spot_id)
+
+    return query.order_by(ParkingSpot.number).all()
+
+
+def load_spots_page(parking_id=None, after=None, limit=100):
+    """
+    Страница мест, отсортированных по (номер, id).
+
+    after — курсор {"after_number", "after_id"}: последнее место предыдущей
+    страницы. Возвращает (места, курсор следующей страницы или None).
+    """
+    query = ParkingSpot.query.options(joinedload(ParkingSpot.parking))
+
+    if parking_id:
+        query = query.filter(ParkingSpot.parking_id == parking_id)
+
+    if after:
+        query = query.filter(or_(
+            ParkingSpot.number > after["after_number"],
+            and_(ParkingSpot.number == after["after_number"], ParkingSpot.spot_id > after["after_id"])
+        ))
+
+    # на одно место больше — чтобы понять, есть ли следующая страница
+    spots = query.order_by(ParkingSpot.number, ParkingSpot.spot_id).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(spots) > limit:
+        spots = spots[:limit]
+        next_cursor = {"after_number": spots[-1].number, "after_id": spots[-1].spot_id}
+    return spots, next_cursor
+
+
+def build_grid(year, parking_id=None, spot_ids=None):
+    """
+    Матрица «место × месяц» за год.
+
+    Берём только брони, пересекающие год (и выбранную парковку), вместе с
+    суммой оплат из леджера брони, а матрицу строим за один проход по броням,
+    отсортированным по дате начала. Возвращает {spot_id: {месяц: GridCell}}.
+    spot_ids ограничивает сетку указанными местами.
+    """
+    year_start, year_end = year_bounds(year)
+
+    # прошлые годы — вместе с архивом (services/archive.py)
+    B = archive.source(Booking, year_start)
+    window = (B.start_date <= year_end) & (B.end_date >= year_start)
+
+    query = (
+        db.session.query(
+            B.booking_id,
+            B.spot_id,
+            B.start_date,
+            B.end_date,
+            B.rent_size,
+            B.client_id,
+            Client.name,
+            B.total_paid
+        )
+        .outerjoin(Client, Client.client_id == B.client_id)
+        .filter(window)
+    )
+    if parking_id:
+        query = query.join(ParkingSpot, ParkingSpot.spot_id == B.spot_id).filter(ParkingSpot.parking_id == parking_id)
+    if spot_ids is not None:
+        query = query.filter(B.spot_id.in_(spot_ids))
+
+    rows = query.order_by(B.start_date, B.booking_id).all()
+
+    grid = {}
+    for booking_id, spot_id, start, end, rent, client_id, client_name, total_paid in rows:
+        status = "занято" if total_paid >= (rent or 0) else "забронировано"
+        cell = GridCell(booking_id, client_id, client_name, rent, total_paid, status)
+
+        first_month = start.month if start >= year_start else 1
+        last_month = end.month if end <= year_end else 12
+
+        months = grid.setdefault(spot_id, {})
+        for month_index in range(first_month, last_month + 1):
+            # при пересечении броней показываем более раннюю
+            months.setdefault(month_index, cell)
+
+    return grid
@@ -0,0 +1,65 @@
+# app/services/overlap.py
+"""
+Проверка пересечения броней одного места.
+
+В Postgres пересечения запрещает ограничение-исключение booking_no_overlap
+(GiST по spot_id и daterange), так что параллельные записи не проходят
+даже при гонке между проверкой и INSERT. Проверки здесь дают понятное
+сообщение заранее, а в SQLite (тесты, локальный запуск) — единственная
+защита; там запись всё равно сериализуется блокировкой базы.
+"""
+from collections import defaultdict
+
+from sqlalchemy import select
+
+from models import db, Booking
+from services.intervals import IntervalSet
+
+CONSTRAINT_NAME = 'booking_no_overlap'
+
+
+def find_conflict(spot_id, start, end, exclude_booking_id=None):
+    """Бронь этого места, пересекающая [start, end], или None"""
+    query = Booking.query.filter(
+        Booking.spot_id == spot_id,
+        Booking.start_date <= end,
+        Booking.end_date >= start
+    )
+    if exclude_booking_id:
+        query = query.filter(Booking.booking_id != exclude_booking_id)
+
+    return query.order_by(Booking.start_date).first()
+
+
+def load_index(spot_ids, window_start, window_end, exclude_booking_id=None):
+    """
+    {spot_id: IntervalSet} занятости мест в окне — одним запросом на 500 мест.
+    spot_ids=None — все места.
+    """
+    index = defaultdict(IntervalSet)
+
+    query = (
+        select(Booking.spot_id, Booking.start_date, Booking.end_date)
+        .where(Booking.start_date <= window_end,
+               Booking.end_date >= window_start)
+    )
+    if exclude_booking_id:
+        query = query.where(Booking.booking_id != exclude_booking_id)
+
+    if spot_ids is None:
+        chunks = [query]
+    else:
+        spot_ids = list(spot_ids)
+        chunks = [query.where(Booking.spot_id.in_(spot_ids[i:i + 500]))
+                  for i in range(0, len(spot_ids), 500)]
+
+    for chunk in chunks:
+        for spot_id, start, end in db.session.execute(chunk):
+            index[spot_id].add(start, end)
+
+    return index
+
+
+def is_overlap_violation(error):
+    """IntegrityError вызван ограничением booking_no_overlap"""
+    return CONSTRAINT_NAME in str(getattr(error, 'orig', error))
@@ -0,0 +1,88 @@
+# app/services/passwords.py
+"""
+Хэширование паролей (scrypt из werkzeug) с настраиваемой стоимостью.
+
+scrypt специально тяжёлый: десятки миллисекунд CPU и десятки мегабайт
+памяти на вызов. Поэтому вычисления идут в ограниченном пуле потоков
+процесса (hashlib.scrypt отпускает GIL): одновременно считается не больше
+PASSWORD_HASH_WORKERS хэшей, ещё PASSWORD_HASH_QUEUE ждут в очереди, а
+сверх этого вход сразу отклоняется (PasswordHashBusy) — всплеск попыток
+входа не съедает все ядра и не занимает все воркеры ожиданием.
+
+Стоимость: PASSWORD_SCRYPT_N / _R / _P. Хэш с другими параметрами (и
+пароль, ещё хранящийся открытым текстом) после успешного входа
+перехэшируется с текущими — needs_rehash в verify().
+"""
+import hmac
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# методы, которыми могли быть получены хэши в таблице users
+HASH_PREFIXES = ('scrypt:', 'pbkdf2:')
+
+
+class PasswordHashBusy(RuntimeError):
+    """Очередь хэширования заполнена — попробовать позже"""
+
+
+_executor = None
+_slots = None
+_lock = threading.Lock()
+
+
+def _pool():
+    global _executor, _slots
+    with _lock:
+        if _executor is None:
+            workers = current_app.config.get('PASSWORD_HASH_WORKERS') or os.cpu_count() or 1
+            queue = current_app.config.get('PASSWORD_HASH_QUEUE', 16)
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+            _slots = threading.BoundedSemaphore(workers + queue)
+    return _executor, _slots
+
+
+def _run(fn, *args):
+    executor, slots = _pool()
+    if not slots.acquire(blocking=False):
+        raise PasswordHashBusy()
+    try:
+        future = executor.submit(fn, *args)
+    except BaseException:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+    try:
+        return future.result(timeout=current_app.config.get('PASSWORD_HASH_TIMEOUT', 10))
+    except FuturesTimeout:
+        # пул занят дольше таймаута — для входа это то же, что полная очередь
+        future.cancel()
+        raise PasswordHashBusy()
+
+
+def method():
+    config = current_app.config
+    return (f"scrypt:{config.get('PASSWORD_SCRYPT_N', 2 ** 15)}"
+            f":{config.get('PASSWORD_SCRYPT_R', 8)}:{config.get('PASSWORD_SCRYPT_P', 1)}")
+
+
+def is_hashed(stored):
+    return stored.startswith(HASH_PREFIXES) and stored.count('$') == 2
+
+
+def hash_password(password):
+    return _run(generate_password_hash, password, method())
+
+
+def verify(stored, password):
+    """(пароль верен, нужно перехэшировать)"""
+    if not is_hashed(stored):
+        # пароль из времён до хэширования
+        ok = hmac.compare_digest(stored.encode(), password.encode())
+        return ok, ok
+
+    ok = _run(check_password_hash, stored, password)
+    return ok, ok and not stored.startswith(method() + '$')
@@ -0,0 +1,222 @@
+# app/services/pubsub.py
+"""
+Рассылка изменений шахматки открытым страницам (server-sent events).
+
+Событие — список затронутых областей [парковка, год]; год None означает,
+что изменился состав мест парковки. Страница, чья область затронута,
+сама забирает изменённые ячейки через grid.json?since=<версия>
+(services/gridsync.py), так что событие остаётся маленьким, а пропущенные
+события восполняются следующей синхронизацией.
+
+Бэкенды (GRID_PUSH_BACKEND):
+  memory   — события коммитов этого процесса; страницы, открытые на других
+             воркерах, их не получат — только для одного процесса;
+  postgres — pg_notify в транзакции записи (уходит только при коммите);
+             в каждом процессе один поток слушает LISTEN и раздаёт события
+             своим подписчикам;
+  none     — по умолчанию: рассылка выключена, поток отвечает 204, а
+             страница раз в GRID_POLL_SECONDS сверяется с grid.json?since=.
+
+Подписчик — очередь в памяти, а не поток: ожидание события — это
+queue.get с таймаутом. Но в sync- и gthread-воркерах это ожидание всё
+равно держит поток или процесс на всё время соединения, поэтому рассылка
+работает только с gevent (GUNICORN_PRESET=gevent), где ожидание очереди
+и select слушателя — гринлеты. При другом пресете, как и при memory с
+несколькими воркерами, gunicorn.conf.py выключает рассылку при старте.
+"""
+import json
+import logging
+import queue
+import select
+import threading
+import time
+
+from sqlalchemy import func
+
+from models import db
+from services import changes
+
+log = logging.getLogger(__name__)
+
+CHANNEL = 'grid_changes'
+
+# интервал комментария-пинга, чтобы прокси не закрывали простаивающее соединение
+HEARTBEAT = 15
+
+# после этого соединение закрывается; EventSource переподключится сам,
+# заново пройдя проверку входа
+STREAM_MAX_AGE = 1800
+
+# лимит payload у NOTIFY — 8000 байт
+NOTIFY_LIMIT = 7900
+
+RESYNC = {"resync": True}
+
+
+class Subscription:
+    def __init__(self, broker, maxsize=100):
+        self._broker = broker
+        self._queue = queue.Queue(maxsize)
+
+    def put(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            # клиент не успевает читать — вместо очереди событий одна полная сверка
+            with self._queue.mutex:
+                self._queue.queue.clear()
+            self._queue.put_nowait(RESYNC)
+
+    def get(self, timeout):
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self._broker.unsubscribe(self)
+
+
+class Broker:
+    """Подписчики этого процесса"""
+
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def subscribe(self):
+        sub = Subscription(self)
+        with self._lock:
+            self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def publish(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            sub.put(event)
+
+
+broker = Broker()
+
+_backend = 'none'
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def event_for(change_set):
+    scopes = {(parking_id, year) for parking_id, _, year, _ in change_set.cells}
+    scopes |= {(parking_id, None) for parking_id in change_set.parking_ids}
+    return {"scopes": sorted(scopes, key=str)}
+
+
+def enabled():
+    return _backend in ('memory', 'postgres')
+
+
+def subscribe():
+    """Новый подписчик; при бэкенде postgres запускает слушателя процесса"""
+    if _backend == 'postgres':
+        _ensure_listener(db.engine)
+    return broker.subscribe()
+
+
+def sse(sub):
+    """Поток text/event-stream для подписчика; подписка снимается при разрыве"""
+    deadline = time.monotonic() + STREAM_MAX_AGE
+    try:
+        yield "retry: 5000\n\n"
+        while time.monotonic() < deadline:
+            event = sub.get(timeout=HEARTBEAT)
+            if event is None:
+                yield ": ping\n\n"
+            else:
+                yield f"data: {json.dumps(event)}\n\n"
+    finally:
+        sub.close()
+
+
+# --- бэкенд memory ---
+
+def _publish_committed(change_set):
+    if change_set.cells or change_set.parking_ids:
+        broker.publish(event_for(change_set))
+
+
+# --- бэкенд postgres ---
+
+def _notify(session, change_set):
+    if not (change_set.cells or change_set.parking_ids):
+        return
+
+    event = event_for(change_set)
+    payload = json.dumps(event)
+    if len(payload) > NOTIFY_LIMIT:
+        # слишком много областей — достаточно сказать, какие парковки сверить
+        parking_ids = {parking_id for parking_id, _ in event["scopes"]}
+        payload = json.dumps({"scopes": [[p, None] for p in sorted(parking_ids)]})
+
+    session.connection().execute(func.pg_notify(CHANNEL, payload).select())
+
+
+class _Listener(threading.Thread):
+    """LISTEN на отдельном соединении; события раздаются подписчикам процесса"""
+
+    def __init__(self, engine):
+        super().__init__(name='grid-listener', daemon=True)
+        self.engine = engine
+
+    def run(self):
+        while True:
+            try:
+                self._listen()
+            except Exception:
+                log.exception("LISTEN %s прерван, переподключение", CHANNEL)
+            # пока соединения не было, события могли потеряться
+            broker.publish(RESYNC)
+            time.sleep(5)
+
+    def _listen(self):
+        conn = self.engine.raw_connection()
+        conn.detach()  # соединение в режиме autocommit не возвращаем в пул
+        try:
+            dbapi = conn.driver_connection
+            dbapi.autocommit = True
+            with dbapi.cursor() as cursor:
+                cursor.execute(f"LISTEN {CHANNEL}")
+
+            while True:
+                if select.select([dbapi], [], [], HEARTBEAT) == ([], [], []):
+                    continue
+                dbapi.poll()
+                while dbapi.notifies:
+                    note = dbapi.notifies.pop(0)
+                    broker.publish(json.loads(note.payload))
+        finally:
+            conn.close()
+
+
+def _ensure_listener(engine):
+    # поток запускается при первой подписке — уже в воркере, после fork
+    global _listener
+    with _listener_lock:
+        if _listener is None or not _listener.is_alive():
+            _listener = _Listener(engine)
+            _listener.start()
+
+
+def init_app(app):
+    global _backend
+    _backend = app.config.get('GRID_PUSH_BACKEND', 'none')
+
+    if _backend == 'memory':
+        changes.on_commit(_publish_committed)
+    elif _backend == 'postgres':
+        changes.on_prepare(_notify)
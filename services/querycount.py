@@ -0,0 +1,45 @@
+# app/services/querycount.py
+"""Подсчёт SQL-запросов и проверка бюджета запросов (для отчётов и страниц)"""
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Блок кода выполнил больше запросов, чем разрешено"""
+
+
+class QueryCounter:
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+
+@contextmanager
+def count_queries(engine):
+    """Считает запросы, отправленные через engine внутри блока with"""
+    counter = QueryCounter()
+    event.listen(engine, 'before_cursor_execute', counter._on_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, 'before_cursor_execute', counter._on_execute)
+
+
+@contextmanager
+def query_budget(engine, limit, label='block'):
+    """Как count_queries, но бросает QueryBudgetExceeded при превышении limit"""
+    with count_queries(engine) as counter:
+        yield counter
+
+    if counter.count > limit:
+        listing = "\n".join(f"  {i}. {sql}" for i, sql in enumerate(counter.statements, 1))
+        raise QueryBudgetExceeded(
+            f"{label}: {counter.count} запросов при бюджете {limit}\n{listing}"
+        )
@@ -0,0 +1,85 @@
+# app/services/ratelimit.py
+"""
+Ограничение частоты попыток (token bucket) в памяти процесса.
+
+У каждого ключа (IP, имя пользователя) — ведро на burst жетонов, которое
+пополняется со скоростью rate жетонов в секунду; попытка забирает жетон.
+Пустое ведро — отказ и время до следующего жетона (для Retry-After).
+Общее ведро на все ключи ограничивает суммарный поток попыток процесса,
+чтобы распределённый перебор с разных адресов не загрузил все ядра
+хэшированием паролей.
+
+Счётчики у каждого воркера свои, поэтому итоговый лимит — лимит × число
+процессов. За прокси адрес клиента нужно восстановить из X-Forwarded-For
+(werkzeug ProxyFix), иначе все попытки придут с адреса прокси.
+"""
+import threading
+import time
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}  # ключ → (жетоны, время обновления)
+        self._lock = threading.Lock()
+
+    def take(self, key, now=None):
+        """0 — жетон выдан, иначе секунды до следующего"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                retry = 0
+            else:
+                self._buckets[key] = (tokens, now)
+                retry = (1 - tokens) / self.rate
+
+            if len(self._buckets) > 10000:
+                self._prune(now)
+            return retry
+
+    def _prune(self, now):
+        # полные вёдра неотличимы от отсутствующих
+        full = [key for key, (tokens, updated) in self._buckets.items()
+                if tokens + (now - updated) * self.rate >= self.burst]
+        for key in full:
+            del self._buckets[key]
+
+
+class RateLimiter:
+    """Несколько вёдер: попытка проходит, только если жетон есть во всех"""
+
+    def __init__(self, per_key_rate, per_key_burst, total_rate, total_burst):
+        self.per_key = TokenBucket(per_key_rate, per_key_burst)
+        self.total = TokenBucket(total_rate, total_burst)
+
+    def check(self, *keys):
+        """0 — можно, иначе секунды ожидания"""
+        retry = max((self.per_key.take(key) for key in keys if key), default=0)
+        if retry:
+            return retry
+        return self.total.take('*')
+
+
+_limiters = {}
+
+
+def limiter(app, name):
+    """
+    Ограничитель name с параметрами из конфига: <NAME>_RATE — попыток в минуту
+    на ключ, <NAME>_BURST — запас, <NAME>_TOTAL_RATE / _TOTAL_BURST — общее
+    ведро процесса, попыток в секунду.
+    """
+    if name not in _limiters:
+        prefix = name.upper()
+        _limiters[name] = RateLimiter(
+            app.config.get(f'{prefix}_RATE', 10) / 60,
+            app.config.get(f'{prefix}_BURST', 5),
+            app.config.get(f'{prefix}_TOTAL_RATE', 20),
+            app.config.get(f'{prefix}_TOTAL_BURST', 40),
+        )
+    return _limiters[name]
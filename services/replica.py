@@ -0,0 +1,117 @@
+# app/services/replica.py
+"""
+Чтение с реплики БД.
+
+Если задан DATABASE_REPLICA_URL, у db появляется второй движок — bind
+'replica'. Страницы, помеченные @replica.reads (отчёты, выгрузка,
+шахматка, списки), и фоновые отчёты (services/jobs.py) читают с него;
+всё остальное, а также любая запись — flush сессии, INSERT/UPDATE/DELETE
+через session.execute, SELECT … FOR UPDATE — идёт в основную БД. Решение
+принимает RoutingSession.get_bind, поэтому прикладной код не меняется.
+
+Свои изменения пользователь видит сразу: после запроса, который что-то
+записал (или любого POST), в сессию Flask ставится отметка, и ещё
+REPLICA_STICKY_SECONDS все его запросы читают из основной БД — пока
+реплика догоняет.
+
+Локально реплику можно проверить на двух файлах SQLite:
+
+    DATABASE_URL=sqlite:///main.db DATABASE_REPLICA_URL=sqlite:///replica.db flask replica sync
+
+(sync копирует основную БД в реплику; между запусками реплика «отстаёт»).
+Для Postgres реплика — потоковая (standby второго экземпляра, в том числе
+локального), и sync не нужен; отставание показывает `flask replica status`.
+"""
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, g, has_app_context, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+
+REPLICA = 'replica'
+
+# отметка «читать из основной БД до» в сессии Flask
+STICKY_KEY = 'db_primary_until'
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def enabled():
+    return REPLICA in (current_app.config.get('SQLALCHEMY_BINDS') or {})
+
+
+def _sticky():
+    return has_request_context() and session.get(STICKY_KEY, 0) > time.time()
+
+
+def routed():
+    """Идут ли сейчас чтения на реплику"""
+    return (has_app_context() and g.get('db_replica', False) and not g.get('db_primary', False)
+            and enabled() and not _sticky())
+
+
+def reads(view):
+    """
+    Страница только читает — её запросы идут на реплику. Ставится под
+    @login_required: пользователь сессии загружается из основной БД.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        # без восстановления: потоковая выгрузка читает уже после возврата из view
+        g.db_replica = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def reading():
+    """Читать с реплики вне страницы (процесс пула фоновых отчётов)"""
+    previous = g.get('db_replica', False)
+    g.db_replica = True
+    try:
+        yield
+    finally:
+        g.db_replica = previous
+
+
+@contextmanager
+def primary():
+    """Читать из основной БД внутри страницы, помеченной @reads (перед записью)"""
+    previous = g.get('db_primary', False)
+    g.db_primary = True
+    try:
+        yield
+    finally:
+        g.db_primary = previous
+
+
+def _writes(session, clause):
+    if session._flushing:
+        return True
+    if clause is None:
+        return False
+    return getattr(clause, 'is_dml', False) or getattr(clause, '_for_update_arg', None) is not None
+
+
+class RoutingSession(Session):
+    """Сессия db: чтения на реплику там, где это разрешено (routed())"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            if _writes(self, clause):
+                if has_app_context():
+                    g.db_wrote = True
+            elif routed():
+                return self._db.engines[REPLICA]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _stick(response):
+    if enabled() and (g.get('db_wrote', False) or request.method not in SAFE_METHODS):
+        session[STICKY_KEY] = time.time() + current_app.config.get('REPLICA_STICKY_SECONDS', 10)
+    return response
+
+
+def init_app(app):
+    app.after_request(_stick)
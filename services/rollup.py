@@ -0,0 +1,144 @@
+# app/services/rollup.py
+"""
+Помесячная свёртка по парковкам (таблица monthly_rollup).
+
+На каждую (парковку, год, месяц) хранится: начислено (rent_size броней,
+действующих в месяце), оплачено и расходы (по датам платежей и расходов),
+занятые и свободные места·месяцы. Строки пересчитываются перед коммитом
+только для месяцев, которых коснулась транзакция (services/changes.py);
+`flask rollup rebuild` пересчитывает всё.
+"""
+from collections import defaultdict
+from datetime import date, datetime
+
+from sqlalchemy import select, delete, insert, update, func, case
+
+from models import MonthlyRollup, Parking, ParkingSpot, Booking, Payment, Expense
+from services import archive, changes
+from services.changes import month_bounds, month_range
+
+
+def refresh_month(conn, year, month, parking_ids=None):
+    """Пересчитать свёртку одного месяца (для всех или указанных парковок)"""
+    start, end = month_bounds(year, month)
+    # прошлые годы — вместе с архивом (services/archive.py)
+    B, P, E = archive.sources(start, Booking, Payment, Expense)
+
+    def scoped(query, column):
+        return query.where(column.in_(parking_ids)) if parking_ids is not None else query
+
+    spots = dict(conn.execute(scoped(
+        select(ParkingSpot.parking_id, func.count())
+        .group_by(ParkingSpot.parking_id), ParkingSpot.parking_id
+    )).all())
+
+    occupancy = {
+        parking_id: (occupied, charged)
+        for parking_id, occupied, charged in conn.execute(scoped(
+            select(ParkingSpot.parking_id,
+                   func.count(B.spot_id.distinct()),
+                   func.coalesce(func.sum(B.rent_size), 0))
+            .join(ParkingSpot, ParkingSpot.spot_id == B.spot_id)
+            .where(B.start_date <= end, B.end_date >= start)
+            .group_by(ParkingSpot.parking_id), ParkingSpot.parking_id
+        ))
+    }
+
+    paid = dict(conn.execute(scoped(
+        select(ParkingSpot.parking_id, func.sum(P.amount))
+        .join(B, B.booking_id == P.booking_id)
+        .join(ParkingSpot, ParkingSpot.spot_id == B.spot_id)
+        .where(P.payment_date >= start, P.payment_date <= end)
+        .group_by(ParkingSpot.parking_id), ParkingSpot.parking_id
+    )).all())
+
+    expenses = dict(conn.execute(scoped(
+        select(ParkingSpot.parking_id, func.sum(E.amount))
+        .join(B, B.booking_id == E.booking_id)
+        .join(ParkingSpot, ParkingSpot.spot_id == B.spot_id)
+        .where(E.expense_date >= start, E.expense_date <= end)
+        .group_by(ParkingSpot.parking_id), ParkingSpot.parking_id
+    )).all())
+
+    if parking_ids is None:
+        parking_ids = [p for (p,) in conn.execute(select(Parking.parking_id))]
+
+    conn.execute(
+        delete(MonthlyRollup)
+        .where(MonthlyRollup.year == year, MonthlyRollup.month == month,
+               MonthlyRollup.parking_id.in_(parking_ids))
+    )
+
+    now = datetime.utcnow()
+    rows = []
+    for parking_id in parking_ids:
+        occupied, charged = occupancy.get(parking_id, (0, 0))
+        rows.append({
+            "parking_id": parking_id, "year": year, "month": month,
+            "charged": charged,
+            "paid": paid.get(parking_id) or 0,
+            "expenses": expenses.get(parking_id) or 0,
+            "occupied_spot_months": occupied,
+            "free_spot_months": max(spots.get(parking_id, 0) - occupied, 0),
+            "refreshed_at": now,
+        })
+    if rows:
+        conn.execute(insert(MonthlyRollup), rows)
+
+
+def refresh(conn, keys):
+    """Пересчитать набор ключей {(parking_id, год, месяц)}"""
+    by_month = defaultdict(set)
+    for parking_id, year, month in keys:
+        if parking_id is not None:
+            by_month[(year, month)].add(parking_id)
+
+    for (year, month), parking_ids in sorted(by_month.items()):
+        refresh_month(conn, year, month, sorted(parking_ids))
+
+
+def rebuild(conn, first_year=None, last_year=None):
+    """Полный пересчёт свёртки за годы first_year..last_year (по умолчанию — весь период броней)"""
+    B = archive.source(Booking)
+    low, high = conn.execute(select(func.min(B.start_date), func.max(B.end_date))).one()
+    today = date.today()
+
+    first_year = first_year or (low or today).year
+    last_year = last_year or max((high or today).year, today.year)
+
+    months = list(month_range(date(first_year, 1, 1), date(last_year, 12, 1)))
+    for year, month in months:
+        refresh_month(conn, year, month)
+    return len(months)
+
+
+def refresh_free_spots(conn, parking_ids):
+    """
+    Свободные места·месяцы всех посчитанных месяцев парковок одним UPDATE
+    (после добавления или удаления мест — остальные колонки от числа мест не зависят)
+    """
+    spots = (
+        select(func.count()).select_from(ParkingSpot)
+        .where(ParkingSpot.parking_id == MonthlyRollup.parking_id)
+        .scalar_subquery()
+    )
+    free = spots - MonthlyRollup.occupied_spot_months
+    conn.execute(
+        update(MonthlyRollup)
+        .where(MonthlyRollup.parking_id.in_(parking_ids))
+        .values(free_spot_months=case((free > 0, free), else_=0), refreshed_at=datetime.utcnow())
+    )
+
+
+def _refresh_touched(session, change_set):
+    # добавили/удалили места — меняются свободные места·месяцы всех посчитанных месяцев
+    if change_set.parking_ids:
+        refresh_free_spots(session.connection(), sorted(change_set.parking_ids))
+
+    if change_set.months:
+        refresh(session.connection(), change_set.months)
+
+
+def init_app(app):
+    """Пересчёт затронутых месяцев перед каждым коммитом"""
+    changes.on_prepare(_refresh_touched)
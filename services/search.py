@@ -0,0 +1,42 @@
+# app/services/search.py
+"""
+Поиск арендаторов по ФИО и телефону.
+
+В Postgres условия ILIKE '%q%' обслуживаются триграммными GIN-индексами
+(pg_trgm) по client.name и client.phone_digits, результаты сортируются
+по similarity(). В SQLite те же условия работают перебором — этого
+достаточно для тестов и локального запуска.
+"""
+from models import db, Client, normalize_phone
+
+# больше этого числа подсказок поиск не отдаёт
+MAX_LIMIT = 50
+
+
+def _like_pattern(value):
+    escaped = value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+
+def client_filter(q):
+    """Условие WHERE для строки поиска q (ФИО или любые цифры телефона)"""
+    condition = Client.name.ilike(_like_pattern(q), escape='\\')
+
+    digits = normalize_phone(q)
+    if digits:
+        condition = condition | Client.phone_digits.like(_like_pattern(digits), escape='\\')
+
+    return condition
+
+
+def search_clients(q, limit=20):
+    """Арендаторы, подходящие под q: самые похожие первыми (в Postgres)"""
+    limit = max(1, min(limit, MAX_LIMIT))
+    query = Client.query
+
+    if q:
+        query = query.filter(client_filter(q))
+        if db.engine.dialect.name == 'postgresql':
+            query = query.order_by(db.func.similarity(Client.name, q).desc())
+
+    return query.order_by(Client.name, Client.client_id).limit(limit).all()
@@ -0,0 +1,171 @@
+# app/services/usercache.py
+"""
+Загрузка пользователя сессии без запроса к БД на каждый запрос.
+
+В сессии Flask-Login хранится «id:версия» (User.get_id; у сессий до
+миграции — только id, это версия 1). Версия растёт при смене пароля или
+роли, поэтому старые сессии перестают совпадать с БД и разлогиниваются. Загрузчик отдаёт SessionUser — неизменяемый снимок нужных
+страницам полей, а не ORM-объект.
+
+Порядок поиска:
+  1. подписанный payload в cookie-сессии (USER_SESSION_PAYLOAD) — без БД
+     и без кэша; старше USER_SESSION_PAYLOAD_TTL секунд перепроверяется;
+  2. кэш процесса (LRU + TTL) по ключу (id, версия);
+  3. БД; при несовпадении версии сессия недействительна.
+
+Коммит, изменивший пользователя, сразу сбрасывает его записи в кэше этого
+процесса; остальные воркеры увидят изменение не позже USER_CACHE_TTL
+(и USER_SESSION_PAYLOAD_TTL для payload).
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, session
+from flask_login import UserMixin
+from sqlalchemy import event
+
+from models import db, User
+
+PAYLOAD_KEY = '_user'
+
+
+class SessionUser(UserMixin):
+    def __init__(self, id, username, email, role, session_version):
+        self.id = id
+        self.username = username
+        self.email = email
+        self.role = role
+        self.session_version = session_version
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(user.id, user.username, user.email, user.role, user.session_version or 1)
+
+    def get_id(self):
+        return f"{self.id}:{self.session_version}"
+
+    def __repr__(self):
+        return f"<SessionUser {self.username}>"
+
+
+class UserCache:
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # (id, версия) → (SessionUser, срок)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            user, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return user
+
+    def set(self, key, user):
+        with self._lock:
+            self._data[key] = (user, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, user_ids):
+        with self._lock:
+            for key in [k for k in self._data if k[0] in user_ids]:
+                del self._data[key]
+
+
+user_cache = UserCache()
+
+
+def parse_id(token):
+    """
+    «id:версия» → (id, версия). Сессии до миграции хранят только id — для них
+    версия 1: её миграция проставила всем, и первая же смена пароля или роли
+    такие сессии завершает.
+    """
+    user_id, _, version = str(token).partition(':')
+    return int(user_id), (int(version) if version else 1)
+
+
+def remember(user):
+    """Положить снимок пользователя в подписанную сессию (если включено)"""
+    if current_app.config.get('USER_SESSION_PAYLOAD'):
+        snapshot = user if isinstance(user, SessionUser) else SessionUser.from_user(user)
+        session[PAYLOAD_KEY] = {
+            'id': snapshot.id, 'v': snapshot.session_version, 'username': snapshot.username,
+            'email': snapshot.email, 'role': snapshot.role, 'at': int(time.time()),
+        }
+
+
+def forget():
+    session.pop(PAYLOAD_KEY, None)
+
+
+def _from_payload(user_id, version):
+    payload = session.get(PAYLOAD_KEY)
+    if not payload or payload.get('id') != user_id or payload.get('v') != version:
+        return None
+    if time.time() - payload.get('at', 0) > current_app.config.get('USER_SESSION_PAYLOAD_TTL', 300):
+        return None
+    return SessionUser(user_id, payload['username'], payload['email'], payload['role'], version)
+
+
+def load(token):
+    """user_loader для Flask-Login"""
+    try:
+        user_id, version = parse_id(token)
+    except ValueError:
+        return None
+
+    if current_app.config.get('USER_SESSION_PAYLOAD'):
+        user = _from_payload(user_id, version)
+        if user is not None:
+            return user
+
+    user = user_cache.get((user_id, version))
+    if user is None:
+        row = db.session.get(User, user_id)
+        if row is None or (row.session_version or 1) != version:
+            return None
+        user = SessionUser.from_user(row)
+        user_cache.set((user_id, version), user)
+
+    if current_app.config.get('USER_SESSION_PAYLOAD'):
+        remember(user)  # обновляем срок payload
+    return user
+
+
+# --- сброс по коммиту ---
+
+def _collect(session, flush_context, instances):
+    touched = {obj.id for obj in list(session.dirty) + list(session.deleted)
+               if isinstance(obj, User) and obj.id is not None}
+    if touched:
+        session.info.setdefault('usercache_ids', set()).update(touched)
+
+
+def _after_commit(session):
+    touched = session.info.pop('usercache_ids', None)
+    if touched:
+        user_cache.invalidate(touched)
+
+
+def _after_rollback(session):
+    session.info.pop('usercache_ids', None)
+
+
+def init_app(app):
+    user_cache.ttl = app.config.get('USER_CACHE_TTL', 60)
+    user_cache.maxsize = app.config.get('USER_CACHE_SIZE', 1024)
+
+    if not event.contains(db.session, 'before_flush', _collect):
+        event.listen(db.session, 'before_flush', _collect)
+        event.listen(db.session, 'after_commit', _after_commit)
+        event.listen(db.session, 'after_rollback', _after_rollback)
@@ -0,0 +1,62 @@
+# app/tests/test_accruals.py
+"""Закрытие месяцев начислений: повторный запуск и --refresh"""
+from datetime import date
+
+from sqlalchemy import func, select
+
+YEAR = date.today().year - 2
+
+
+def _accrued(app, month):
+    from models import db, Accrual
+
+    with app.app_context():
+        rows, amount = db.session.execute(
+            select(func.count(), func.sum(Accrual.amount))
+            .where(Accrual.year == YEAR, Accrual.month == month)).one()
+        db.session.remove()
+    return rows, amount
+
+
+def _run(app, *args):
+    result = app.test_cli_runner().invoke(
+        args=['accruals', 'run', '--from', f'{YEAR}-03', '--to', f'{YEAR}-04', *args])
+    assert result.exit_code == 0, result.output
+    return result.output
+
+
+def test_close_months_is_idempotent(app):
+    from models import db
+    from services import accruals
+
+    with app.app_context():
+        first = accruals.close_months(db.engine, (YEAR, 3), (YEAR, 4), echo=lambda _: None)
+    assert set(first) == {(YEAR, 3), (YEAR, 4)}
+    assert first[YEAR, 3] == _accrued(app, 3)[0] > 0
+
+    output = _run(app)
+    assert f"03.{YEAR}: уже закрыт" in output
+    assert "Закрыто месяцев: 0, начислений: 0" in output
+    assert _accrued(app, 3)[0] == first[YEAR, 3]
+
+
+def test_refresh_recomputes_closed_month(app):
+    from models import db, Booking
+
+    _run(app)
+    rows, amount = _accrued(app, 3)
+
+    # исправление брони задним числом
+    with app.app_context():
+        booking = db.session.scalar(
+            select(Booking).where(Booking.start_date <= date(YEAR, 3, 31),
+                                  Booking.end_date >= date(YEAR, 3, 1)).limit(1))
+        booking.rent_size = (booking.rent_size or 0) + 1000
+        db.session.commit()
+        db.session.remove()
+
+    _run(app)
+    assert _accrued(app, 3) == (rows, amount)   # без --refresh месяц не пересчитан
+    output = _run(app, '--refresh')
+    assert f"03.{YEAR}: начислений {rows}" in output
+    assert _accrued(app, 3) == (rows, amount + 1000)
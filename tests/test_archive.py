@@ -0,0 +1,130 @@
+# app/tests/test_archive.py
+"""Закрытие года: перенос в архив, чтение через source() и записи в брони, идущие через закрытый год"""
+import io
+from datetime import date
+
+import pytest
+
+from sqlalchemy import func, select
+
+# самый старый год синтетической истории (~15 лет до текущего)
+YEAR = date.today().year - 12
+
+
+def _count(conn, table):
+    return conn.scalar(select(func.count()).select_from(table))
+
+
+@pytest.fixture(scope='module')
+def closed(app):
+    """Бронь через закрытый год, затем закрытие YEAR; возвращает ожидаемые и перенесённые числа"""
+    from models import db, Booking, Client, ParkingSpot, Payment, Expense
+    from services import archive
+
+    with app.app_context():
+        spot = ParkingSpot(parking_id=1, number='A-1')
+        free_spot = ParkingSpot(parking_id=1, number='A-2')
+        tenant = Client(name='Арендатор через год')
+        db.session.add_all([spot, free_spot, tenant])
+        db.session.flush()
+        booking = Booking(spot_id=spot.spot_id, client_id=tenant.client_id, rent_size=5000,
+                          start_date=date(YEAR, 6, 1), end_date=date(YEAR + 1, 6, 30), status="занято")
+        db.session.add(booking)
+        db.session.commit()
+
+        boundary = date(YEAR, 12, 31)
+        late = (select(Payment.booking_id).where(Payment.payment_date > boundary)
+                .union(select(Expense.booking_id).where(Expense.expense_date > boundary)))
+        expected = db.session.scalar(
+            select(func.count()).select_from(Booking)
+            .where(Booking.end_date <= boundary, Booking.booking_id.not_in(late)))
+        total = db.session.scalar(select(func.count()).select_from(Booking))
+
+        with db.engine.begin() as conn:
+            moved = archive.close_year(conn, YEAR)
+
+        ids = {'spot_id': spot.spot_id, 'free_spot_id': free_spot.spot_id,
+               'client_id': tenant.client_id, 'booking_id': booking.booking_id}
+        db.session.remove()
+    return {'expected': expected, 'total': total, 'moved': moved, **ids}
+
+
+def test_close_year_moves_finished_bookings(app, closed):
+    from models import db, Booking, booking_archive
+    from services import archive
+
+    assert closed['moved']['booking_archive'] == closed['expected'] > 0
+
+    with app.app_context():
+        with db.engine.connect() as conn:
+            hot = _count(conn, Booking.__table__)
+            archived = _count(conn, booking_archive)
+        assert hot + archived == closed['total']
+        assert archived == closed['expected']
+
+        # окно с прошлых лет читает рабочие и архивные строки вместе
+        B = archive.source(Booking, date(YEAR, 1, 1))
+        assert db.session.scalar(select(func.count(B.booking_id))) == closed['total']
+        assert archive.source(Booking, archive.hot_since()) is Booking
+
+        # бронь, идущая дальше закрытого года, осталась в рабочей таблице
+        assert db.session.get(Booking, closed['booking_id']) is not None
+        assert archive.closed_through() == YEAR
+        db.session.remove()
+
+
+def test_booking_spanning_closed_year_can_be_extended_and_paid(app, client, closed):
+    from models import db, Booking, Payment
+
+    response = client.post(f"/workspace/client/{closed['client_id']}", data={
+        'spot_id': closed['spot_id'], 'existing_client_id': closed['client_id'],
+        'start_date': f'{YEAR}-06-01', 'end_date': f'{YEAR + 2}-06-30', 'rent_size': '5000',
+        'payment_amount': '5000', 'payment_date': f'{YEAR + 1}-02-01',
+    })
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith('/workspace/')
+
+    with app.app_context():
+        booking = db.session.get(Booking, closed['booking_id'])
+        assert booking.end_date == date(YEAR + 2, 6, 30)
+        assert db.session.scalar(
+            select(func.sum(Payment.amount)).where(Payment.booking_id == booking.booking_id)) == 5000
+        db.session.remove()
+
+
+@pytest.mark.parametrize('start, end', [
+    (f'{YEAR}-01-01', f'{YEAR + 2}-06-30'),   # начало переносится в закрытый год
+    (f'{YEAR}-06-01', f'{YEAR}-12-31'),       # конец в закрытом году
+])
+def test_closed_year_rejects_moving_dates_into_it(app, client, closed, start, end):
+    from models import db, Booking
+
+    with app.app_context():
+        before = db.session.get(Booking, closed['booking_id']).end_date
+        db.session.remove()
+
+    response = client.post(f"/workspace/client/{closed['client_id']}", data={
+        'spot_id': closed['spot_id'], 'existing_client_id': closed['client_id'],
+        'start_date': start, 'end_date': end, 'rent_size': '5000',
+    })
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith(f"/workspace/client/{closed['client_id']}")
+
+    with app.app_context():
+        assert db.session.get(Booking, closed['booking_id']).end_date == before
+        db.session.remove()
+
+
+def test_import_uses_the_same_closed_year_rule(app, closed):
+    from services import importer
+
+    csv_text = (
+        "spot_id,client_id,start_date,end_date,rent_size\n"
+        f"{closed['free_spot_id']},{closed['client_id']},{YEAR}-03-01,{YEAR}-05-31,4000\n"
+        f"{closed['free_spot_id']},{closed['client_id']},{YEAR}-06-01,{YEAR + 1}-05-31,4000\n"
+    )
+    with app.app_context():
+        report = importer.run('bookings', io.StringIO(csv_text))
+
+    assert report.inserted == 1
+    assert [line for line, _ in report.errors] == [2]
@@ -0,0 +1,21 @@
+# app/tests/test_availability.py
+"""Свободные места с точностью до дня: фильтр по месту в запросе"""
+from datetime import date
+
+
+def test_spot_filter_in_query(app, client):
+    from models import db, ParkingSpot
+    from services.occupancy import load_spots
+
+    with app.app_context():
+        spot = db.session.scalar(db.select(ParkingSpot).where(ParkingSpot.parking_id == 1).limit(1))
+        spot_id, total = spot.spot_id, len(load_spots(1))
+        assert [s.spot_id for s in load_spots(1, spot_id)] == [spot_id]
+        db.session.remove()
+    assert total > 1
+
+    year = date.today().year
+    response = client.get(f'/workspace/availability?start={year}-03-01&end={year}-03-10'
+                          f'&parking_id=1&spot_id={spot_id}')
+    assert response.status_code == 200
+    assert [s['spot_id'] for s in response.json['free'] + response.json['busy']] == [spot_id]
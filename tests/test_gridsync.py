@@ -0,0 +1,87 @@
+# app/tests/test_gridsync.py
+"""Версии шахматки: одна на коммит из счётчика grid_version, ETag и дельта grid.json"""
+from datetime import date, datetime
+
+
+def test_commit_gets_one_version_from_counter(app):
+    from models import db, Booking, GridChange, GridVersion
+    from services import gridsync
+
+    with app.app_context():
+        before = db.session.get(GridVersion, 1).version
+        booking = db.session.scalar(db.select(Booking).order_by(Booking.booking_id.desc()).limit(1))
+        year = booking.start_date.year
+
+        booking.rent_size += 100
+        db.session.commit()
+
+        versions = set(db.session.scalars(
+            db.select(GridChange.version).where(GridChange.version > before)))
+        assert versions == {before + 1}
+        assert db.session.get(GridVersion, 1).version == before + 1
+        assert gridsync.current_version(None, year) == before + 1
+        assert gridsync.changed_since(None, year, before + 1) == set()
+        db.session.remove()
+
+
+def _booking_in(app, parking_id, year):
+    from models import db, Booking, ParkingSpot
+
+    with app.app_context():
+        booking = db.session.scalar(
+            db.select(Booking).join(ParkingSpot, ParkingSpot.spot_id == Booking.spot_id)
+            .where(ParkingSpot.parking_id == parking_id,
+                   Booking.start_date <= date(year, 6, 1), Booking.end_date >= date(year, 6, 1))
+            .limit(1))
+        booking.rent_size += 100
+        db.session.commit()
+        spot_id = booking.spot_id
+        db.session.remove()
+    return spot_id
+
+
+def test_grid_json_etag_and_delta(app, client):
+    year = date.today().year
+    url = f'/workspace/grid.json?parking_id=1&year={year}'
+
+    first = client.get(url)
+    assert first.status_code == 200 and first.json['full']
+    etag, version = first.headers['ETag'], first.json['version']
+
+    assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+
+    spot_id = _booking_in(app, 1, year)
+
+    changed = client.get(f'{url}&since={version}', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+    assert changed.json['version'] > version
+    assert not changed.json['full']
+    assert (spot_id, 6) in zip(changed.json['changed']['spot_id'], changed.json['changed']['month'])
+
+
+def test_pruned_scope_keeps_its_version(app, client):
+    from models import db, GridChange
+    from services import gridsync
+
+    year = date.today().year
+    url = f'/workspace/grid.json?parking_id=1&year={year}'
+    _booking_in(app, 1, year)
+    before = client.get(url)
+
+    with app.app_context():
+        # вся история сетки устарела, затем коммит в другой год
+        db.session.execute(db.update(GridChange).values(changed_at=datetime(2000, 1, 1)))
+        db.session.commit()
+        db.session.remove()
+    _booking_in(app, 1, year - 2)
+    with app.app_context(), db.engine.begin() as conn:
+        assert gridsync.prune(conn, keep_days=7) > 0
+
+    # строк этой сетки в журнале не осталось, но версия не пошла назад: ETag прежний
+    after = client.get(url, headers={'If-None-Match': before.headers['ETag']})
+    assert after.status_code == 304
+
+    delta = client.get(f"{url}&since={before.json['version']}")
+    assert delta.json['version'] == before.json['version']
+    assert not delta.json['full'] and delta.json['changed']['spot_id'] == []
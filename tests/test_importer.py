@@ -0,0 +1,64 @@
+# app/tests/test_importer.py
+"""Импорт броней: пересечения внутри порции и с базой, пустой файл"""
+import io
+from datetime import date
+
+import pytest
+
+# открытый год без синтетических броней на новом месте
+YEAR = date.today().year + 3
+
+
+@pytest.fixture(scope='module')
+def spot(app):
+    """Новое место с одной бронью на март YEAR; возвращает (spot_id, client_id)"""
+    from models import db, Booking, Client, ParkingSpot
+
+    with app.app_context():
+        row = ParkingSpot(parking_id=1, number='I-1')
+        tenant = Client(name='Арендатор импорта')
+        db.session.add_all([row, tenant])
+        db.session.flush()
+        db.session.add(Booking(spot_id=row.spot_id, client_id=tenant.client_id, rent_size=3000,
+                               start_date=date(YEAR, 3, 1), end_date=date(YEAR, 3, 31), status="занято"))
+        db.session.commit()
+        ids = row.spot_id, tenant.client_id
+        db.session.remove()
+    return ids
+
+
+@pytest.mark.parametrize('chunk_size', [1000, 1])  # одна порция и порция на строку
+def test_overlapping_bookings_rejected(app, spot, chunk_size):
+    from models import db, Booking
+    from services import importer
+
+    spot_id, client_id = spot
+    month = 4 if chunk_size == 1000 else 6
+    csv_text = (
+        "spot_id;client_id;start_date;end_date;rent_size\n"
+        f"{spot_id};{client_id};{YEAR}-03-20;{YEAR}-{month:02}-10;3000\n"    # пересекает бронь в базе
+        f"{spot_id};{client_id};01.{month:02}.{YEAR};30.{month:02}.{YEAR};3000\n"
+        f"{spot_id};{client_id};{YEAR}-{month:02}-15;{YEAR}-{month + 1:02}-15;3000\n"  # пересекает строку 3
+    )
+    count = db.select(db.func.count()).select_from(Booking).where(Booking.spot_id == spot_id)
+    with app.app_context():
+        before = db.session.scalar(count)
+        report = importer.run('bookings', io.StringIO(csv_text), chunk_size=chunk_size)
+        after = db.session.scalar(count)
+        db.session.remove()
+
+    assert report.rows == 3
+    assert report.inserted == 1
+    assert [line for line, _ in report.errors] == [2, 4]
+    assert all('занято' in message for _, message in report.errors)
+    assert after == before + 1
+
+
+def test_empty_file(app):
+    from services import importer
+
+    with app.app_context():
+        report = importer.run('bookings', io.StringIO(''))
+
+    assert report.rows == report.inserted == 0
+    assert report.errors == [(1, "пустой файл — нет строки заголовка")]
@@ -0,0 +1,52 @@
+# app/tests/test_intervals.py
+"""Набор занятых отрезков: слияние, пересечение и поиск свободного окна"""
+from datetime import date, timedelta
+
+import pytest
+
+from services.intervals import IntervalSet
+
+
+def test_init_merges_overlapping():
+    busy = IntervalSet([(10, 20), (1, 5), (15, 25), (5, 7)])
+    assert list(busy) == [(1, 7), (10, 25)]
+
+
+@pytest.mark.parametrize('start, end, expected', [
+    (8, 9, [(1, 5), (8, 9), (10, 20)]),        # в промежутке, касаний нет
+    (4, 12, [(1, 20)]),                        # сливает два отрезка
+    (0, 30, [(0, 30)]),                        # накрывает всё
+    (20, 22, [(1, 5), (10, 22)]),              # общий конец
+    (21, 22, [(1, 5), (10, 20), (21, 22)]),    # вплотную — не пересекаются
+    (30, 31, [(1, 5), (10, 20), (30, 31)]),
+])
+def test_add_merges(start, end, expected):
+    busy = IntervalSet([(1, 5), (10, 20)])
+    busy.add(start, end)
+    assert list(busy) == expected
+
+
+def test_overlap():
+    busy = IntervalSet([(1, 5), (10, 20)])
+    assert busy.overlap(6, 9) is None
+    assert busy.overlap(5, 5) == (1, 5)
+    assert busy.overlap(0, 10) == (10, 20)
+    assert busy.overlap(21, 30) is None
+    assert IntervalSet().overlap(1, 2) is None
+
+
+def test_next_free_skips_short_gaps():
+    busy = IntervalSet([(1, 5), (8, 10), (13, 20)])
+    assert busy.next_free(0, 0, 1) == 0            # свободно сразу
+    assert busy.next_free(3, 1, 1) == 6            # 6-7 умещается
+    assert busy.next_free(3, 2, 1) == 21           # 6-7 и 11-12 коротки
+    assert busy.next_free(25, 100, 1) == 25
+    assert IntervalSet().next_free(7, 10, 1) == 7
+
+
+def test_next_free_with_dates():
+    day = timedelta(days=1)
+    busy = IntervalSet([(date(2024, 3, 1), date(2024, 3, 10)),
+                        (date(2024, 3, 14), date(2024, 3, 31))])
+    assert busy.next_free(date(2024, 3, 5), 2 * day, day) == date(2024, 3, 11)
+    assert busy.next_free(date(2024, 3, 5), 3 * day, day) == date(2024, 4, 1)
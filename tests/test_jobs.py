@@ -0,0 +1,70 @@
+# app/tests/test_jobs.py
+"""Фоновые отчёты: версия данных по парковке и периоду, повторное использование готового задания"""
+from datetime import date, datetime
+
+YEAR = date.today().year - 3
+
+
+def _touch_booking(app, parking_id, year):
+    """Изменить бронь парковки, действующую в июне year"""
+    from models import db, Booking, ParkingSpot
+
+    with app.app_context():
+        booking = db.session.scalar(
+            db.select(Booking).join(ParkingSpot, ParkingSpot.spot_id == Booking.spot_id)
+            .where(ParkingSpot.parking_id == parking_id,
+                   Booking.start_date <= date(year, 6, 1), Booking.end_date >= date(year, 6, 1))
+            .limit(1))
+        booking.rent_size += 100
+        db.session.commit()
+        db.session.remove()
+
+
+def _version(app, parking_id):
+    from models import db
+    from services import jobs
+
+    with app.app_context():
+        version = jobs.data_version(start_date=date(YEAR, 1, 1), end_date=date(YEAR, 12, 31),
+                                    parking_id=parking_id)
+        everything = jobs.data_version()
+        db.session.remove()
+    return version, everything
+
+
+def test_data_version_is_scoped(app):
+    scoped, everything = _version(app, 1)
+    other_parking, _ = _version(app, 2)
+
+    _touch_booking(app, 1, date.today().year)    # другой год той же парковки
+    after, everything_after = _version(app, 1)
+    assert after == scoped
+    assert everything_after != everything
+
+    _touch_booking(app, 1, YEAR)                 # в периоде, другая парковка не задета
+    assert _version(app, 1)[0] != scoped
+    assert _version(app, 2)[0] == other_parking
+
+
+def test_finished_job_is_reused(app):
+    from models import db, ReportJob
+    from services import jobs
+
+    start, end = datetime(YEAR, 1, 1), datetime(YEAR, 12, 31)
+    with app.app_context():
+        version = jobs.data_version(start_date=start.date(), end_date=end.date(), parking_id=1)
+        done = ReportJob(report_type='finance', start_date=start.date(), end_date=end.date(),
+                         parking_id=1, data_version=version, status='done', progress=100)
+        db.session.add(done)
+        db.session.commit()
+        job_id = done.job_id
+
+        # пул не нужен: готовое задание находится до постановки нового
+        assert jobs.submit('finance', start, end, 1).job_id == job_id
+        db.session.remove()
+
+    _touch_booking(app, 1, YEAR)
+    with app.app_context():
+        version = jobs.data_version(start_date=start.date(), end_date=end.date(), parking_id=1)
+        assert jobs._find('finance', start.date(), end.date(), 1, version, datetime.min) is None
+        db.session.remove()
@@ -0,0 +1,32 @@
+# app/tests/test_ratelimit.py
+"""Ограничение попыток входа: пополнение ведра и 429 с Retry-After"""
+from services.ratelimit import TokenBucket
+
+
+def test_bucket_refills_at_rate():
+    bucket = TokenBucket(rate=0.5, burst=2)  # жетон раз в 2 с
+
+    assert bucket.take('ip', now=0) == 0
+    assert bucket.take('ip', now=0) == 0
+    assert bucket.take('ip', now=0) == 2.0
+    assert bucket.take('other', now=0) == 0    # ключи независимы
+
+    assert bucket.take('ip', now=1) == 1.0     # полжетона — ждать ещё секунду
+    assert bucket.take('ip', now=2) == 0
+    assert bucket.take('ip', now=100) == 0     # запас не больше burst
+    assert bucket.take('ip', now=100) == 0
+    assert bucket.take('ip', now=100) > 0
+
+
+def test_login_429_with_retry_after(app):
+    client = app.test_client()
+    attempt = dict(data={'username': 'ratelimit-user', 'password': 'x'},
+                   environ_base={'REMOTE_ADDR': '203.0.113.7'})
+
+    statuses = [client.post('/auth/login', **attempt).status_code
+                for _ in range(app.config['LOGIN_BURST'])]
+    assert statuses == [200] * app.config['LOGIN_BURST']
+
+    response = client.post('/auth/login', **attempt)
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
@@ -0,0 +1,46 @@
+# app/tests/test_report_queries.py
+"""Число запросов к БД на каждый отчёт не превышает QUERY_BUDGETS"""
+from datetime import date, datetime, time
+
+import pytest
+
+from services.querycount import query_budget
+
+YEAR = date.today().year
+
+
+@pytest.fixture(scope='module')
+def closed_month(app):
+    # начисления за январь — чтобы отчёт accruals строился не по пустой таблице
+    from models import db
+    from services import accruals
+
+    with app.app_context(), db.engine.begin() as conn:
+        accruals.close_month(conn, YEAR - 1, 1)
+
+
+def _budgets():
+    from routes import reports
+    return sorted(reports.QUERY_BUDGETS.items())
+
+
+@pytest.mark.parametrize('report_type, limit', _budgets())
+@pytest.mark.parametrize('start, end, parking_id', [
+    (date(YEAR - 1, 1, 1), date(YEAR - 1, 12, 31), None),
+    (date(YEAR - 5, 1, 1), date(YEAR, 12, 31), 1),
+])
+def test_report_within_query_budget(app, closed_month, report_type, limit, start, end, parking_id):
+    from models import db
+    from routes import reports
+    from services import analytics
+
+    if report_type == 'analytics' and not analytics.available():
+        pytest.skip("numpy не установлен")
+
+    with app.app_context():
+        with query_budget(db.engine, limit, label=report_type):
+            data = reports.BUILDERS[report_type](
+                datetime.combine(start, time()), datetime.combine(end, time()), parking_id)
+        db.session.remove()
+
+    assert data['rows'], f"{report_type}: пустой отчёт — бюджет проверен не на данных"
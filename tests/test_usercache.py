@@ -0,0 +1,64 @@
+# app/tests/test_usercache.py
+"""Загрузчик пользователя сессии: кэш по (id, версия) и завершение сессий при смене версии"""
+import pytest
+
+from services.querycount import count_queries
+
+
+@pytest.fixture
+def user(app):
+    from models import db, User
+
+    with app.app_context():
+        row = User(username='cache-user', email='cache-user@example.com', password='x', role='user')
+        db.session.add(row)
+        db.session.commit()
+        user_id = row.id
+        db.session.remove()
+
+    yield user_id
+
+    with app.app_context():
+        db.session.delete(db.session.get(User, user_id))
+        db.session.commit()
+        db.session.remove()
+
+
+def _bump(app, user_id):
+    from models import db, User
+
+    with app.app_context():
+        db.session.get(User, user_id).role = 'admin'
+        db.session.commit()
+        db.session.remove()
+
+
+@pytest.mark.parametrize('token', ['{id}:1', '{id}'])  # «id» — сессия до миграции
+def test_matching_version_served_from_cache(app, user, token):
+    from models import db
+    from services import usercache
+
+    token = token.format(id=user)
+    with app.test_request_context():
+        first = usercache.load(token)
+        with count_queries(db.engine) as counter:
+            second = usercache.load(token)
+
+    assert first.id == second.id == user
+    assert first.session_version == 1
+    assert counter.count == 0
+
+
+@pytest.mark.parametrize('token', ['{id}:1', '{id}'])
+def test_bumped_version_rejects_old_session(app, user, token):
+    from services import usercache
+
+    token = token.format(id=user)
+    with app.test_request_context():
+        assert usercache.load(token) is not None
+
+    _bump(app, user)
+
+    with app.test_request_context():
+        assert usercache.load(token) is None
+        assert usercache.load(f'{user}:2').role == 'admin'
@@ -0,0 +1,9 @@
+# app/wsgi.py
+"""
+Точка входа для production-сервера:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+from app import create_app
+
+app = create_app()